@@ -1,18 +1,42 @@
 import sys
-import dan.logging
-import dan.core.include
-from dan.core import asyncio
-from dan.core.include import include, requires
-from dan.core.generator import generator
-from dan.core.target import Target
-from dan.pkgconfig.package import find_package
+import importlib
 
 
-self : dan.core.include.MakeFile
+# makefiles API, imported on first use (keeps the cli startup light)
+_exports = {
+    'include': 'dan.core.include',
+    'requires': 'dan.core.include',
+    'generator': 'dan.core.generator',
+    'Target': 'dan.core.target',
+    'find_package': 'dan.pkgconfig.package',
+}
+_modules = {
+    'asyncio': 'dan.core.asyncio',
+}
+
+
+self : 'dan.core.include.MakeFile'
 
 class __LazySelf(sys.__class__):
     @property
     def self(__):
-        return dan.core.include.context.current
+        return importlib.import_module('dan.core.include').context.current
+
+    def __getattr__(__, name: str):
+        if name in _modules:
+            value = importlib.import_module(_modules[name])
+        elif name in _exports:
+            value = getattr(importlib.import_module(_exports[name]), name)
+        elif name == '__version__':
+            from importlib.metadata import version, PackageNotFoundError
+            try:
+                value = version('dan-build')
+            except PackageNotFoundError:
+                # not installed (source tree)
+                value = None
+        else:
+            raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+        setattr(__, name, value)
+        return value
 
 sys.modules[__name__].__class__ = __LazySelf
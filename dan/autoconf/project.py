@@ -7,7 +7,6 @@ from dan.core.utils import chunks
 from dan.cxx import Toolchain
 
 from pathlib import Path
-import os
 import re
 
 class Project(Target, internal=True):
@@ -69,24 +68,11 @@ class Project(Target, internal=True):
                 if obj in builds:
                     obj_builds.create_task(builds[obj])
 
-        command = f'{self.toolchain.ar} {ar_arg} {lib} {" ".join(objects)}'
-        windows_command_line_limitation = 8191
-        if os.name == 'nt' and len(command) >= windows_command_line_limitation:
-            # workaround command-line size limitation
-            objects_dir = self.build_path / f'{lib}_objects'
-            if objects_dir.exists():
-                await aiofiles.rmtree(objects_dir)
-            objects_dir.mkdir()
-            for obj in objects:
-                obj_path = Path(self.build_path / obj)
-                dest = objects_dir / obj_path.relative_to(objects_dir.parent).as_posix().replace('/', '_')
-                if not dest.exists():
-                    obj_path.rename(dest)
-                
-            command = f'{self.toolchain.ar} {ar_arg} {lib} {(objects_dir.relative_to(self.build_path) / "*.o").as_posix()}'
-                
         self.info('creating static library %s', lib)
-        await async_run(command, logger=self, cwd=self.build_path, env=env)
+        # long objects lists are passed through a response file (command-line size limitation)
+        command = [self.toolchain.ar, *ar_arg.split(), lib, *objects]
+        async with self.toolchain.response_file('ar', self.build_path / lib, command) as command:
+            await async_run(command, logger=self, cwd=self.build_path, env=env)
         self.info('static library %s created', lib)
 
     async def do_ld(self, output, lib_paths, objects, libs, builds: dict[str, asyncio.Task], env):
@@ -3,6 +3,7 @@ from enum import Enum
 import types as typs
 from click import *
 
+import importlib
 import inspect
 import asyncio
 from dan.core.terminal import TerminalMode
@@ -98,14 +99,24 @@ class OptionsParamType(ParamType):
 
 
 class TargetParamType(ParamType):
-    def __init__(self, target_types=None) -> None:
-        from dan.core.target import Target
-        if target_types is None:
-            self.target_types = (Target)
-        else:
-            self.target_types = tuple(target_types)
+    def __init__(self, target_types: list[type | str] = None) -> None:
+        """target_types: accepted target classes, or their qualified names (imported on completion)"""
+        self._target_types = target_types
         super().__init__()
 
+    @property
+    def target_types(self) -> tuple[type]:
+        if self._target_types is None:
+            from dan.core.target import Target
+            return (Target,)
+        types = list()
+        for target_type in self._target_types:
+            if isinstance(target_type, str):
+                module, _, name = target_type.rpartition('.')
+                target_type = getattr(importlib.import_module(module), name)
+            types.append(target_type)
+        return tuple(types)
+
     def shell_complete(self, ctx: AsyncContext, param, incomplete):
         from click.shell_completion import CompletionItem
         from dan.make import Make
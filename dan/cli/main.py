@@ -1,5 +1,6 @@
 import os
 import sys
+import json
 import contextlib
 
 from dan import logging
@@ -10,14 +11,12 @@ from dan.core.terminal import TerminalMode, set_mode as set_terminal_mode, manag
 
 from dan.cli import click
 
-from dan.core import diagnostics, asyncio
+from dan.core import asyncio, trace
 from dan.core.cache import Cache
-from dan.core.settings import Settings
-from dan.cxx.targets import Executable
+from dan.core.settings import InstallMode, Settings
 
-
-from dan.make import InstallMode, Make
-from dan.cli.vscode import Code
+# NOTE: the project machinery (dan.make, toolchains, targets...) is imported by the commands
+#       using it, so that the cli starts fast (help, completion...)
 
 
 _minimal_options = [
@@ -56,6 +55,12 @@ class CommandsContext:
         self._make_kwds = {**kwds}
         self._make = None
 
+    def reset(self):
+        """Drop the loaded project (it will be loaded again on next use)"""
+        self._make = None
+        # already set up
+        self._make_kwds.pop('terminal_mode', None)
+
     def update(self, *args, **kwds):
         if len(args):
             self._make_args.extend(*args)
@@ -73,6 +78,7 @@ class CommandsContext:
         if quiet:
             self._make_kwds['verbose'] = -1
         if self._make is None:
+            from dan.make import Make
             self._make = Make(*self._make_args, **self._make_kwds)
             if not no_init:
                 await self._make.initialize()
@@ -86,6 +92,9 @@ pass_context = click.make_pass_decorator(CommandsContext)
 
 @pass_context
 def show_diags(ctx: CommandsContext):
+    if ctx._make is None:
+        return
+    from dan.core import diagnostics
     if diagnostics.enabled:
         diags = ctx._make.diagnostics
         if diags:
@@ -169,14 +178,31 @@ async def configure(ctx: CommandsContext, toolchain: str, settings: tuple[str],
 @common_opts
 @click.option('--force', '-f', is_flag=True,
               help='Clean before building')
+@click.option('--trace', 'trace_path', type=click.Path(dir_okay=False, resolve_path=True, path_type=Path),
+              help='Write the build timeline to TRACE_PATH (trace-event JSON, see chrome://tracing or Perfetto)')
+@click.option('--watch', '-w', is_flag=True,
+              help='Keep running and rebuild affected targets when their sources change')
 @click.argument('TARGETS', nargs=-1, type=click.TargetParamType())
 @pass_context
-async def build(ctx: CommandsContext, force=False, **kwds):
+async def build(ctx: CommandsContext, force=False, trace_path: Path = None, watch=False, **kwds):
     """Build targets"""
-    async with ctx(**kwds) as make:
-        if force:
-            await make.clean()
-        await make.build()
+    if trace_path is not None:
+        trace.start()
+    try:
+        async with ctx(no_init=True, **kwds) as make:
+            if force:
+                await make.clean()
+            if not watch:
+                await make.build()
+            else:
+                reload = await make.watch()
+        while watch and reload:
+            ctx.reset()
+            async with ctx(no_init=True) as make:
+                reload = await make.watch()
+    finally:
+        if trace_path is not None:
+            trace.stop(trace_path)
 
 @cli.command()
 @common_opts
@@ -312,18 +338,88 @@ async def options(ctx: CommandsContext, **kwargs):
                 current = f', current: {o.value}'
             click.echo(f'{o.fullname}: {o.help} (type: {o.type.__name__}, default: {o.default}{current})')
 
+@ls.command('pch-candidates')
+@common_opts
+@click.option('-n', '--limit', type=int, default=20, help='Number of headers shown per target')
+@click.option('-r', '--min-ratio', type=float, default=0.5,
+              help='Minimum ratio of the objects including a proposed header')
+@click.argument('TARGETS', nargs=-1, type=click.TargetParamType(target_types=['dan.cxx.targets.CXXObjectsTarget']))
+@pass_context
+async def pch_candidates(ctx: CommandsContext, limit: int, min_ratio: float, **kwargs):
+    """Rank the headers included by the targets' objects (from a previous build) to propose precompiled headers"""
+    from dan.cxx.pch import header_usage
+    from dan.cxx.targets import CXXObjectsTarget
+    kwargs['quiet'] = True
+    async with ctx(**kwargs) as make:
+        for target in make.targets:
+            if not isinstance(target, CXXObjectsTarget) or not target.sources:
+                continue
+            usage = await header_usage(target)
+            if usage.objects == 0:
+                click.echo(f'{target.fullname}: no dependency files (not built)')
+                continue
+            click.echo(f'{target.fullname} ({usage.objects} objects):')
+            for name, count in usage.ranking()[:limit]:
+                click.echo(f'  {count * 100 / usage.objects:5.1f}% {count:5} {name}')
+            candidates = usage.candidates(min_ratio)
+            if candidates:
+                click.echo(f'  proposed: precompiled_headers = {candidates!r}')
+
+
+@cli.group()
+def cache():
+    """Manage the actions cache"""
+
+
+@cache.command('stats')
+@common_opts
+@pass_context
+async def cache_stats(ctx: CommandsContext, **kwargs):
+    """Show the actions cache statistics"""
+    from dan.core import actioncache
+    kwargs['quiet'] = True
+    async with ctx(no_init=True, **kwargs) as make:
+        settings = make.settings.action_cache
+        store = actioncache.open_store(settings)
+        stats = store.stats
+        lookups = stats.hits + stats.misses
+        ratio = f' ({stats.hits * 100 / lookups:.1f}%)' if lookups else ''
+        click.echo(f'path: {store.root}{"" if settings.enabled else " (disabled)"}')
+        click.echo(f'size: {stats.size >> 20} MiB / {store.max_size >> 20} MiB')
+        click.echo(f'hits: {stats.hits}{ratio}')
+        click.echo(f'misses: {stats.misses}')
+        click.echo(f'stored: {stats.stores}')
+        click.echo(f'evicted: {stats.evictions}')
+        if settings.remote:
+            click.echo(f'remote: {settings.remote}{" (read-only)" if settings.remote_read_only else ""}')
+            click.echo(f'remote hits: {stats.remote_hits}')
+            click.echo(f'uploads: {stats.uploads}')
+
+
+@cache.command('clear')
+@common_opts
+@pass_context
+async def cache_clear(ctx: CommandsContext, **kwargs):
+    """Remove all the actions cache entries"""
+    from dan.core import actioncache
+    kwargs['quiet'] = True
+    async with ctx(no_init=True, **kwargs) as make:
+        await actioncache.open_store(make.settings.action_cache).clear()
+
+
 @ls.command()
 def toolchains(**kwargs):
     """List toolchains"""
+    from dan.cxx.detect import get_toolchains
     kwargs['quiet'] = True
-    for name, _ in Make.toolchains()['toolchains'].items():
+    for name, _ in get_toolchains()['toolchains'].items():
         click.echo(name)
 
 
 @ls.command()
 @common_opts
 @click.option('-n', '--not-found', help='Show not-found dependencies', is_flag=True)
-@click.argument('TARGET', type=click.TargetParamType(target_types=[Executable]))
+@click.argument('TARGET', type=click.TargetParamType(target_types=['dan.cxx.targets.Executable']))
 @pass_context
 async def runtime_dependencies(ctx: CommandsContext, not_found, target, **kwargs):
     """Inspect stuff"""
@@ -442,33 +538,10 @@ def code():
 @pass_context
 async def get_targets(ctx: CommandsContext, **kwargs):
     kwargs.update({'quiet': True, 'diags': True, 'no_status': True})
-    # with benchmark('get-targets') as bench:
-        # bench.begin('make')
     async with ctx(**kwargs) as make:
-            # bench.end()
-        out = []
-        targets = make.context.root.all_targets
-            # with bench('load-dependencies'):
-        async with asyncio.TaskGroup() as g:
-            for target in targets:
-                g.create_task(target.load_dependencies())
-            # with bench('gen-output'):
-        for target in targets:
-            # with bench(f'gen-output-{target.name}'):
-                out.append({
-                    'name': target.name,
-                    'fullname': target.fullname,
-                    'buildPath': str(target.build_path),
-                    'srcPath': str(target.source_path),
-                    'output': str(target.output),
-                    'executable': isinstance(target, Executable),
-                    'type': type(target).__name__,
-                    'env': target.env if isinstance(target, Executable) else None,
-                })
-            # with bench('json-dump'):
-        import json
-        click.echo(json.dumps(out))
-    # report_all()
+        from dan.cli.vscode import Code
+        code = Code(make)
+        click.echo(json.dumps(await code.get_targets()))
 
 @code.command()
 @common_opts
@@ -477,14 +550,9 @@ async def get_targets(ctx: CommandsContext, **kwargs):
 async def get_tests(ctx: CommandsContext, **kwargs):
     kwargs.update({'quiet': True, 'diags': True, 'no_status': True})
     async with ctx(**kwargs) as make:
-        import json
-        out = list()
-        for t in make.context.root.all_tests:
-            out.append(t.fullname)
-            if len(t) > 1:
-                for c in t.cases:
-                    out.append(f'{t.fullname}:{c.name}')
-        click.echo(json.dumps(out))
+        from dan.cli.vscode import Code
+        code = Code(make)
+        click.echo(json.dumps(code.get_tests()))
 
 
 @code.command()
@@ -495,14 +563,15 @@ async def get_tests(ctx: CommandsContext, **kwargs):
 async def get_test_suites(ctx: CommandsContext, pretty, **kwargs):
     kwargs.update({'quiet': True, 'diags': True, 'no_status': True})
     async with ctx(**kwargs) as make:
+        from dan.cli.vscode import Code
         code = Code(make)
-        click.echo(code.get_test_suites(pretty))
+        click.echo(json.dumps(code.get_test_suites(), indent=2 if pretty else None))
 
 
 @code.command()
 def get_toolchains(**kwargs):
-    import json
-    click.echo(json.dumps(list(Make.toolchains()['toolchains'].keys())))
+    from dan.cxx.detect import get_toolchains
+    click.echo(json.dumps(list(get_toolchains()['toolchains'].keys())))
 
 
 @code.command()
@@ -527,8 +596,9 @@ async def build(ctx: CommandsContext, force=False, **kwargs):
 async def get_source_configuration(ctx: CommandsContext, sources, **kwargs):
     kwargs.update({'quiet': True, 'diags': True, 'no_status': True})
     async with ctx(**kwargs) as make:
+        from dan.cli.vscode import Code
         code = Code(make)
-        click.echo(await code.get_sources_configuration(sources))
+        click.echo(json.dumps(await code.get_sources_configuration(sources)))
 
 
 @code.command()
@@ -537,8 +607,24 @@ async def get_source_configuration(ctx: CommandsContext, sources, **kwargs):
 async def get_workspace_browse_configuration(ctx: CommandsContext, **kwargs):
     kwargs.update({'quiet': True, 'diags': True, 'no_status': True})
     async with ctx(**kwargs) as make:
+        from dan.cli.vscode import Code
         code = Code(make)
-        click.echo(await code.get_workspace_browse_configuration())
+        click.echo(json.dumps(await code.get_workspace_browse_configuration()))
+
+@code.command()
+@common_opts
+@click.option('--socket', 'socket_path', type=click.Path(resolve_path=True, path_type=Path),
+              help='Path of the server socket (default: <build_path>/dan.sock).')
+@pass_context
+async def serve(ctx: CommandsContext, socket_path: Path, **kwargs):
+    """Serve vscode requests (JSON-RPC over a unix socket)"""
+    from dan.cli.server import Server
+    kwargs.pop('no_status', None)
+    kwargs['diags'] = True
+    set_terminal_mode(TerminalMode.BASIC)
+    if socket_path is None:
+        socket_path = kwargs['build_path'] / 'dan.sock'
+    await Server(ctx, socket_path, **kwargs).serve()
 
 @cli.result_callback()
 @pass_context
@@ -563,6 +649,8 @@ def main():
         asyncio.run(Cache.save_all())
         return -1
     finally:
+        # write what has been done so far (eg.: interrupted build)
+        Cache.flush_all()
         term = term_manager()
         term.stop()
         if term._thread:
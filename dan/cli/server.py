@@ -0,0 +1,229 @@
+import inspect
+import json
+import os
+import typing as t
+
+from dan.core import asyncio
+from dan.core.cache import Cache
+from dan.core.pathlib import Path
+from dan.core.snapshot import fingerprint
+from dan.logging import Logging
+from dan.make import Make
+from dan.cli.vscode import Code
+
+if t.TYPE_CHECKING:
+    from dan.cli.main import CommandsContext
+
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVER_ERROR = -32000
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str, data=None) -> None:
+        super().__init__(message)
+        self.code = code
+        self.data = data
+
+    def to_dict(self):
+        error = {'code': self.code, 'message': str(self)}
+        if self.data is not None:
+            error['data'] = self.data
+        return error
+
+
+def _diagnostics(make: Make | None):
+    if make is None:
+        return None
+    return json.loads(make.diagnostics.to_json())
+
+
+class Server(Logging):
+    """Long-lived server answering IDE requests (JSON-RPC 2.0 over a Unix socket)
+
+    The project is loaded once and kept in memory; it is loaded again when a makefile,
+    the configuration (settings, options) or the toolchains change.
+    Messages are newline-delimited JSON, requests are served one at a time.
+    """
+
+    def __init__(self, ctx: 'CommandsContext', socket_path: Path, **options) -> None:
+        self.ctx = ctx
+        self._options = options
+        self.socket_path = Path(socket_path)
+        self._lock = asyncio.Lock()
+        self._fingerprint: str = None
+        self._stopped = asyncio.Event()
+        self._methods = {
+            'get-targets': self.get_targets,
+            'get-tests': self.get_tests,
+            'get-test-suites': self.get_test_suites,
+            'get-source-configuration': self.get_source_configuration,
+            'get-workspace-browse-configuration': self.get_workspace_browse_configuration,
+            'build': self.build,
+            'shutdown': self.shutdown,
+        }
+
+    @staticmethod
+    def _project_fingerprint(make: Make) -> str:
+        return fingerprint(b'', [str(make.config_path), *make._snapshot_files])
+
+    async def _unload(self):
+        await Cache.save_all()
+        Cache.clear_all()
+        self.ctx.reset()
+        self._fingerprint = None
+
+    async def _load(self) -> Make:
+        make: Make = self.ctx._make
+        if make is not None and self._fingerprint != self._project_fingerprint(make):
+            self.info('project changed, reloading...')
+            await self._unload()
+        if self.ctx._make is None:
+            # options are kept by the context once given
+            options, self._options = self._options, dict()
+            try:
+                async with self.ctx(**options):
+                    pass
+            except Exception as err:
+                diagnostics = _diagnostics(self.ctx._make)
+                await self._unload()
+                raise RpcError(SERVER_ERROR, f'cannot load the project: {err}', diagnostics) from err
+            self._fingerprint = self._project_fingerprint(self.ctx._make)
+        return self.ctx._make
+
+    async def get_targets(self, make: Make):
+        return await Code(make).get_targets()
+
+    async def get_tests(self, make: Make):
+        return Code(make).get_tests()
+
+    async def get_test_suites(self, make: Make):
+        return Code(make).get_test_suites()
+
+    async def get_source_configuration(self, make: Make, sources: list[str]):
+        return await Code(make).get_sources_configuration([Path(s) for s in sources])
+
+    async def get_workspace_browse_configuration(self, make: Make):
+        return await Code(make).get_workspace_browse_configuration()
+
+    async def build(self, make: Make, targets: list[str] = None, force: bool = False):
+        selected = make.select_targets(targets)
+        # forget the previous builds' results
+        for target in make._loaded_targets(selected):
+            target.reset_build()
+        if force:
+            await make.clean()
+        try:
+            await make.build(selected if targets else None)
+        except Exception as err:
+            raise RpcError(SERVER_ERROR, f'build failed: {err}', _diagnostics(make)) from err
+        finally:
+            await Cache.save_all()
+        return {'diagnostics': _diagnostics(make)}
+
+    async def shutdown(self, make: Make = None):
+        self._stopped.set()
+
+    async def _call(self, method: str, params):
+        fn = self._methods.get(method)
+        if fn is None:
+            raise RpcError(METHOD_NOT_FOUND, f'unknown method: {method}')
+        if params is None:
+            params = dict()
+        signature = inspect.signature(fn)
+        try:
+            if isinstance(params, list):
+                arguments = signature.bind(None, *params)
+            else:
+                arguments = signature.bind(None, **params)
+        except TypeError as err:
+            raise RpcError(INVALID_PARAMS, str(err)) from err
+        async with self._lock:
+            if fn == self.shutdown:
+                return await fn()
+            make = await self._load()
+            arguments.arguments['make'] = make
+            with make.context:
+                return await fn(*arguments.args, **arguments.kwargs)
+
+    async def handle(self, request) -> dict | None:
+        """Handle a single request, returns its response (None for notifications)"""
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' \
+                or not isinstance(request.get('method'), str) \
+                or not isinstance(request.get('params', []), (list, dict)):
+            return {'jsonrpc': '2.0', 'id': None, 'error': RpcError(INVALID_REQUEST, 'invalid request').to_dict()}
+        ident = request.get('id')
+        try:
+            result = await self._call(request['method'], request.get('params'))
+            response = {'jsonrpc': '2.0', 'id': ident, 'result': result}
+        except RpcError as err:
+            response = {'jsonrpc': '2.0', 'id': ident, 'error': err.to_dict()}
+        except Exception as err:
+            self.debug('%s failed', request['method'], exc_info=err)
+            response = {'jsonrpc': '2.0', 'id': ident, 'error': RpcError(INTERNAL_ERROR, str(err)).to_dict()}
+        if 'id' not in request:
+            return None
+        return response
+
+    async def _process(self, line: bytes) -> bytes | None:
+        try:
+            message = json.loads(line)
+        except ValueError as err:
+            response = {'jsonrpc': '2.0', 'id': None, 'error': RpcError(PARSE_ERROR, str(err)).to_dict()}
+        else:
+            if isinstance(message, list) and len(message) > 0:
+                # batch
+                responses = [await self.handle(request) for request in message]
+                response = [r for r in responses if r is not None] or None
+            else:
+                response = await self.handle(message)
+        if response is None:
+            return None
+        return json.dumps(response).encode() + b'\n'
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while not reader.at_eof():
+                line = await reader.readline()
+                if not line.strip():
+                    continue
+                response = await self._process(line)
+                if response is not None:
+                    writer.write(response)
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _check_socket(self):
+        if not self.socket_path.exists():
+            return
+        try:
+            _, writer = await asyncio.open_unix_connection(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # stale socket
+            self.socket_path.unlink(missing_ok=True)
+        else:
+            writer.close()
+            raise RuntimeError(f'a server is already listening on {self.socket_path}')
+
+    async def serve(self, ready: t.Callable[[], None] = None):
+        """Serve until a shutdown request is received"""
+        await self._check_socket()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        server = await asyncio.start_unix_server(self._serve_client, path=self.socket_path, limit=16 << 20)
+        os.chmod(self.socket_path, 0o600)
+        self.info('listening on %s', self.socket_path)
+        try:
+            async with server:
+                if ready is not None:
+                    ready()
+                await self._stopped.wait()
+        finally:
+            self.socket_path.unlink(missing_ok=True)
+            await Cache.save_all()
@@ -1,5 +1,6 @@
-from dan.cli.main import user_cli as cli, Make
+from dan.cli.main import user_cli as cli
 from dan.cli.main import click
+from dan.make import Make
 
 command = cli.command
 group = cli.group
@@ -1,4 +1,3 @@
-import json
 import os
 from dan.core import asyncio
 
@@ -59,7 +58,37 @@ class Code(Logging):
     def __init__(self, make: Make) -> None:
         self.make = make
 
-    def get_test_suites(self, pretty):
+    async def get_targets(self):
+        from dan.cxx.targets import Executable
+
+        targets = self.make.context.root.all_targets
+        async with asyncio.TaskGroup() as g:
+            for target in targets:
+                g.create_task(target.load_dependencies())
+        return [
+            {
+                "name": target.name,
+                "fullname": target.fullname,
+                "buildPath": str(target.build_path),
+                "srcPath": str(target.source_path),
+                "output": str(target.output),
+                "executable": isinstance(target, Executable),
+                "type": type(target).__name__,
+                "env": target.env if isinstance(target, Executable) else None,
+            }
+            for target in targets
+        ]
+
+    def get_tests(self):
+        out = list()
+        for t in self.make.context.root.all_tests:
+            out.append(t.fullname)
+            if len(t) > 1:
+                for c in t.cases:
+                    out.append(f"{t.fullname}:{c.name}")
+        return out
+
+    def get_test_suites(self):
         from dan.core.include import MakeFile
         from dan.core.test import Test, Case
         from dan.cxx import Executable
@@ -142,9 +171,7 @@ class Code(Logging):
                     "children": children,
                 }
 
-        return json.dumps(
-            make_suite_info(self.make.context.root), indent=2 if pretty else None
-        )
+        return make_suite_info(self.make.context.root)
 
     async def _init_target(self, target):
         with target.skip_missing_dependencies:
@@ -160,7 +187,7 @@ class Code(Logging):
         #   - compilerPath?: string;
         #   - compilerArgs?: string[];
         #   - windowsSdkVersion?: string;
-        includes = await target.toolchain.get_default_include_paths()
+        includes = list(await target.toolchain.get_default_include_paths())
         defines = [
             f"{k}={v}"
             for k, v in (await target.toolchain.get_default_defines()).items()
@@ -195,7 +222,7 @@ class Code(Logging):
             for source, target in targets_map.items():
                 if target:
                     g.create_task(self._make_source_configuration(source, target))
-        return json.dumps(g.results())
+        return g.results()
 
     async def get_workspace_browse_configuration(self):
         # interface:
@@ -235,4 +262,4 @@ class Code(Logging):
             "compilerArgs": list(compiler_args),
             "standard": f"c++{cpp_std}",
         }
-        return json.dumps(result)
+        return result
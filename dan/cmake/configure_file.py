@@ -10,6 +10,7 @@ class ConfigureFile(Target, internal=True):
 
     input: Path = None
     variables: dict[str, Any] = dict()
+    restat = True
 
     _cmake_define_expr = re.compile(r'#\s?cmakedefine\s+(\w+)\s?(@\w+@)?')
     _define_expr = re.compile(r'#\s?define\s+(\w+)\s+"?(@(\w+)@)"?')
@@ -4,7 +4,6 @@ from dan.core.pm import re_match
 from dan.core.runners import async_run
 from dan.core.target import Target
 from dan.core import aiofiles
-import jinja2
 
 _conanfile_template = """[requires]
 {% for r in requirements %}
@@ -33,6 +32,7 @@ class ConanFile(Target, internal=True):
         self.__reqs.append(pkg)
 
     async def __build__(self):
+        import jinja2
         template = jinja2.Environment(
             loader=jinja2.BaseLoader).from_string(_conanfile_template)
         content = template.render(requirements=self.__reqs)
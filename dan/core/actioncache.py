@@ -0,0 +1,487 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import types
+import typing as t
+import uuid
+
+from dan.core import pathmap
+from dan.core.aiofiles import FileLock
+from dan.core.pathlib import Path
+from dan.core.paths import get_dan_path
+
+if t.TYPE_CHECKING:
+    from dan.core.remotecache import RemoteStore
+
+
+enabled = False
+"""Actions outputs cache (opt-in via the *action_cache.enabled* setting)"""
+
+
+def make_key(*parts) -> str:
+    """Content-addressed key made of the given parts (str, bytes or nested lists/tuples of them)"""
+    sha = hashlib.sha256()
+
+    def update(part):
+        match part:
+            case bytes():
+                sha.update(b'b%d:' % len(part))
+                sha.update(part)
+            case list() | tuple():
+                sha.update(b'l%d:' % len(part))
+                for sub in part:
+                    update(sub)
+            case None:
+                sha.update(b'n')
+            case _:
+                data = str(part).encode()
+                sha.update(b's%d:' % len(data))
+                sha.update(data)
+
+    for part in parts:
+        update(part)
+    return sha.hexdigest()
+
+
+def code_fingerprint(fn) -> list:
+    """Fingerprint of a function's code (bytecode, constants and names, not its location)"""
+    def fingerprint(code: types.CodeType):
+        consts = [fingerprint(c) if isinstance(c, types.CodeType) else repr(c) for c in code.co_consts]
+        return [code.co_code, consts, code.co_names]
+
+    fn = getattr(fn, '__func__', fn)
+    code = getattr(fn, '__code__', None)
+    return [sys.version_info[:2], fingerprint(code)] if code is not None else [repr(fn)]
+
+
+def tool_fingerprint(tool: str | Path, digests) -> list:
+    """Fingerprint of an executable: its resolved path (relative to the roots) and digest"""
+    path = shutil.which(str(tool)) or str(tool)
+    path = os.path.realpath(path)
+    return [pathmap.normalize(path), digests.digest(path)]
+
+
+class Entry:
+    """Cached action result: output files and metadata"""
+
+    def __init__(self, key: str, path: Path, metadata: dict) -> None:
+        self.key = key
+        self.path = path
+        self.metadata = metadata
+
+    @property
+    def files(self) -> list[str]:
+        return self.metadata.get('files', list())
+
+    def read(self, name: str) -> bytes:
+        return (self.path / name).read_bytes()
+
+    def restore(self, name: str, dest: Path):
+        """Restore the output file *name* to dest"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f'.{dest.name}.{uuid.uuid4().hex[:8]}')
+        shutil.copyfile(self.path / name, tmp)
+        mode = self.metadata.get('modes', dict()).get(name)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, dest)
+
+
+class Stats:
+    fields = ('hits', 'misses', 'stores', 'evictions', 'remote_hits', 'uploads')
+
+    def __init__(self, **values) -> None:
+        for name in self.fields:
+            setattr(self, name, values.get(name, 0))
+        self.size = values.get('size', 0)
+
+    def to_dict(self) -> dict:
+        return {'size': self.size, **{name: getattr(self, name) for name in self.fields}}
+
+
+class LocalStore:
+    """Content-addressed store of actions results on the local file system
+
+    Entries are directories holding the output files and a metadata file, they are
+    written atomically (concurrent processes may share a store). Manifests are small json
+    documents used to look up entries by secondary keys.
+    The least recently used entries are evicted when the store gets larger than max_size.
+    Counters are kept in memory and merged into the store statistics on :meth:`save`.
+
+    When a *remote* store is attached, the local store acts as its cache: missing entries
+    are downloaded by :meth:`fetch` (or beforehand by :meth:`prefetch`) and stored entries are
+    uploaded in the background (awaited by :meth:`flush`), unless the remote is read-only.
+    """
+
+    metadata_name = 'metadata.json'
+
+    def __init__(self, root: Path | str, max_size: int = 5 << 30) -> None:
+        self.root = Path(root)
+        self.max_size = max_size
+        self.counters = Stats()
+        self.lock = FileLock(self.root / 'lock')
+        self.remote: 'RemoteStore' = None
+        self._uploads: set[asyncio.Task] = set()
+        self._uploads_semaphore: asyncio.Semaphore = None
+        self._downloaded: set[str] = set()
+        self._remote_manifests: dict[str, list] = dict()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / 'entries' / key[:2] / key
+
+    def _manifest_path(self, key: str) -> Path:
+        return self.root / 'manifests' / key[:2] / key
+
+    def _tmp_path(self) -> Path:
+        path = self.root / 'tmp' / uuid.uuid4().hex
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _load(self, key: str) -> Entry | None:
+        path = self._entry_path(key)
+        try:
+            with open(path / self.metadata_name) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # least recently used first on eviction
+        os.utime(path / self.metadata_name)
+        return Entry(key, path, metadata)
+
+    def _count(self, entry: Entry | None):
+        if entry is None:
+            self.counters.misses += 1
+        else:
+            self.counters.hits += 1
+            if entry.key in self._downloaded:
+                self._downloaded.discard(entry.key)
+                self.counters.remote_hits += 1
+
+    def restore_failed(self, entry: Entry):
+        """Count an entry that could not be restored (eg.: evicted meanwhile) as a miss"""
+        self.counters.hits -= 1
+        self.counters.misses += 1
+
+    def get(self, key: str) -> Entry | None:
+        """Look up an entry (counted as a hit or a miss)"""
+        entry = self._load(key)
+        self._count(entry)
+        return entry
+
+    async def fetch(self, key: str) -> Entry | None:
+        """Look up an entry, downloading it from the remote store if needed (counted as a hit or a miss)"""
+        entry = self._load(key)
+        if entry is None and self.remote is not None and await self._download(key):
+            entry = self._load(key)
+        self._count(entry)
+        return entry
+
+    async def prefetch(self, keys: list[str]):
+        """Download the given entries from the remote store (checked in a single batch)"""
+        if self.remote is None:
+            return
+        keys = [key for key in keys if not (self._entry_path(key) / self.metadata_name).exists()]
+        if not keys:
+            return
+        found = await self.remote.contains('ac', keys)
+        await asyncio.gather(*[self._download(key) for key in found])
+
+    def _commit(self, tmp: Path, key: str, metadata: dict) -> int:
+        """Write the metadata of the entry being created in tmp and move it to its place
+
+        Returns the size of the entry (0 if it already exists).
+        """
+        size = sum(f.stat().st_size for f in tmp.iterdir())
+        content = json.dumps(metadata)
+        (tmp / self.metadata_name).write_text(content)
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # stored concurrently
+            return 0
+        size += len(content)
+        self.counters.size += size
+        return size
+
+    async def _download(self, key: str) -> bool:
+        data = await self.remote.get('ac', key)
+        if data is None:
+            return False
+        try:
+            description = json.loads(data)
+            files: dict[str, str] = description['files']
+            metadata = dict(description.get('metadata', dict()))
+        except (ValueError, KeyError, TypeError):
+            self.remote.warning('invalid entry: %s', key)
+            return False
+        if not all(os.path.basename(name) == name and name not in ('', '.', '..', self.metadata_name) for name in files):
+            self.remote.warning('invalid entry: %s', key)
+            return False
+        tmp = self._tmp_path()
+        tmp.mkdir()
+        try:
+            results = await asyncio.gather(*[self.remote.download(digest, tmp / name) for name, digest in files.items()])
+            if not all(results):
+                return False
+            metadata['files'] = list(files.keys())
+            self._commit(tmp, key, metadata)
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+        self._downloaded.add(key)
+        return True
+
+    async def _guarded_upload(self, coro: t.Coroutine):
+        """Run an upload, its failure is logged (never fails the build)"""
+        try:
+            await coro
+        except Exception as err:
+            self.remote.warning('upload failed: %s', str(err) or type(err).__name__)
+
+    def _upload(self, coro: t.Coroutine):
+        coro = self._guarded_upload(coro)
+        try:
+            task = asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            # not building
+            coro.close()
+            return
+        self._uploads.add(task)
+        task.add_done_callback(self._uploads.discard)
+
+    async def _upload_entry(self, key: str):
+        from dan.core.remotecache import file_digest
+        if self._uploads_semaphore is None:
+            self._uploads_semaphore = asyncio.Semaphore(self.remote.jobs)
+        async with self._uploads_semaphore:
+            path = self._entry_path(key)
+            with open(path / self.metadata_name) as f:
+                metadata = json.load(f)
+            digests = {name: file_digest(path / name) for name in metadata.pop('files')}
+            contents = {digest: path / name for name, digest in digests.items()}
+            present = await self.remote.contains('cas', list(contents.keys()))
+            results = await asyncio.gather(*[self.remote.upload(src, digest)
+                                             for digest, src in contents.items() if digest not in present])
+            if not all(results):
+                return
+            if await self.remote.put('ac', key, json.dumps({'files': digests, 'metadata': metadata}).encode()):
+                self.counters.uploads += 1
+
+    @property
+    def uploading(self) -> bool:
+        return self.remote is not None and not self.remote.read_only
+
+    def _put(self, key: str, files: dict[str, Path | bytes], metadata: dict = None) -> bool:
+        path = self._entry_path(key)
+        if path.exists():
+            return False
+        tmp = self._tmp_path()
+        tmp.mkdir()
+        try:
+            modes = dict()
+            for name, src in files.items():
+                if isinstance(src, bytes):
+                    (tmp / name).write_bytes(src)
+                else:
+                    shutil.copyfile(src, tmp / name)
+                    modes[name] = stat.S_IMODE(os.stat(src).st_mode)
+            metadata = {**(metadata or dict()), 'modes': modes, 'files': list(files.keys())}
+            return self._commit(tmp, key, metadata) > 0
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    def _stored(self, key: str):
+        self.counters.stores += 1
+        if self.uploading:
+            self._upload(self._upload_entry(key))
+
+    def put(self, key: str, files: dict[str, Path | bytes], metadata: dict = None) -> bool:
+        """Store the given files (by name, paths or contents) and metadata under key
+
+        Returns False if the entry already exists.
+        """
+        if not self._put(key, files, metadata):
+            return False
+        self._stored(key)
+        return True
+
+    async def async_put(self, key: str, files: dict[str, Path | bytes], metadata: dict = None) -> bool:
+        """Same as :meth:`put`, the files being written by a worker thread"""
+        if not await asyncio.to_thread(self._put, key, files, metadata):
+            return False
+        self._stored(key)
+        return True
+
+    def get_manifest(self, key: str) -> list | None:
+        try:
+            with open(self._manifest_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def fetch_manifest(self, key: str) -> list | None:
+        """Get a manifest, merged with the remote one (fetched once per session)"""
+        local = self.get_manifest(key)
+        if self.remote is None:
+            return local
+        if key not in self._remote_manifests:
+            data = await self.remote.get('ac', key)
+            try:
+                remote = json.loads(data) if data is not None else None
+            except ValueError:
+                remote = None
+            self._remote_manifests[key] = remote if isinstance(remote, list) else None
+        remote = self._remote_manifests[key]
+        if remote is None:
+            return local
+        if local is None:
+            return remote
+        return [*local, *[item for item in remote if item not in local]]
+
+    def _put_manifest(self, key: str, value: list):
+        path = self._manifest_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._tmp_path()
+        tmp.write_text(json.dumps(value))
+        os.replace(tmp, path)
+
+    def _manifest_stored(self, key: str, value: list):
+        if self.uploading:
+            self._remote_manifests[key] = value
+            self._upload(self.remote.put('ac', key, json.dumps(value).encode()))
+
+    def put_manifest(self, key: str, value: list):
+        self._put_manifest(key, value)
+        self._manifest_stored(key, value)
+
+    async def async_put_manifest(self, key: str, value: list):
+        """Same as :meth:`put_manifest`, the manifest being written by a worker thread"""
+        await asyncio.to_thread(self._put_manifest, key, value)
+        self._manifest_stored(key, value)
+
+    async def flush(self):
+        """Wait for the pending uploads, close the remote session"""
+        while self._uploads:
+            await asyncio.gather(*list(self._uploads), return_exceptions=True)
+        self._uploads_semaphore = None
+        self._remote_manifests.clear()
+        self._downloaded.clear()
+        if self.remote is not None:
+            await self.remote.close()
+
+    def _read_stats(self) -> Stats:
+        try:
+            with open(self.root / 'stats.json') as f:
+                return Stats(**json.load(f))
+        except (OSError, ValueError):
+            return Stats()
+
+    @property
+    def stats(self) -> Stats:
+        """Store statistics (including the pending counters)"""
+        stats = self._read_stats()
+        for name in (*Stats.fields, 'size'):
+            setattr(stats, name, getattr(stats, name) + getattr(self.counters, name))
+        return stats
+
+    def _write_stats(self, counters: Stats):
+        stats = self._read_stats()
+        for name in (*Stats.fields, 'size'):
+            setattr(stats, name, getattr(stats, name) + getattr(counters, name))
+        if stats.size > self.max_size:
+            stats = self._evict(stats)
+        with open(self.root / 'stats.json', 'w') as f:
+            json.dump(stats.to_dict(), f)
+
+    async def save(self):
+        """Merge the counters into the store statistics, evict entries if the store is too large"""
+        if not self.root.exists():
+            return
+        async with self.lock:
+            counters, self.counters = self.counters, Stats()
+            await asyncio.to_thread(self._write_stats, counters)
+
+    def _evict(self, stats: Stats) -> Stats:
+        entries = list()
+        total = 0
+        for directory in (self.root / 'entries').glob('*/*'):
+            try:
+                size = sum(f.stat().st_size for f in directory.iterdir())
+                used = (directory / self.metadata_name).stat().st_mtime
+            except OSError:
+                continue
+            entries.append((used, size, directory))
+            total += size
+        entries.sort()
+        # keep some room to avoid evicting on each save
+        target = self.max_size * 0.9
+        for _, size, directory in entries:
+            if total <= target:
+                break
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= size
+            stats.evictions += 1
+        stats.size = total
+        return stats
+
+    def _clear(self, counters: Stats):
+        for name in ('entries', 'manifests', 'tmp'):
+            shutil.rmtree(self.root / name, ignore_errors=True)
+        stats = self._read_stats()
+        for name in Stats.fields:
+            setattr(stats, name, getattr(stats, name) + getattr(counters, name))
+        stats.size = 0
+        with open(self.root / 'stats.json', 'w') as f:
+            json.dump(stats.to_dict(), f)
+
+    async def clear(self):
+        async with self.lock:
+            counters, self.counters = self.counters, Stats()
+            await asyncio.to_thread(self._clear, counters)
+
+
+_store: LocalStore = None
+
+
+def open_store(settings) -> LocalStore:
+    """Open the store described by the *action_cache* settings (enabled or not)"""
+    root = Path(settings.path).expanduser() if settings.path else get_dan_path() / 'cache'
+    return LocalStore(root, settings.max_size << 20)
+
+
+def configure(settings):
+    """Setup the actions cache from the *action_cache* settings"""
+    global enabled, _store
+    enabled = settings.enabled
+    if not enabled:
+        _store = None
+        return
+    store = open_store(settings)
+    if _store is None or _store.root != store.root:
+        _store = store
+    _store.max_size = store.max_size
+    if not settings.remote:
+        _store.remote = None
+    elif _store.remote is None or _store.remote.url != settings.remote.rstrip('/'):
+        from dan.core.remotecache import RemoteStore
+        _store.remote = RemoteStore(settings.remote, settings.remote_read_only, settings.remote_jobs)
+    else:
+        _store.remote.read_only = settings.remote_read_only
+        _store.remote.jobs = settings.remote_jobs
+
+
+def get_store() -> LocalStore | None:
+    """Get the actions cache store (None if disabled)"""
+    return _store if enabled else None
+
+
+async def save():
+    if _store is not None:
+        await _store.save()
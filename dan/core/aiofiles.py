@@ -8,6 +8,7 @@ import re
 import sys
 import errno
 import contextlib
+import socket
 import time
 
 from dan.core.pathlib import Path
@@ -56,6 +57,20 @@ async def copy(src : Path, dest : Path, chunk_size=2048):
     dest.chmod(src.stat().st_mode)
 
 
+async def write_if_changed(filepath, content: str) -> bool:
+    """Write content to filepath unless it already holds it (keeps its modification time)
+
+    Returns True if the file has been written.
+    """
+    if sync_os.path.isfile(filepath):
+        async with open(filepath) as f:
+            if await f.read() == content:
+                return False
+    async with open(filepath, 'w') as f:
+        await f.write(content)
+    return True
+
+
 async def sub(filepath, pattern, repl, **kwargs):
     async with open(filepath) as f:
         content = await f.read()
@@ -65,64 +80,165 @@ async def sub(filepath, pattern, repl, **kwargs):
 
 
 
+try:
+    import fcntl
+except ImportError:  # pragma: win32 cover
+    fcntl = None
+    import msvcrt
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:  # pragma: win32 cover
+            sync_os.lseek(fd, 0, sync_os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError as exception:
+        if exception.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK, errno.EDEADLK):
+            return False
+        raise
+
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:  # pragma: win32 cover
+        sync_os.lseek(fd, 0, sync_os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
 class FileLock:
+    """Inter-process lock backed by the kernel (flock, or msvcrt.locking on Windows)
+
+    The lock is released by the kernel when its holder dies, the lock file is kept and
+    records the holder (pid and host) for diagnostics.
+    Synchronous waiters block in the kernel, asynchronous ones poll the lock (with a growing
+    interval, up to *poll_interval*) so that they can time out or be cancelled at any time.
+    Each instance opens its own file description: two instances exclude each other,
+    even in the same process.
+    """
+
     def __init__(self, path: str|Path, timeout=None, poll_interval=0.1) -> None:
         self._path = Path(path)
         self._mode: int = 0o644
         self._fh = None
         self._timeout = timeout
+        # asynchronous waits, and synchronous ones where blocking locks are not available (Windows)
         self._poll_interval = poll_interval
 
     def __del__(self):
         if self.has_lock:
             self.release()
 
+    @property
+    def path(self):
+        return self._path
+
+    def _open(self) -> int:
+        self._path.parent.mkdir(exist_ok=True, parents=True)
+        return sync_os.open(self._path, sync_os.O_RDWR | sync_os.O_CREAT, self._mode)
+
     @property
     def locked(self):
-        return self._path.exists()
+        """Whether the lock is held (by this instance or by anyone else)"""
+        if self.has_lock:
+            return True
+        if not self._path.exists():
+            return False
+        fd = self._open()
+        try:
+            if _try_lock(fd):
+                _unlock(fd)
+                return False
+            return True
+        finally:
+            sync_os.close(fd)
+
+    @property
+    def holder(self) -> str | None:
+        """Description of the current holder (None if not locked)"""
+        if not self.locked:
+            return None
+        try:
+            return self._path.read_text().strip() or 'unknown'
+        except OSError:
+            return 'unknown'
 
     @property
     def has_lock(self):
         return self._fh is not None
 
+    def _acquired(self, fd: int):
+        self._fh = fd
+        info = f'pid {sync_os.getpid()} on {socket.gethostname()}\n'.encode()
+        sync_os.ftruncate(fd, 0)
+        sync_os.lseek(fd, 0, sync_os.SEEK_SET)
+        sync_os.write(fd, info)
+
     def try_acquire(self):
-        flags = (
-            sync_os.O_WRONLY  # open for writing only
-            | sync_os.O_CREAT
-            | sync_os.O_EXCL  # together with above raise EEXIST if the file specified by filename exists
-            | sync_os.O_TRUNC  # truncate the file to zero byte
-        )
-        try:
-            self._fh = sync_os.open(self._path, flags, self._mode)
+        assert not self.has_lock, 'already acquired'
+        fd = self._open()
+        if _try_lock(fd):
+            self._acquired(fd)
             return True
-        except OSError as exception:  # re-raise unless expected exception
-            if not (
-                exception.errno == errno.EEXIST  # lock already exist
-                or (exception.errno == errno.EACCES and sys.platform == "win32")  # has no access to this lock
-            ):  # pragma: win32 no cover
-                raise
-            return False
+        sync_os.close(fd)
+        return False
+
+    def acquire_sync(self):
+        """Acquire the lock, blocking the calling thread"""
+        assert not self.has_lock, 'already acquired'
+        fd = self._open()
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:  # pragma: win32 cover
+                while not _try_lock(fd):
+                    time.sleep(self._poll_interval)
+        except BaseException:
+            sync_os.close(fd)
+            raise
+        self._acquired(fd)
 
     async def acquire(self, timeout=None):
+        """Acquire the lock, polling it (with a growing interval) until timeout
+
+        Returns False if it has not been acquired in time.
+        """
         if timeout is None:
             timeout = self._timeout
-        t0 = t1 = time.perf_counter()
-        while timeout is None or timeout < t1 - t0:
-            if self.try_acquire():
-                return True
-            await asyncio.sleep(self._poll_interval)
-            t1 = time.perf_counter()
-        return False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = 0.005
+        while not self.try_acquire():
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                interval = min(interval, remaining)
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self._poll_interval)
+        return True
 
     def release(self):
         assert self._fh is not None
-        sync_os.close(self._fh)
-        self._fh = None
-        with contextlib.suppress(OSError):  # the file is already deleted and that's what we want
-            self._path.unlink()
+        fd, self._fh = self._fh, None
+        with contextlib.suppress(OSError):
+            sync_os.ftruncate(fd, 0)
+        _unlock(fd)
+        sync_os.close(fd)
+
+    def __enter__(self):
+        self.acquire_sync()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
 
     async def __aenter__(self):
-        await self.acquire()
+        if not await self.acquire():
+            raise TimeoutError(f'cannot acquire {self._path} (held by {self.holder})')
+        return self
     
     async def __aexit__(self, *exc):
         self.release()
@@ -7,6 +7,7 @@ import multiprocessing
 import typing as t
 import inspect
 import threading
+import weakref
 
 from dan.core.functools import BaseDecorator
 
@@ -48,6 +49,7 @@ class Cached(BaseDecorator):
             key = id(args[0]) if self.__unique else hash((args, frozenset(kwds)))
             if key not in self.__cache:
                 self.__cache[key] = Future()
+                self.__forget_on_release(args, key)
                 try:
                     self.__cache[key].set_result(await self.__fn(*args, **kwds))
                 except Exception as ex:
@@ -57,6 +59,25 @@ class Cached(BaseDecorator):
 
             return self.__cache[key].result()
 
+    def __forget_on_release(self, args, key):
+        # keys depend on the instance identity: forget them when the instance is released,
+        # so that a new instance at the same address does not get its results
+        if len(args) == 0:
+            return
+        try:
+            weakref.finalize(args[0], self.__cache.pop, key, None)
+        except TypeError:
+            # not weak-referenceable (eg.: builtin values)
+            pass
+
+    def forget(self, *args, **kwds):
+        """Forget the result cached for the given arguments (eg.: the instance of a cached method)"""
+        if not self.__is_method and self.__unique:
+            self.__cache = None
+        else:
+            key = id(args[0]) if self.__unique else hash((args, frozenset(kwds)))
+            self.__cache.pop(key, None)
+
     def clear_all(self):
         if self.__unique:
             self.__cache = dict()
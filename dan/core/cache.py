@@ -1,17 +1,348 @@
 import dataclasses
+import enum
 import functools
 import json
+import os
 import pickle
+import struct
+import zlib
 import aiofiles
 import typing as t
 
 
+from dan.core.aiofiles import FileLock
 from dan.core.pathlib import Path
 from dan.core import asyncio
 
 T = t.TypeVar('T', bound=dict)
 
+
+compression = False
+"""Compress the journaled caches records (opt-in via the *cache_compression* setting)"""
+
+
+_immutable_types = (str, bytes, int, float, complex, type(None), tuple, frozenset, os.PathLike, enum.Enum)
+
+
+class _Changes:
+    """Modified root keys of a journaled cache"""
+
+    def __init__(self) -> None:
+        self.keys = set()
+
+    def mark(self, key):
+        self.keys.add(key)
+
+    def flushed(self):
+        self.keys.clear()
+
+
+_missing = object()
+
+
+class _Tracked:
+    """Container reporting its modifications to its owning cache (by root key)"""
+
+    __slots__ = ()
+
+    def _changed(self, key=_missing):
+        self._changes.mark(self._root if key is _missing or self._root is not None else key)
+
+    def _wrap(self, value, key=_missing):
+        """Tracked version of the value (containers being copied)"""
+        root = self._root if self._root is not None or key is _missing else key
+        match value:
+            case _Tracked() if value._changes is self._changes and value._root == root:
+                return value
+            case dict():
+                return _TrackedDict(value, self._changes, root)
+            case list():
+                return _TrackedList(value, self._changes, root)
+            case set():
+                return _TrackedSet(value, self._changes, root)
+        return value
+
+    def _accessed(self, value, key=_missing):
+        if not isinstance(value, (_immutable_types, _Tracked)):
+            # opaque value that may be modified in place
+            self._changed(key)
+        return value
+
+
+def _mutator(base: type, name: str):
+    method = getattr(base, name)
+
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._changed()
+        return result
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+class _TrackedList(_Tracked, list):
+    """list reporting its modifications to its owning cache (pickled as a plain list)"""
+
+    __slots__ = ('_changes', '_root')
+
+    def __init__(self, items, changes: _Changes, root):
+        self._changes = changes
+        self._root = root
+        list.__init__(self, (self._wrap(item) for item in items))
+
+    def __reduce_ex__(self, protocol):
+        return (list, (list(list.__iter__(self)),))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # a copy
+            return list.__getitem__(self, index)
+        return self._accessed(list.__getitem__(self, index))
+
+    def __iter__(self):
+        return (self._accessed(item) for item in list.__iter__(self))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [self._wrap(item) for item in value]
+        else:
+            value = self._wrap(value)
+        list.__setitem__(self, index, value)
+        self._changed()
+
+    def append(self, value):
+        list.append(self, self._wrap(value))
+        self._changed()
+
+    def insert(self, index, value):
+        list.insert(self, index, self._wrap(value))
+        self._changed()
+
+    def extend(self, values):
+        list.extend(self, [self._wrap(value) for value in values])
+        self._changed()
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    for _name in ('__delitem__', '__imul__', 'pop', 'remove', 'clear', 'sort', 'reverse'):
+        locals()[_name] = _mutator(list, _name)
+    del _name
+
+
+class _TrackedSet(_Tracked, set):
+    """set reporting its modifications to its owning cache (pickled as a plain set)"""
+
+    __slots__ = ('_changes', '_root')
+
+    def __init__(self, items, changes: _Changes, root):
+        self._changes = changes
+        self._root = root
+        set.__init__(self, items)
+
+    def __reduce_ex__(self, protocol):
+        return (set, (set(set.__iter__(self)),))
+
+    for _name in ('add', 'discard', 'remove', 'pop', 'clear', 'update', 'difference_update',
+                  'intersection_update', 'symmetric_difference_update',
+                  '__ior__', '__iand__', '__isub__', '__ixor__'):
+        locals()[_name] = _mutator(set, _name)
+    del _name
+
+
+class _TrackedDict(_Tracked, dict):
+    """dict reporting its modifications to its owning cache
+
+    Nested containers (dicts, lists and sets) are tracked too: their modifications mark their
+    root key as dirty. Assigned containers are stored as tracked copies (the assigned object is
+    not the stored one: it has to be read back to be modified). Reading any other mutable value
+    marks its root key as dirty. Pickled as plain dicts.
+    """
+
+    __slots__ = ('_changes', '_root')
+
+    def __init__(self, items, changes: _Changes, root=None):
+        super().__init__()
+        self._changes = changes
+        self._root = root
+        for k, v in items.items():
+            dict.__setitem__(self, k, self._wrap(v, k))
+
+    def __reduce_ex__(self, protocol):
+        return (dict, (), None, None, iter(dict.items(self)))
+
+    def __getitem__(self, key):
+        return self._accessed(dict.__getitem__(self, key), key)
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, self._wrap(value, key))
+        self._changed(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            self._changed(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._changed(key)
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        keys = list(self.keys())
+        dict.clear(self)
+        for key in keys:
+            self._changed(key)
+
+
+class _Journal:
+    """Append-only journal of a dict cache
+
+    The file starts with a checkpoint (the whole dict) followed by the records of the keys
+    modified since then. Each record is framed with its size and checksum: a record torn by
+    an interrupted write is dropped when loading (the cache goes back to its previous flush).
+    Writes are serialized by a lock of the cache directory; a journal modified by another
+    process since it has been loaded is rewritten (last writer wins) instead of appended.
+    """
+
+    magic = b'DANJ\x01\n'
+    _header = struct.Struct('<IIB')
+    _compressed = 1
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.size = 0
+        self.checkpoint_size = 0
+        self._inode = None
+        self.lock = FileLock(path.parent / '.cache.lock')
+        # serializes the asynchronous writers of this process (sharing the file lock)
+        self.writing = asyncio.Lock()
+
+    @classmethod
+    def is_journal(cls, path: Path) -> bool:
+        with open(path, 'rb') as f:
+            return f.read(len(cls.magic)) == cls.magic
+
+    def _record(self, record) -> bytes:
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        flags = 0
+        if compression:
+            payload = zlib.compress(payload, 1)
+            flags |= self._compressed
+        return self._header.pack(len(payload), zlib.crc32(payload), flags) + payload
+
+    def load(self) -> dict:
+        data = dict()
+        with open(self.path, 'rb') as f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            f.seek(len(self.magic))
+            offset = len(self.magic)
+            while True:
+                header = f.read(self._header.size)
+                if len(header) < self._header.size:
+                    break
+                size, crc, flags = self._header.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size or zlib.crc32(payload) != crc:
+                    break
+                if flags & self._compressed:
+                    payload = zlib.decompress(payload)
+                op, *args = pickle.loads(payload)
+                match op:
+                    case 'checkpoint':
+                        data = args[0]
+                        self.checkpoint_size = size
+                    case 'set':
+                        data[args[0]] = args[1]
+                    case 'del':
+                        data.pop(args[0], None)
+                offset += self._header.size + size
+        self.size = offset
+        return data
+
+    def checkpoint(self, data: dict):
+        """Write the whole data (atomically replacing the journal)"""
+        record = self._record(('checkpoint', data))
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(self.magic)
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._inode = self.path.stat().st_ino
+        self.checkpoint_size = len(record)
+        self.size = len(self.magic) + len(record)
+
+    def append(self, data: dict, keys: t.Iterable) -> bool:
+        """Append the records of the given (modified) keys
+
+        Returns False if the journal has been modified by someone else (or has a torn record),
+        it has to be rewritten.
+        """
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return False
+        if st.st_ino != self._inode or st.st_size != self.size:
+            return False
+        records = list()
+        for key in keys:
+            if key in data:
+                records.append(self._record(('set', key, dict.__getitem__(data, key))))
+            else:
+                records.append(self._record(('del', key)))
+        with open(self.path, 'r+b') as f:
+            f.seek(self.size)
+            for record in records:
+                f.write(record)
+            self.size = f.tell()
+        return True
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.size - self.checkpoint_size > max(self.checkpoint_size, 64 << 10)
+
+
 class Cache(t.Generic[T]):
+    """Persistent data
+
+    Dict caches stored in binary mode are journaled: modifications are tracked per (root) key
+    and only the modified keys are appended to the cache file when saved, the file being
+    compacted once the journal gets large. Stored containers (dicts, lists and sets) report
+    their in-place modifications, see :class:`_TrackedDict`.
+    """
+
     dataclass: T = dict
     indent = None
     __caches: dict[str, 'Cache'] = dict()
@@ -34,12 +365,23 @@ class Cache(t.Generic[T]):
         assert not self.name in self.__caches, 'a cache should be unique'
         self.__caches[self.name] = self
 
+        self.__journal: _Journal = None
+        if binary and not dataclasses.is_dataclass(self.dataclass):
+            self.__journal = _Journal(self.path)
+        self.__changes = _Changes()
+        self.__rewrite = False
+
         if self.path.exists():
             with open(self.path, 'rb') as f:
-                if dataclasses.is_dataclass(self.dataclass):
+                if self.__journal is not None and _Journal.is_journal(self.path):
+                    self.__data = self.__journal.load()
+                    self.__rewrite = self.__journal.needs_compaction
+                elif dataclasses.is_dataclass(self.dataclass):
                     self.__data = self.dataclass.from_json(f.read())
                 else:
                     self.__data = self.__serializer.load(f)
+                    # previous format, converted on next save
+                    self.__rewrite = self.__journal is not None
                 if not isinstance(self.__data, self.dataclass):
                     self.__data = self.dataclass(**self.__data)
                 self.__modification_date = self.path.modification_time
@@ -47,8 +389,11 @@ class Cache(t.Generic[T]):
             self.__data = self.dataclass(*args, **kwargs)
             self.__modification_date = 0.0
         
-        self.__initial_state = self._dump()
-        self.__dirty = False
+        if self.__journal is not None:
+            self.__data = _TrackedDict(self.__data, self.__changes)
+        else:
+            self.__initial_state = self._dump()
+            self.__dirty = False
     
     @classmethod
     def instance(cls, path: Path|str, *args, cache_name:str = None, **kwargs):
@@ -86,12 +431,47 @@ class Cache(t.Generic[T]):
     
     @property
     def dirty(self):
+        if self.__journal is not None:
+            return self.__rewrite or len(self.__changes.keys) > 0
         if not self.__dirty:
             self.__state = self._dump()
             self.__dirty = self.__initial_state != self.__state
         return self.__dirty
-    
+
+    def __write(self, force: bool):
+        """Write the journaled cache modifications (the journal lock being held)"""
+        keys = set(self.__changes.keys)
+        if force or self.__rewrite or not self.__journal.append(self.__data, keys):
+            self.__journal.checkpoint(self.__data)
+        self.__rewrite = self.__journal.needs_compaction
+        self.__changes.flushed()
+
+    def flush(self, force=False):
+        """Synchronously write the journaled cache modifications (blocks until the journal lock is acquired)"""
+        assert self.__journal is not None, 'only journaled caches can be flushed'
+        if not (self.dirty or force):
+            return
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        lock = self.__journal.lock
+        if lock.has_lock:
+            # interrupted while saving
+            self.__write(force)
+            return
+        with lock:
+            self.__write(force)
+
     async def save(self, force=False):
+        if self.__journal is not None:
+            if not (self.dirty or force):
+                return
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            async with self.__journal.writing:
+                await self.__journal.lock.acquire()
+                try:
+                    self.__write(force)
+                finally:
+                    self.__journal.lock.release()
+            return
         if self.path and (self.dirty or force):
             if self.__state:
                 self.path.parent.mkdir(exist_ok=True, parents=True)
@@ -106,6 +486,13 @@ class Cache(t.Generic[T]):
                 if c.dirty:
                     group.create_task(c.save())
 
+    @classmethod
+    def flush_all(cls):
+        """Synchronously write the journaled caches modifications (eg.: when interrupted)"""
+        for c in list(cls.__caches.values()):
+            if c.__journal is not None and c.dirty:
+                c.flush()
+
     @classmethod
     def get(cls, name) -> 'Cache':
         if name in cls.__caches:
@@ -28,8 +28,10 @@ class Uri:
     path: str
     fragment: str = ''
 
-    def __init__(self, path: str|Path) -> None:
+    def __init__(self, path: str|Path, scheme: str = 'file', fragment: str = '') -> None:
         self.path = str(path)
+        self.scheme = scheme
+        self.fragment = fragment
 
 @dataclass
 class Position:
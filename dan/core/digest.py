@@ -0,0 +1,61 @@
+import hashlib
+import os
+
+from dan.core.cache import Cache
+from dan.core.pathlib import Path
+
+
+enabled = False
+"""Content-digest up-to-date checks (opt-in via the *content_digest* setting)"""
+
+
+def file_digest(path: Path | str, chunk_size=1 << 16) -> str:
+    """Compute the sha1 digest of the given file's content"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class DigestDatabase(Cache[dict]):
+    """Persistent file digests database
+
+    Each entry is keyed by path and stores the size and the mtime (in ns) at which the
+    digest has been computed, so unchanged files are never re-hashed.
+    """
+
+    def digest(self, path: Path | str) -> str | None:
+        """Get the content digest of path (None if it does not exist or is not a regular file)"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        key = str(path)
+        entry = self.data.get(key)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        digest = file_digest(path)
+        self.data[key] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def remember(self, path: Path | str, st: os.stat_result, digest: str):
+        """Record the digest of path for the given status (avoids re-hashing a file known to be unchanged)"""
+        self.data[str(path)] = (st.st_size, st.st_mtime_ns, digest)
+
+    def digests(self, paths) -> dict[str, str]:
+        result = dict()
+        for path in paths:
+            digest = self.digest(path)
+            if digest is not None:
+                result[str(path)] = digest
+        return result
+
+
+def get_database(build_path: Path) -> DigestDatabase:
+    return DigestDatabase.instance(build_path / 'dan.digests', cache_name='digests', binary=True)
@@ -1,15 +1,16 @@
 from dan.core.pathlib import Path
-from dan.core import asyncio
+from dan.core import actioncache, asyncio
 from dan.core.target import Target, TargetDependencyLike
 from typing import Callable
 import inspect
 
 
 class generator:
-    def __init__(self, output: str, dependencies: TargetDependencyLike = None, options: dict = None):
+    def __init__(self, output: str, dependencies: TargetDependencyLike = None, options: dict = None, cacheable=False):
         self.output = Path(output)
         self.dependencies = list() if dependencies is None else dependencies
         self.options = dict() if options is None else options
+        self.cacheable = cacheable
 
     def __call__(self, fn: Callable):
         class Generator(Target):
@@ -17,6 +18,11 @@ class generator:
             output = self.output
             dependencies = set(self.dependencies)
             options = self.options
+            restat = True
+            cacheable = self.cacheable
+
+            def cache_recipe(self):
+                return actioncache.code_fingerprint(fn)
 
             def __build__(self):
                 arg_spec = inspect.getfullargspec(fn)
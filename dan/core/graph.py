@@ -0,0 +1,76 @@
+import typing as t
+
+
+_closures: dict[tuple[t.Any, t.Any], tuple] = dict()
+_users: dict[t.Any, set[tuple[t.Any, t.Any]]] = dict()
+
+
+def invalidate(target=None):
+    """Invalidate memoized closures walking through target (all closures if target is None)
+
+    Must be called when target's dependencies change.
+    """
+    if target is None:
+        _closures.clear()
+        _users.clear()
+        return
+    for key in _users.pop(target, ()):
+        _closures.pop(key, None)
+
+
+def closure(target, types=None) -> tuple:
+    """Transitive dependencies of target, in depth-first pre-order
+
+    When types is given only dependencies matching types are returned (and walked through).
+    Closures are memoized per (target, types) until a target they walk through is invalidated.
+    """
+    from dan.core.target import Target
+
+    key = (target, types)
+    result = _closures.get(key)
+    if result is not None:
+        return result
+    # guard against (unexpected) cycles
+    _closures[key] = ()
+    items = dict()
+    try:
+        for dep in target.dependencies.all:
+            if dep in items or not (types is None or isinstance(dep, types)):
+                continue
+            items[dep] = None
+            if isinstance(dep, Target):
+                for sub in closure(dep, types):
+                    items.setdefault(sub, None)
+    except BaseException:
+        # not memoized
+        del _closures[key]
+        raise
+    result = tuple(items)
+    _closures[key] = result
+    _users.setdefault(target, set()).add(key)
+    for item in result:
+        if isinstance(item, Target):
+            _users.setdefault(item, set()).add(key)
+    return result
+
+
+def topological_order(nodes: t.Iterable, edges: t.Callable[[t.Any], t.Iterable]) -> list:
+    """Order nodes (and the nodes they reach) so that each node comes after its edges' targets"""
+    order = list()
+    visited = set()
+    for node in nodes:
+        if node in visited:
+            continue
+        visited.add(node)
+        stack = [(node, iter(edges(node)))]
+        while stack:
+            current, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(edges(child))))
+                    break
+            else:
+                stack.pop()
+                order.append(current)
+    return order
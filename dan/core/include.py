@@ -6,10 +6,10 @@ import sys
 from dan.core.asyncio import sync_wait
 from dan.core.makefile import MakeFile
 from dan.core.pathlib import Path
-from dan.core.requirements import load_requirements
+from dan.core.register import TargetRegistry
+from dan.core.requirements import load_requirements, parse_requirement
 from dan.core.target import Target
 from dan.logging import Logging
-from dan.pkgconfig.package import parse_requirement
 
 
 class TargetNotFound(RuntimeError):
@@ -40,6 +40,7 @@ class Context(Logging):
         self.__ctx_stack: list[Context] = []
         self.__makefile_stack: list[MakeFile] = []
         self.__attributes = dict()
+        self.targets = TargetRegistry()
 
     @property
     def root(self):
@@ -0,0 +1,250 @@
+import math
+import os
+import time
+
+from dan.core.pathlib import Path
+
+
+enabled = False
+"""Adaptive job control (opt-in via the *adaptive_jobs* setting)"""
+
+
+_unlimited = 1 << 60
+
+
+def _read(path) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _read_int(path) -> int | None:
+    value = _read(path)
+    if value is None or value == 'max':
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    # cgroup v1 reports "unlimited" as a huge (page-rounded) value
+    return None if value < 0 or value >= _unlimited else value
+
+
+def _read_key(path, key: str) -> int | None:
+    """Read a 'key value' entry of a flat-keyed file (eg.: memory.events)"""
+    content = _read(path)
+    if content is None:
+        return None
+    for line in content.splitlines():
+        name, _, value = line.partition(' ')
+        if name == key:
+            return int(value)
+    return None
+
+
+class CGroup:
+    """Resource limits of the control group (v1 or v2) the current process belongs to
+
+    Limits are looked up in the process' own group first, then in the hierarchy roots
+    (containers usually mount their own group as root).
+    """
+
+    def __init__(self, root: Path | str = '/sys/fs/cgroup', proc_cgroup: Path | str = '/proc/self/cgroup') -> None:
+        self.root = Path(root)
+        self._groups = dict()
+        content = _read(proc_cgroup) or ''
+        for line in content.splitlines():
+            parts = line.split(':', 2)
+            if len(parts) == 3:
+                self._groups[parts[1]] = parts[2].lstrip('/')
+        self.cpu = self._find('cpu', ('cpu.max', 'cpu.cfs_quota_us'))
+        self.memory = self._find('memory', ('memory.max', 'memory.limit_in_bytes'))
+
+    def _find(self, controller: str, files: tuple[str, ...]) -> Path | None:
+        candidates = list()
+        for controllers, group in self._groups.items():
+            if controllers == '':
+                # v2 unified hierarchy
+                bases = [self.root, self.root / 'unified']
+            elif controller in controllers.split(','):
+                bases = [self.root / controllers, self.root / controller]
+            else:
+                continue
+            for base in bases:
+                candidates.extend([base / group, base])
+        candidates.extend([self.root, self.root / controller])
+        for directory in candidates:
+            for name in files:
+                if (directory / name).is_file():
+                    return directory
+        return None
+
+    @property
+    def cpu_quota(self) -> float | None:
+        """Number of CPUs the group may use (None if unlimited)"""
+        if self.cpu is None:
+            return None
+        content = _read(self.cpu / 'cpu.max')
+        if content is not None:
+            quota, _, period = content.partition(' ')
+            if quota == 'max':
+                return None
+            return int(quota) / int(period or 100000)
+        quota = _read_int(self.cpu / 'cpu.cfs_quota_us')
+        period = _read_int(self.cpu / 'cpu.cfs_period_us')
+        if quota is None or not period:
+            return None
+        return quota / period
+
+    @property
+    def memory_limit(self) -> int | None:
+        """Memory limit of the group in bytes (None if unlimited)"""
+        if self.memory is None:
+            return None
+        if (self.memory / 'memory.max').is_file():
+            return _read_int(self.memory / 'memory.max')
+        return _read_int(self.memory / 'memory.limit_in_bytes')
+
+    @property
+    def memory_usage(self) -> int | None:
+        if self.memory is None:
+            return None
+        if (self.memory / 'memory.current').is_file():
+            return _read_int(self.memory / 'memory.current')
+        return _read_int(self.memory / 'memory.usage_in_bytes')
+
+    @property
+    def oom_kills(self) -> int | None:
+        """Number of processes of the group killed by the OOM killer (None if not reported)"""
+        if self.memory is None:
+            return None
+        if (self.memory / 'memory.events').is_file():
+            return _read_key(self.memory / 'memory.events', 'oom_kill')
+        return _read_key(self.memory / 'memory.oom_control', 'oom_kill')
+
+
+_cgroup: CGroup = None
+
+
+def cgroup() -> CGroup:
+    global _cgroup
+    if _cgroup is None:
+        _cgroup = CGroup()
+    return _cgroup
+
+
+def _meminfo(key: str) -> int | None:
+    """Read a /proc/meminfo entry in bytes (None if not available)"""
+    content = _read('/proc/meminfo')
+    if content is None:
+        return None
+    for line in content.splitlines():
+        name, _, value = line.partition(':')
+        if name == key:
+            return int(value.split()[0]) * 1024
+    return None
+
+
+def available_memory(group: CGroup = None) -> int | None:
+    """Memory that can still be used by the build in bytes (None if unknown)"""
+    group = group or cgroup()
+    values = list()
+    limit = group.memory_limit
+    usage = group.memory_usage
+    if limit is not None and usage is not None:
+        values.append(max(0, limit - usage))
+    system = _meminfo('MemAvailable')
+    if system is not None:
+        values.append(system)
+    return min(values, default=None)
+
+
+def cpu_count(group: CGroup = None) -> int:
+    """Number of CPUs usable by the build (affinity and cgroup quota aware)"""
+    group = group or cgroup()
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = group.cpu_quota
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def default_jobs() -> int:
+    return cpu_count()
+
+
+link_memory = 2 << 30
+"""Memory expected to be used by a link (in bytes), used to size the link pool"""
+
+
+def default_link_jobs(maximum: int) -> int:
+    """Number of concurrent links the available memory allows (up to maximum)"""
+    available = available_memory()
+    if available is None:
+        return maximum
+    return max(1, min(maximum, available // link_memory))
+
+
+def oom_killed(returncode: int, oom_kills: int | None, group: CGroup = None) -> bool:
+    """Check whether a command returning returncode has been killed by the OOM killer
+
+    oom_kills is the group's OOM kill counter read before the command started: a SIGKILL is
+    attributed to the OOM killer only if the counter has increased (never when it is not reported).
+    """
+    # -9: killed process, 137: shell whose child has been killed
+    if returncode not in (-9, 137) or oom_kills is None:
+        return False
+    current = (group or cgroup()).oom_kills
+    return current is not None and current > oom_kills
+
+
+class JobController:
+    """Adjusts the number of concurrent jobs to the resources available while building
+
+    Resources are sampled at most every *interval* seconds: the limit shrinks (down to one job)
+    while the available memory is below the reserve or while the load not caused by the
+    build's own jobs exceeds the CPUs, and grows back one job at a time otherwise.
+    """
+
+    interval = 1.0
+
+    def __init__(self, maximum: int, group: CGroup = None) -> None:
+        self.maximum = maximum
+        self.group = group or cgroup()
+        self.cpus = cpu_count(self.group)
+        total = self.group.memory_limit or _meminfo('MemTotal') or 0
+        # keep 10% of the memory (up to 1 GiB) free
+        self.reserve = min(total // 10, 1 << 30)
+        self._last = None
+
+    def limit(self, current: int, running: int) -> int:
+        """Get the new jobs limit given the current one and the number of running jobs"""
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.interval:
+            return current
+        self._last = now
+        available = available_memory(self.group)
+        if available is not None and available < self.reserve:
+            return max(1, min(current, running) - 1)
+        load = _load_average()
+        if load is not None and load - running > self.cpus:
+            return max(1, current - 1)
+        if available is not None and available < 2 * self.reserve:
+            return current
+        return min(self.maximum, current + 1)
+
+    def on_oom(self, current: int) -> int:
+        """Get the new jobs limit after an OOM kill"""
+        return max(1, current // 2)
+
+
+def _load_average() -> float | None:
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
@@ -1,5 +1,4 @@
 from functools import cached_property
-import functools
 from pathlib import Path
 import sys
 
@@ -75,9 +74,7 @@ class MakeFile(sys.__class__, Logging):
             #     raise RuntimeError(f'duplicate target name: {t.fullname}')
             MakeFile.__target_fullnames.append(t.fullname)
             self.__targets.add(t)
-            self.__find.cache_clear()
-            for parent in self.parents:
-                parent.__find.cache_clear()
+            self.context.targets.add(t)
         if issubclass(cls, Test):
             # if t.fullname in MakeFile.__test_fullnames:
             #     raise RuntimeError(f'duplicate test name: {t.fullname}')
@@ -93,6 +90,7 @@ class MakeFile(sys.__class__, Logging):
                 if type(t) == cls:
                     stream = t._stream
                     self.__targets.remove(t)
+                    self.context.targets.remove(t)
                     new_instance = self.__find(new_cls)
                     new_instance._stream = stream
                     return new_cls
@@ -100,37 +98,53 @@ class MakeFile(sys.__class__, Logging):
         return decorator
 
 
-    @functools.cache
+    def __subtree_of(self, lineage: dict['MakeFile', int]) -> tuple[int, tuple[int, ...]] | None:
+        """Get the rank of this makefile in a lookup from lineage
+
+        The index (in lineage) of the closest ancestor this makefile descends from, then the path
+        (children indexes) from that ancestor: its own targets come first, then its children's
+        (depth-first).
+        """
+        m = self
+        path = list()
+        while m not in lineage:
+            # requirements makefiles are not their parent's children
+            if m.parent is None or m.name == 'dan-requires':
+                return None
+            path.append(m.parent.children.index(m))
+            m = m.parent
+        return lineage[m], tuple(reversed(path))
+
     def __find(self, name_or_class) -> Target:
-        if isinstance(name_or_class, type):
-            def check(t: Target):
-                return type(t) == name_or_class
-        else:
-            def check(t: Target):
-                return name_or_class in t.provides
-        for t in self.__targets:
-            if check(t):
-                return t
-        for c in self.children:
-            t = c.__find(name_or_class)
-            if t:
-                return t
+        candidates = self.context.targets.lookup(name_or_class)
+        if not candidates:
+            return None
+        lineage = {self: 0}
+        for index, parent in enumerate(self.parents, 1):
+            lineage[parent] = index
+        found = None
+        found_rank = None
+        for t in candidates:
+            rank = t.makefile.__subtree_of(lineage)
+            if rank is not None and (found_rank is None or rank < found_rank):
+                found = t
+                found_rank = rank
+                if rank == (0, ()):
+                    break
+        return found
 
     def find(self, name_or_class) -> Target:
         """Find a target.
 
+        Searches this makefile and its children first, then its parents' (recursively).
+
         Args:
             name (str): The target name to find.
 
         Returns:
             Target: The found target or None.
         """
-        t = self.__find(name_or_class)
-        if t is not None:
-            return t
-        
-        if self.parent:
-            return self.parent.find(name_or_class)
+        return self.__find(name_or_class)
 
     def __getitem__(self, name_or_class) -> Target:
         return self.find(name_or_class)
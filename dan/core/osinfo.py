@@ -286,7 +286,7 @@ class OSInfo(object):
     def _get_aix_architecture():
         processor = platform.processor()
         if "powerpc" in processor:
-            kernel_bitness = OSInfo()._get_aix_conf("KERNEL_BITMODE")
+            kernel_bitness = info._get_aix_conf("KERNEL_BITMODE")
             if kernel_bitness:
                 return "ppc64" if kernel_bitness == "64" else "ppc32"
         elif "rs6000" in processor:
@@ -341,7 +341,7 @@ class OSInfo(object):
     @staticmethod
     def uname(options=None):
         options = " %s" % options if options else ""
-        if not OSInfo().is_windows:
+        if not info.is_windows:
             raise RuntimeError("Command only for Windows operating system")
         custom_bash_path = OSInfo.bash_path()
         if not custom_bash_path:
@@ -359,7 +359,7 @@ class OSInfo(object):
     @staticmethod
     def _get_aix_conf(options=None):
         options = " %s" % options if options else ""
-        if not OSInfo().is_aix:
+        if not info.is_aix:
             raise RuntimeError("Command only for AIX operating system")
 
         try:
@@ -371,7 +371,7 @@ class OSInfo(object):
     @staticmethod
     def _detect_windows_subsystem():
         from conans.client.tools.win import CYGWIN, MSYS2, MSYS, WSL
-        if OSInfo().is_linux:
+        if info.is_linux:
             try:
                 # https://github.com/Microsoft/WSL/issues/423#issuecomment-221627364
                 with open("/proc/sys/kernel/osrelease") as f:
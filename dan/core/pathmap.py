@@ -0,0 +1,101 @@
+import os
+import re
+
+from dan.core.pathlib import Path
+
+
+source_placeholder = '<src>'
+build_placeholder = '<build>'
+
+# paths start at the beginning of the value, after a separator (eg.: '=' or ',')
+# or after a short option (eg.: '-I')
+_path_start = r'(?:^|(?<=[^\w./-])|(?<=-[A-Za-z]))'
+
+
+class PathMap:
+    """Source and build roots placeholders
+
+    Used to make fingerprints and cached paths independent from the location of the
+    source and build trees.
+    """
+
+    def __init__(self, source_root: Path = None, build_root: Path = None) -> None:
+        self.source_root = source_root
+        self.build_root = build_root
+        self._roots: dict[str, str] = dict()
+        self._placeholders: dict[str, str] = dict()
+        for root, placeholder in ((source_root, source_placeholder), (build_root, build_placeholder)):
+            if root is None:
+                continue
+            root = Path(root)
+            self._placeholders[placeholder] = str(root.absolute())
+            # the roots may be given relative to the working directory
+            for variant in (str(root), str(root.absolute())):
+                self._roots.setdefault(variant, placeholder)
+        if self._roots:
+            # most specific first (the build root may be inside the source root)
+            roots = sorted(self._roots, key=len, reverse=True)
+            self._normalize_expr = re.compile(
+                _path_start + '(?:' + '|'.join(re.escape(root) for root in roots) + r')(?![\w.-])')
+            self._expand_expr = re.compile('|'.join(re.escape(p) for p in self._placeholders))
+        else:
+            self._normalize_expr = None
+            self._expand_expr = None
+
+    def normalize(self, value: str) -> str:
+        """Replace the roots by their placeholders"""
+        if self._normalize_expr is None:
+            return value
+        return self._normalize_expr.sub(lambda m: self._roots[m[0]], value)
+
+    def expand(self, value: str) -> str:
+        """Replace the placeholders by their (absolute) roots"""
+        if self._expand_expr is None:
+            return value
+        return self._expand_expr.sub(lambda m: self._placeholders[m[0]], value)
+
+    def prefix_map(self) -> dict[str, str]:
+        """Roots replacements for the compilers' prefix-map options (least specific first)
+
+        The source root is mapped to '.', the build root to its path relative to the source root.
+        """
+        result = dict()
+        source_root = Path(self.source_root).absolute() if self.source_root is not None else None
+        if source_root is not None:
+            result[str(source_root)] = '.'
+        if self.build_root is not None:
+            build_root = Path(self.build_root).absolute()
+            relative = os.path.relpath(build_root, source_root) if source_root is not None else '.'
+            result[str(build_root)] = Path(relative).as_posix()
+            if source_root is not None and build_root in source_root.parents:
+                # the source root is inside the build root: it is the most specific
+                result = dict(reversed(result.items()))
+        return result
+
+
+_current = PathMap()
+
+
+def configure(source_root: Path, build_root: Path):
+    global _current
+    _current = PathMap(source_root, build_root)
+
+
+def current() -> PathMap:
+    return _current
+
+
+def normalize(value: str | Path) -> str:
+    return _current.normalize(str(value))
+
+
+def expand(value: str) -> str:
+    return _current.expand(value)
+
+
+def normalize_all(values) -> list[str]:
+    return [_current.normalize(str(value)) for value in values]
+
+
+def expand_all(values) -> list[str]:
+    return [_current.expand(value) for value in values]
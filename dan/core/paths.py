@@ -0,0 +1,18 @@
+import functools
+import os
+
+from dan.core.pathlib import Path
+
+
+_home_var = 'USERPROFILE' if os.name == 'nt' else 'HOME'
+
+
+@functools.cache
+def get_dan_path():
+    path = Path(os.getenv('DAN_DATA', os.getenv(_home_var))) / '.dan'
+    path.mkdir(exist_ok=True, parents=False)
+    return path
+
+
+def get_toolchain_path():
+    return get_dan_path() / 'toolchains.dat'
@@ -10,7 +10,7 @@ class ReMatch:
     def __init__(self, s: str, fn: Callable[[re.Pattern, str], re.Match]) -> None:
         self._s = s
         self._fn = fn
-        self._m = re.Match = None
+        self._m: re.Match = None
 
     __match_args__ = ('_s', '_m')
 
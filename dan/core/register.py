@@ -24,3 +24,42 @@ class MakefileRegister:
     def makefile(self, value):
         assert self.__makefile is None, 'makefile should be set once'
         self.__makefile = value
+
+
+class TargetRegistry:
+    """Context-wide targets index
+
+    Targets are indexed by fullname, by provided name and by class;
+    lookups return targets in registration order.
+    """
+
+    def __init__(self) -> None:
+        self.__by_fullname: dict[str, object] = dict()
+        self.__by_provided: dict[str, dict] = dict()
+        self.__by_class: dict[type, dict] = dict()
+
+    def add(self, target):
+        self.__by_fullname[target.fullname] = target
+        for provided in target.provides:
+            self.__by_provided.setdefault(provided, dict())[target] = None
+        self.__by_class.setdefault(type(target), dict())[target] = None
+
+    def remove(self, target):
+        if self.__by_fullname.get(target.fullname) is target:
+            del self.__by_fullname[target.fullname]
+        for provided in target.provides:
+            self.__by_provided.get(provided, dict()).pop(target, None)
+        self.__by_class.get(type(target), dict()).pop(target, None)
+
+    def get(self, fullname: str):
+        """Get target by fullname"""
+        return self.__by_fullname.get(fullname)
+
+    def lookup(self, name_or_class) -> list:
+        """Get targets providing name (or of exact class)"""
+        if isinstance(name_or_class, type):
+            return list(self.__by_class.get(name_or_class, ()))
+        return list(self.__by_provided.get(name_or_class, ()))
+
+    def __len__(self):
+        return len(self.__by_fullname)
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+
+from dan.core.pathlib import Path
+from dan.logging import Logging
+
+
+def file_digest(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 16):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class RemoteStore(Logging):
+    """Remote actions cache speaking the bazel-remote HTTP protocol
+
+    Entries are json documents stored as ``<url>/ac/<key>``, they describe the output files
+    whose contents are stored as ``<url>/cas/<sha256>``. Requests are made concurrently,
+    at most *jobs* at a time.
+    Any failure disables the remote cache for the rest of the session: the build goes on with
+    the local cache only.
+    """
+
+    timeout = 30
+
+    def __init__(self, url: str, read_only=False, jobs=8) -> None:
+        self.url = url.rstrip('/')
+        self.read_only = read_only
+        self.jobs = jobs
+        self.available = True
+        self._session = None
+        self._semaphore: asyncio.Semaphore = None
+
+    def __str__(self) -> str:
+        return self.url
+
+    async def _request(self, method: str, kind: str, key: str, **kwds) -> tuple[int, bytes]:
+        """Run a request, returns the response status and body (None on failure)"""
+        if not self.available:
+            return None, None
+        import aiohttp
+        if self._session is None:
+            timeout = aiohttp.ClientTimeout(total=None, connect=self.timeout, sock_read=self.timeout)
+            self._session = aiohttp.ClientSession(timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.jobs)
+        url = f'{self.url}/{kind}/{key}'
+        try:
+            async with self._semaphore, self._session.request(method, url, **kwds) as resp:
+                if resp.status < 500 and resp.status not in (401, 403):
+                    body = await resp.read() if method == 'GET' and resp.status == 200 else None
+                    return resp.status, body
+                error = f'{resp.status} {resp.reason}'
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as err:
+            error = str(err) or type(err).__name__
+        if self.available:
+            self.warning('%s %s failed (%s), remote cache disabled', method, url, error)
+            self.available = False
+        return None, None
+
+    async def contains(self, kind: str, keys: list[str]) -> set[str]:
+        """Check which keys exist (in a single batch of concurrent requests)"""
+        async def check(key):
+            status, _ = await self._request('HEAD', kind, key)
+            return status == 200
+
+        found = await asyncio.gather(*[check(key) for key in keys])
+        return {key for key, exists in zip(keys, found) if exists}
+
+    async def get(self, kind: str, key: str) -> bytes | None:
+        _, body = await self._request('GET', kind, key)
+        return body
+
+    async def download(self, digest: str, dest: Path) -> bool:
+        """Download a content (checking its digest) to dest"""
+        content = await self.get('cas', digest)
+        if content is None or hashlib.sha256(content).hexdigest() != digest:
+            return False
+        dest.write_bytes(content)
+        return True
+
+    async def put(self, kind: str, key: str, data: bytes) -> bool:
+        if self.read_only:
+            return False
+        status, _ = await self._request('PUT', kind, key, data=data)
+        return status in (200, 201, 204)
+
+    async def upload(self, path: Path, digest: str) -> bool:
+        return await self.put('cas', digest, path.read_bytes())
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
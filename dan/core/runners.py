@@ -1,12 +1,19 @@
 
-import io
+import collections
+import contextlib
+import contextvars
+import heapq
+import itertools
 import logging
 import os
 from pathlib import Path
 import subprocess
 import sys
+import tempfile
+import time
 
 import asyncio
+from dan.core import jobcontrol, trace
 from dan.core.terminal import write as term_write
 
 
@@ -21,70 +28,254 @@ class CommandError(RuntimeError):
 _encoding = 'cp1252' if os.name == 'nt' else 'utf-8'
 
 
-async def log_stream(stream, *files):
-    with stream as lines:
-        async for line in lines:
-            for file in files:
-                if file in [sys.stdout, sys.stderr]:
-                    term_write(line, end='') #, file=file)
-                else:
-                    file.write(line)
+output_memory_limit = 1 << 20
+"""Output of a command kept in memory (in bytes, per stream), the remaining is spilled to a temporary file"""
+
+output_value_limit = 1 << 20
+"""Output of a command returned (in bytes, per stream), the middle of longer outputs is elided"""
+
 
+class OutputStream:
+    """Output stream of a subprocess
+
+    The stream is read by large chunks, retained as bytes (see :data:`output_memory_limit`)
+    and optionally echoed to the terminal (complete lines only).
+    Consumers (``with stream as lines: async for line in lines``) get references to the chunks
+    read and split them into lines when they pull them; they have to be registered before
+    :meth:`consume` starts.
+    """
 
-class AsyncStreamProducer:
-    
-    class Iterator:
+    chunk_size = 64 << 10
+
+    class Lines:
         def __init__(self) -> None:
-            self.q = asyncio.Queue()
+            self._chunks: collections.deque[bytes | None] = collections.deque()
+            self._available = asyncio.Event()
+
+        def _push(self, chunk: bytes | None):
+            self._chunks.append(chunk)
+            self._available.set()
 
         async def __aiter__(self):
+            partial = b''
             while True:
-                try:
-                    line = await self.q.get()
-                except asyncio.CancelledError:
+                if not self._chunks:
+                    self._available.clear()
+                    await self._available.wait()
+                chunk = self._chunks.popleft()
+                if chunk is None:
+                    if partial:
+                        yield partial.decode(_encoding, errors='replace')
                     return
-                if line is None:
-                    self.q.task_done()
-                    return
-                yield line
-                self.q.task_done()
-
-    def __init__(self, stream) -> None:
+                start = 0
+                while True:
+                    pos = chunk.find(b'\n', start)
+                    if pos < 0:
+                        break
+                    line = chunk[start:pos + 1]
+                    if partial:
+                        line = partial + line
+                        partial = b''
+                    yield line.decode(_encoding, errors='replace')
+                    start = pos + 1
+                if start < len(chunk):
+                    partial += chunk[start:]
+
+    def __init__(self, stream: asyncio.StreamReader, echo=False) -> None:
         self.stream = stream
-        self.__iterators: list[AsyncStreamProducer.Iterator] = list()
+        self.echo = echo
+        self._retained = tempfile.SpooledTemporaryFile(max_size=output_memory_limit)
+        self._readers: list[OutputStream.Lines] = list()
 
-    async def __notify(self, data):
-        asyncio.gather(*[it.q.put(data) for it in self.__iterators])
-        asyncio.gather(*[it.q.join() for it in self.__iterators])
-    
     async def consume(self):
-        while not self.stream.at_eof():
-            data = await self.stream.readline()
-            if len(data) == 0:
-                continue
-            line = data.decode(_encoding)
-            await self.__notify(line)
+        pending = b''
+        try:
+            while True:
+                chunk = await self.stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                self._retained.write(chunk)
+                for reader in self._readers:
+                    reader._push(chunk)
+                if self.echo:
+                    pos = chunk.rfind(b'\n')
+                    if pos < 0:
+                        pending += chunk
+                    else:
+                        term_write((pending + chunk[:pos + 1]).decode(_encoding, errors='replace'), end='')
+                        pending = chunk[pos + 1:]
+            if self.echo and pending:
+                term_write(pending.decode(_encoding, errors='replace'))
+        finally:
+            for reader in self._readers:
+                reader._push(None)
+
+    def getvalue(self) -> str:
+        """Retained output (see :data:`output_value_limit`)"""
+        size = self._retained.tell()
+        self._retained.seek(0)
+        if size <= output_value_limit:
+            value = self._retained.read()
+        else:
+            half = output_value_limit // 2
+            value = self._retained.read(half)
+            value += b'\n[... %d bytes truncated ...]\n' % (size - 2 * half)
+            self._retained.seek(size - half)
+            value += self._retained.read()
+        self._retained.close()
+        return value.decode(_encoding, errors='replace')
 
-        await self.__notify(None)
-    
     def __enter__(self):
-        it = self.Iterator()
-        self.__iterators.append(it)
+        it = self.Lines()
+        self._readers.append(it)
         return it
 
     def __exit__(self, *exc):
         pass
 
 
-_jobs_sem: asyncio.Semaphore = None
+class Job:
+    """Action context of the running target
+
+    Carries the scheduling priority and the pool weights of the commands issued
+    by a target and accumulates the time spent running them.
+    """
+    def __init__(self, name: str, priority: float = 0.0, weights: dict[str, int] = None) -> None:
+        self.name = name
+        self.priority = priority
+        self.weights = weights or dict()
+        self.elapsed = 0.0
+
+
+current_job: contextvars.ContextVar[Job] = contextvars.ContextVar('current_job', default=None)
+
+
+class JobQueue:
+    """Priority-aware job admission
+
+    Jobs whose total weight is up to *count* run concurrently (a job heavier than
+    *count* runs alone), waiting jobs are admitted by decreasing priority
+    (FIFO for equal priorities).
+    When job control is enabled, *count* is adjusted (up to its initial value)
+    to the available resources (see :class:`jobcontrol.JobController`).
+    """
+    def __init__(self, count: int) -> None:
+        self.count = count
+        self.running = 0
+        self._waiters: list[tuple[float, int, int, asyncio.Future]] = list()
+        self._counter = itertools.count()
+        self._controller = jobcontrol.JobController(count) if jobcontrol.enabled else None
+
+    @property
+    def controller(self) -> jobcontrol.JobController:
+        if self._controller is None:
+            self._controller = jobcontrol.JobController(self.count)
+        return self._controller
+
+    def _adapt(self):
+        if jobcontrol.enabled:
+            self._set_count(self.controller.limit(self.count, self.running))
+
+    def _set_count(self, count: int):
+        if count != self.count:
+            self.count = count
+            self._admit()
+
+    def reduce_on_oom(self):
+        """Reduce parallelism after a job has been killed by the OOM killer"""
+        self._set_count(self.controller.on_oom(self.count))
+
+    def _fits(self, weight: int) -> bool:
+        return self.running == 0 or self.running + weight <= self.count
+
+    async def acquire(self, priority: float = 0.0, weight: int = 1):
+        self._adapt()
+        if not self._waiters and self._fits(weight):
+            self.running += weight
+            self._trace()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._counter), weight, future))
+        self._trace()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # admitted while being cancelled
+                self.release(weight)
+            raise
+
+    def release(self, weight: int = 1):
+        self.running -= weight
+        self._admit()
+
+    def _admit(self):
+        while self._waiters:
+            _, _, weight, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._fits(weight):
+                break
+            heapq.heappop(self._waiters)
+            self.running += weight
+            future.set_result(None)
+        self._trace()
+
+    def _trace(self):
+        trace.counter('jobs', 'job queue', running=self.running, waiting=len(self._waiters))
+
+
+_jobs: JobQueue = None
 
 
 def max_jobs(count=1):
-    global _jobs_sem
+    global _jobs
     if count > 0:
-        _jobs_sem = asyncio.Semaphore(count)
+        _jobs = JobQueue(count)
     else:
-        _jobs_sem = None
+        _jobs = None
+
+
+_pools: dict[str, JobQueue] = dict()
+
+
+def configure_pools(sizes: dict[str, int]):
+    """Setup the resource pools (eg.: compile, link) with their maximum weight of concurrent actions"""
+    _pools.clear()
+    for name, size in sizes.items():
+        if size > 0:
+            _pools[name] = JobQueue(size)
+
+
+def get_pool(name: str) -> JobQueue | None:
+    return _pools.get(name)
+
+
+@contextlib.asynccontextmanager
+async def use_pool(name: str, weight: int = 1):
+    """Hold a slot of the given pool (and a job) for the duration of the context"""
+    job = current_job.get()
+    job_name = 'action' if job is None else job.name
+    priority = 0.0 if job is None else job.priority
+    if job is not None:
+        weight = job.weights.get(name, weight)
+    pool = _pools.get(name)
+    if pool is not None:
+        with trace.slice(f'{name} pool', job_name):
+            await pool.acquire(priority, weight)
+    try:
+        if _jobs is not None:
+            with trace.slice('job queue', job_name):
+                await _jobs.acquire(priority)
+        try:
+            yield
+        finally:
+            if _jobs is not None:
+                _jobs.release()
+    finally:
+        if pool is not None:
+            pool.release(weight)
 
 def cmdline2list(s: str):
     """
@@ -152,6 +343,26 @@ def cmdline2list(s: str):
 
     return result
 
+def list2argv(command: list) -> list[str]:
+    """Arguments vector of a command given as a list"""
+    return [part.as_posix() if isinstance(part, Path) else str(part) for part in command]
+
+
+class Environ(dict):
+    """Complete environment block of a command (passed as is to the child process)"""
+
+
+def environ(env: dict[str, str] = None) -> Environ:
+    """Get the complete environment block made of the current process' one updated with env
+
+    Computing it once (eg.: per toolchain) avoids copying os.environ for each command.
+    """
+    result = Environ(os.environ)
+    if env:
+        result.update(env)
+    return result
+
+
 def list2cmdline(command: list|str):
     if isinstance(command, list):
         cmd = list()
@@ -164,100 +375,138 @@ def list2cmdline(command: list|str):
     return command
 
 
-async def async_run(command, log=True, logger: logging.Logger = None, no_raise=False, env=None, cwd=None, out_capture=None, err_capture=None, all_capture=None, input: str = None) -> tuple[str, str, int]:
-    if _jobs_sem is not None:
-        await _jobs_sem.acquire()
-    try:
-        command = list2cmdline(command)
-        if env is not None:
-            e = dict(os.environ)
-            for k, v in env.items():
-                e[k] = v
-            env = e
-        if input is not None:
-            stdin = asyncio.subprocess.PIPE
-        else:
-            stdin = None
-        if logger is not None:
-            logger.debug('executing: %s', command)
+oom_retries = 2
+"""Number of times a command killed by the OOM killer is retried (at reduced parallelism)"""
+
+
+async def async_run(command, log=True, logger: logging.Logger = None, no_raise=False, env=None, cwd=None, out_capture=None, err_capture=None, all_capture=None, input: str = None, pool: str = None, weight: int = 1) -> tuple[str, str, int]:
+    job = current_job.get()
+    job_name = 'command' if job is None else job.name
+    if isinstance(command, str):
+        argv = None
+    else:
+        # executed without shell
+        argv = list2argv(command)
+        command = subprocess.list2cmdline(argv)
+    retries = 0
+    while True:
+        async with use_pool(pool, weight):
+            # only read when a retry is possible (adaptive job control)
+            retry = jobcontrol.enabled and _jobs is not None and retries < oom_retries
+            oom_kills = jobcontrol.cgroup().oom_kills if retry else None
+            start = time.perf_counter()
+            try:
+                with trace.slice('jobs', job_name, command=command):
+                    out, err, rc = await _async_run(command, argv, log, logger, env, cwd, out_capture, err_capture, all_capture, input)
+            finally:
+                if job is not None:
+                    job.elapsed += time.perf_counter() - start
+        if rc != 0 and retry and jobcontrol.oom_killed(rc, oom_kills):
+            retries += 1
+            _jobs.reduce_on_oom()
+            if logger:
+                logger.warning('command killed by the OOM killer, retrying with %d jobs: %s', _jobs.count, command)
+            continue
+        break
+    if rc != 0 and not no_raise:
+        message = f'command returned {rc}: {command}\n{out}\n{err}'
+        if logger:
+            logger.error(message)
+        raise CommandError(message, rc, out, err)
+    return out, err, rc
+
+
+async def _async_run(command: str, argv: list[str] | None, log, logger: logging.Logger, env, cwd, out_capture, err_capture, all_capture, input: str) -> tuple[str, str, int]:
+    if env is not None and not isinstance(env, Environ):
+        env = environ(env)
+    if input is not None:
+        stdin = asyncio.subprocess.PIPE
+    else:
+        stdin = None
+    if logger is not None:
+        logger.debug('executing: %s', command)
+    if argv is None:
         proc = await asyncio.subprocess.create_subprocess_shell(command,
                                                                 stdout=asyncio.subprocess.PIPE,
                                                                 stderr=asyncio.subprocess.PIPE,
                                                                 stdin=stdin,
                                                                 env=env,
                                                                 cwd=cwd)
-        out = io.StringIO()
-        err = io.StringIO()
-        outs = [out]
-        errs = [err]
-        if log:
-            outs.append(sys.stdout)
-            errs.append(sys.stderr)
-
-        out_iter = AsyncStreamProducer(proc.stdout)
-        err_iter = AsyncStreamProducer(proc.stderr)
-
-        futures = [
-            log_stream(out_iter, *outs),
-            log_stream(err_iter, *errs),
-        ]
-
-        if all_capture is not None:
-            out_capture = err_capture = all_capture
-
-        if out_capture is not None:
-            futures.append(out_capture(out_iter))
-
-        if err_capture is not None:
-            futures.append(out_capture(err_iter))
-
-        futures.extend([
-            out_iter.consume(),
-            err_iter.consume(),
-        ])
-        
-        if input is not None:
-            proc.stdin.write(input.encode())
-            proc.stdin.write_eof()
-    
-        await asyncio.gather(
-            *futures,
-            proc.wait())
-        # make sure return code is available
-        await proc.communicate()
-        out = out.getvalue()
-        err = err.getvalue()
-        if proc.returncode != 0 and not no_raise:
-            message = f'command returned {proc.returncode}: {command}\n{out}\n{err}'
-            if logger:
-                logger.error(message)
-            raise CommandError(message, proc.returncode, out, err)
-        return out, err, proc.returncode
-    finally:
-        if _jobs_sem is not None:
-            _jobs_sem.release()
-
-
-def sync_run(command, pipe=True, logger: logging.Logger = None, no_raise=False, shell=True, env=None, cwd=None):
-    command = list2cmdline(command)
+    else:
+        try:
+            proc = await asyncio.subprocess.create_subprocess_exec(*argv,
+                                                                   stdout=asyncio.subprocess.PIPE,
+                                                                   stderr=asyncio.subprocess.PIPE,
+                                                                   stdin=stdin,
+                                                                   env=env,
+                                                                   cwd=cwd)
+        except (FileNotFoundError, PermissionError) as err:
+            # reported as a shell would do
+            return '', f'{argv[0]}: {err.strerror}\n', 127 if isinstance(err, FileNotFoundError) else 126
+    out = OutputStream(proc.stdout, echo=log)
+    err = OutputStream(proc.stderr, echo=log)
+
+    if all_capture is not None:
+        out_capture = err_capture = all_capture
+
+    # consumers first (registered before the streams are consumed)
+    futures = list()
+    if out_capture is not None:
+        futures.append(out_capture(out))
+    if err_capture is not None:
+        futures.append(err_capture(err))
+    futures.extend([
+        out.consume(),
+        err.consume(),
+    ])
+
+    if input is not None:
+        proc.stdin.write(input.encode())
+        proc.stdin.write_eof()
+
+    await asyncio.gather(
+        *futures,
+        proc.wait())
+    return out.getvalue(), err.getvalue(), proc.returncode
+
+
+def sync_run(command, pipe=True, logger: logging.Logger = None, no_raise=False, shell=None, env=None, cwd=None):
+    if shell is None:
+        # commands given as lists are executed without shell
+        shell = isinstance(command, str)
+    if shell:
+        command = list2cmdline(command)
+        args = command
+    else:
+        args = list2argv(command)
+        command = subprocess.list2cmdline(args)
     if pipe:
         stdout = subprocess.PIPE
     else:
         stdout = None
     if logger:
         logger.debug(f'executing: {command}')
-    if env:
-        e = dict(os.environ)
-        for k, v in env.items():
-            e[k] = v
-        env = e
-    proc = subprocess.Popen(command,
-                            stdout=stdout,
-                            stderr=stdout,
-                            shell=shell,
-                            env=env,
-                            cwd=cwd,
-                            universal_newlines=True)
+    if env and not isinstance(env, Environ):
+        env = environ(env)
+    try:
+        proc = subprocess.Popen(args,
+                                stdout=stdout,
+                                stderr=stdout,
+                                shell=shell,
+                                env=env,
+                                cwd=cwd,
+                                universal_newlines=True)
+    except (FileNotFoundError, PermissionError) as err:
+        if shell:
+            raise
+        # reported as a shell would do
+        returncode = 127 if isinstance(err, FileNotFoundError) else 126
+        message = f'command returned {returncode}: {command}\n{err.strerror}'
+        if not no_raise:
+            if logger:
+                logger.error(message)
+            raise CommandError(message, returncode, None, err.strerror)
+        return None, err.strerror, returncode
     out, err = proc.communicate()
     if proc.returncode != 0 and not no_raise:
         message = f'command returned {proc.returncode}: {command}\n{err if err else ""}'
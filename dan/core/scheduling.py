@@ -0,0 +1,66 @@
+from collections.abc import Iterable
+
+from dan.core import graph
+from dan.core.cache import Cache
+from dan.core.pathlib import Path
+from dan.core.target import Target
+from dan.core.requirements import RequiredPackage
+
+
+class DurationHistory(Cache[dict]):
+    """Durations of targets' actions recorded in earlier builds (in seconds)
+
+    Values are smoothed (exponential moving average) so that a single slow
+    build does not reorder the next ones.
+    """
+
+    smoothing = 0.5
+
+    def get(self, name: str, default: float = None) -> float:
+        return self.data.get(name, default)
+
+    def record(self, name: str, duration: float):
+        previous = self.data.get(name)
+        if previous is not None:
+            duration = previous + self.smoothing * (duration - previous)
+        self.data[name] = duration
+
+
+def get_history(build_path: Path) -> DurationHistory:
+    return DurationHistory.instance(build_path / 'dan.durations', cache_name='durations', binary=True)
+
+
+def build_dependencies(target: Target):
+    """Targets target depends on (resolved requirements included)"""
+    for dep in {*target.dependencies.all, *target.preload_dependencies.all}:
+        if isinstance(dep, RequiredPackage):
+            dep = dep.target
+        if isinstance(dep, Target):
+            yield dep
+
+
+def assign_priorities(targets: Iterable[Target], history: DurationHistory):
+    """Assign each target its remaining critical-path length as priority
+
+    The remaining critical-path length of a target is its own (estimated) duration
+    plus the longest remaining critical-path of the targets depending on it.
+    Durations come from the history when available, :meth:`Target.estimated_duration`
+    is used otherwise.
+    Subtargets (eg.: objects) are taken into account, their parent being their dependent.
+    """
+    order = graph.topological_order(targets, lambda t: [*build_dependencies(t), *t.subtargets])
+    dependents: dict[Target, list[Target]] = {target: list() for target in order}
+    for target in order:
+        for dep in (*build_dependencies(target), *target.subtargets):
+            dependents[dep].append(target)
+
+    priorities: dict[Target, float] = dict()
+    # dependents first
+    for target in reversed(order):
+        duration = history.get(target.fullname)
+        if duration is None:
+            duration = target.estimated_duration
+        priority = duration + max((priorities.get(t, 0.0) for t in dependents[target]), default=0.0)
+        priorities[target] = priority
+        target.priority = priority
+    return priorities
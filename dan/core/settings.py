@@ -57,11 +57,37 @@ class ToolchainSettings:
     cxx_flags: list[str] = field(default_factory=lambda: list())
     default_library_type: DefaultLibraryType = DefaultLibraryType.static
 
+@dataclass
+class PoolSettings:
+    """Maximum weight of concurrent actions in each resource pool (0: automatic)"""
+    compile: int = 0
+    link: int = 0
+    archive: int = 0
+    test: int = 0
+    download: int = 4
+
+@dataclass
+class ActionCacheSettings:
+    """Content-addressed cache of the actions outputs (eg.: compiled objects)"""
+    enabled: bool = False
+    path: str = ''
+    max_size: int = 5120
+    remote: str = ''
+    remote_read_only: bool = False
+    remote_jobs: int = 8
+    prefix_map: bool = True
+
 @dataclass
 class Settings:
     build_type: BuildType = BuildType.debug
     install: InstallSettings = field(default_factory=lambda: InstallSettings())
     target: ToolchainSettings = field(default_factory=lambda: ToolchainSettings())
+    pools: PoolSettings = field(default_factory=lambda: PoolSettings())
+    action_cache: ActionCacheSettings = field(default_factory=lambda: ActionCacheSettings())
+    content_digest: bool = False
+    streaming: bool = False
+    adaptive_jobs: bool = False
+    cache_compression: bool = False
 
 
 def safe_load(name: str, value,  t: type):
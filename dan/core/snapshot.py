@@ -0,0 +1,146 @@
+import hashlib
+import os
+
+from dan.core.cache import Cache
+from dan.core.pathlib import Path
+from dan.core.target import FileDependency, Target
+from dan.core.requirements import RequiredPackage
+
+
+def _stat_key(path: str):
+    try:
+        st = os.stat(path)
+        return f'{path}:{st.st_size}:{st.st_mtime_ns}'
+    except OSError:
+        return f'{path}:missing'
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def fingerprint(inputs: bytes, files: list[str]) -> str:
+    """Fingerprint the given inputs and the state of the given files"""
+    sha1 = hashlib.sha1(inputs)
+    for path in files:
+        sha1.update(_stat_key(path).encode())
+    return sha1.hexdigest()
+
+
+def _output_path(target: Target) -> str | None:
+    if isinstance(target, RequiredPackage):
+        target = target.target
+        if target is None:
+            return None
+    path = Target._digest_path(target)
+    return None if path is None else str(path)
+
+
+class GraphSnapshot(Cache[dict]):
+    """Resolved build graph persisted in the build directory
+
+    The graph is reduced to its file-level view: each node maps an output to its
+    input files (sources, headers, dependencies' outputs), paths being interned
+    in a single table. It allows to detect no-op builds without loading any makefile,
+    as long as the fingerprint (makefiles and their modules, settings, toolchains,
+    source directories, dan version) is unchanged.
+
+    The modification times are recorded after each full build: outputs may be kept
+    older than their inputs (content digest unchanged, restat), such nodes being
+    up-to-date as long as none of their files changed since.
+    """
+
+    def matches(self, inputs: bytes) -> bool:
+        files = self.data.get('files')
+        if files is None:
+            return False
+        return self.data.get('fingerprint') == fingerprint(inputs, files)
+
+    def record(self, inputs: bytes, files: list[str], targets: list[Target]):
+        paths: dict[str, int] = dict()
+
+        def index(path: str):
+            if path not in paths:
+                paths[path] = len(paths)
+            return paths[path]
+
+        nodes = list()
+        seen = set()
+
+        def visit(target: Target):
+            if target in seen:
+                return
+            seen.add(target)
+            output = _output_path(target)
+            inputs = list()
+            for dep in target.dependencies.all:
+                if isinstance(dep, RequiredPackage) and dep.target is not None:
+                    dep = dep.target
+                if isinstance(dep, Target):
+                    visit(dep)
+                path = _output_path(dep) if isinstance(dep, (Target, FileDependency)) else None
+                if path is not None:
+                    inputs.append(index(path))
+            for sub in target.subtargets:
+                visit(sub)
+                path = _output_path(sub)
+                if path is not None:
+                    inputs.append(index(path))
+            for dep in target.preload_dependencies.all:
+                if isinstance(dep, Target):
+                    visit(dep)
+            if output is not None and os.path.exists(output):
+                nodes.append((index(output), inputs))
+
+        for target in targets:
+            visit(target)
+
+        self.data.clear()
+        self.data['fingerprint'] = fingerprint(inputs, files)
+        self.data['files'] = list(files)
+        self.data['paths'] = list(paths.keys())
+        self.data['mtimes'] = [_mtime(path) for path in paths]
+        self.data['nodes'] = nodes
+
+    def up_to_date(self) -> bool:
+        """Check (on the file-level graph) that all nodes are up-to-date"""
+        paths = self.data.get('paths')
+        nodes = self.data.get('nodes')
+        if paths is None or nodes is None:
+            return False
+        recorded = self.data.get('mtimes')
+        if recorded is None or len(recorded) != len(paths):
+            recorded = [None] * len(paths)
+        mtimes: list[int] = [None] * len(paths)
+
+        def mtime(index: int):
+            value = mtimes[index]
+            if value is None:
+                value = mtimes[index] = _mtime(paths[index])
+            return value
+
+        def unchanged(index: int):
+            return mtime(index) == recorded[index]
+
+        for output, inputs in nodes:
+            output_mtime = mtime(output)
+            if output_mtime < 0:
+                return False
+            if unchanged(output) and all(unchanged(input) for input in inputs):
+                # checked by the last full build
+                continue
+            for input in inputs:
+                input_mtime = mtime(input)
+                if input_mtime < 0 or input_mtime > output_mtime:
+                    return False
+        return True
+
+    def invalidate(self):
+        self.data.clear()
+
+
+def get_snapshot(build_path: Path) -> GraphSnapshot:
+    return GraphSnapshot.instance(build_path / 'dan.graph', cache_name='graph', binary=True)
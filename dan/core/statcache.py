@@ -0,0 +1,109 @@
+import os
+
+
+class StatCache:
+    """Per-invocation cache of files status
+
+    Directories are listed in a single :func:`os.scandir` pass the first time one of
+    their files is looked up: missing files are then resolved without any syscall and
+    existing files are stat'ed once, through their :class:`os.DirEntry`.
+    Paths written by dan must be invalidated (see :meth:`invalidate`).
+    """
+
+    def __init__(self) -> None:
+        self._listings: dict[str, dict[str, os.DirEntry | None] | None] = dict()
+        self._stats: dict[str, os.stat_result | None] = dict()
+        self.lookups = 0
+        self.stat_calls = 0
+        self.scans = 0
+
+    def _listing(self, directory: str):
+        try:
+            return self._listings[directory]
+        except KeyError:
+            pass
+        self.scans += 1
+        try:
+            with os.scandir(directory) as entries:
+                listing = {entry.name: entry for entry in entries}
+        except OSError:
+            listing = None
+        self._listings[directory] = listing
+        return listing
+
+    def stat(self, path) -> os.stat_result | None:
+        """Get path status (None if path does not exist)"""
+        self.lookups += 1
+        key = os.path.abspath(path)
+        try:
+            return self._stats[key]
+        except KeyError:
+            pass
+        directory, name = os.path.split(key)
+        listing = self._listing(directory)
+        if listing is None or name not in listing:
+            result = None
+        else:
+            self.stat_calls += 1
+            entry = listing[name]
+            try:
+                result = os.stat(key) if entry is None else entry.stat()
+            except OSError:
+                result = None
+        self._stats[key] = result
+        return result
+
+    def invalidate(self, path):
+        """Forget path status (eg.: after it has been written or removed)"""
+        key = os.path.abspath(path)
+        self._stats.pop(key, None)
+        self._listings.pop(key, None)
+        directory, name = os.path.split(key)
+        listing = self._listings.get(directory)
+        if listing is not None:
+            # re-stat'ed on next lookup
+            listing[name] = None
+        elif directory in self._listings:
+            # directory didn't exist when listed
+            del self._listings[directory]
+
+    def clear(self):
+        self._listings.clear()
+        self._stats.clear()
+        self.lookups = 0
+        self.stat_calls = 0
+        self.scans = 0
+
+    @property
+    def counters(self) -> dict[str, int]:
+        return {'lookups': self.lookups, 'stat_calls': self.stat_calls, 'scans': self.scans}
+
+
+_cache = StatCache()
+
+
+def stat(path) -> os.stat_result | None:
+    return _cache.stat(path)
+
+
+def exists(path) -> bool:
+    return _cache.stat(path) is not None
+
+
+def modification_time(path) -> float:
+    """Get path modification time (0.0 if path does not exist)"""
+    st = _cache.stat(path)
+    return 0.0 if st is None else st.st_mtime
+
+
+def invalidate(*paths):
+    for path in paths:
+        _cache.invalidate(path)
+
+
+def clear():
+    _cache.clear()
+
+
+def counters() -> dict[str, int]:
+    return _cache.counters
@@ -6,8 +6,10 @@ from dan.core.register import MakefileRegister
 from dan.core.pathlib import Path
 from typing import Any, Callable, Iterable, Union, TypeAlias
 import inspect
+import os
+import time
 
-from dan.core import asyncio, aiofiles, utils, diagnostics as diags
+from dan.core import actioncache, asyncio, aiofiles, graph, pathmap, runners, statcache, trace, utils, digest, diagnostics as diags
 from dan.core.requirements import load_requirements
 from dan.core.settings import InstallMode, InstallSettings, safe_load
 from dan.core.version import Version
@@ -20,8 +22,12 @@ class Dependencies:
     def __init__(self, parent: 'Target', public: Iterable = None, private: Iterable = None):
         super().__init__()
         self.parent = parent
-        self._public = list()
-        self._private = list()
+        # insertion-ordered sets
+        self._public: dict = dict()
+        self._private: dict = dict()
+        # name indexes (first inserted wins)
+        self._public_names: dict = dict()
+        self._private_names: dict = dict()
         if public is not None:
             self.update(public, public=True)
         if private is not None:
@@ -31,39 +37,44 @@ class Dependencies:
     def makefile(self):
         return self.parent.makefile
 
+    def __insert(self, content: dict, dependency):
+        content[dependency] = None
+        names = self._public_names if content is self._public else self._private_names
+        names.setdefault(dependency.name, dependency)
+
     def add(self, dependency, public=True):
         content = self._public if public else self._private
         if dependency in content:
             return
+        graph.invalidate(self.parent)
         from dan.pkgconfig.package import RequiredPackage
         match dependency:
             case Target() | FileDependency():
-                content.append(dependency)
+                self.__insert(content, dependency)
             case type():
                 assert issubclass(dependency, Target)
                 dep = self.makefile.find(dependency)
                 if dep is None:
                     raise RuntimeError(f'cannot find dependency class: {dependency.__name__}')
-                content.append(dep)
+                self.__insert(content, dep)
             case str():
                 from dan.pkgconfig.package import PackageConfig
-                for pkg in PackageConfig.all.values():
-                    if pkg.name == dependency:
-                        content.append(pkg)
-                        break
+                pkg = PackageConfig.all.get(dependency.removesuffix('-pkgconfig'))
+                if pkg is not None and pkg.name == dependency:
+                    self.__insert(content, pkg)
                 else:
                     if isinstance(self.parent.source_path, Path) and Path(self.parent.source_path / dependency).exists():
-                        content.append(FileDependency(
+                        self.__insert(content, FileDependency(
                             self.parent.source_path / dependency))
                     else:
                         from dan.pkgconfig.package import parse_requirement
-                        content.append(parse_requirement(dependency))
+                        self.__insert(content, parse_requirement(dependency))
             case Path():
                 dependency = FileDependency(
                     self.parent.source_path / dependency)
-                content.append(dependency)
+                self.__insert(content, dependency)
             case RequiredPackage():
-                content.append(dependency)
+                self.__insert(content, dependency)
             case _:
                 raise RuntimeError(
                     f'Unhandled dependency {dependency} ({type(dependency)})')
@@ -82,12 +93,10 @@ class Dependencies:
                 raise RuntimeError('unhandled')
 
     def __getattr__(self, attr):
-        for item in self._public:
-            if item.name == attr:
-                return item
-        for item in self._private:
-            if item.name == attr:
-                return item
+        item = self._public_names.get(attr)
+        if item is None:
+            item = self._private_names.get(attr)
+        return item
     
     @property
     def public(self):
@@ -132,11 +141,11 @@ class FileDependency(PathImpl):
 
     @property
     def up_to_date(self):
-        return self.exists()
+        return statcache.exists(self)
 
     @property
     def modification_time(self):
-        return self.stat().st_mtime
+        return statcache.modification_time(self)
 
 
 class Option:
@@ -199,6 +208,8 @@ class Options:
             cache['options'] = dict()
         self._cache = cache['options']
         self.__items: list[Option] = list()
+        # items by name and by fullname
+        self.__index: dict[str, Option] = dict()
         self.update(default)
 
     def add(self, name: str, default_value, help=None):
@@ -207,12 +218,14 @@ class Options:
         opt = Option(self, f'{self.__parent.fullname}.{name}',
                      default_value, help=help)
         self.__items.append(opt)
+        self.__index.setdefault(opt.name, opt)
+        self.__index.setdefault(opt.fullname, opt)
         return opt
 
     def get(self, name: str, parent_lookup = True):
-        for o in self.__items:
-            if name in {o.name, o.fullname}:
-                return o
+        opt = self.__index.get(name)
+        if opt is not None:
+            return opt
         if parent_lookup and self.__parent.parent is not None:
             return self.__parent.parent.options.get(name)
 
@@ -328,6 +341,37 @@ class Target(Logging, MakefileRegister, internal=True):
     inherits_version = True
     subdirectory: str = None
 
+    priority: float = 0.0
+    """Scheduling priority of this target's commands (remaining critical-path length)"""
+
+    duration: float = None
+    """Time spent in this target's own actions during the last build (None if not built)"""
+
+    pool_weights: dict[str, int] = dict()
+    """Weights of this target's actions in the resource pools (eg.: {'link': 4} for a heavy link)"""
+
+    restat: bool = False
+    """Output is write-if-changed: when a rebuild produces a byte-identical output,
+    its previous modification time is kept so that dependents remain up to date"""
+
+    cacheable: bool = False
+    """Outputs are stored in the actions cache and restored from it instead of being built again
+    (when the actions cache is enabled)
+
+    Outputs are identified by the target's recipe (see :meth:`cache_recipe`), its options, the
+    tools listed in *cache_tools* and the digests of its inputs (dependencies and *cache_inputs*):
+    the build must not depend on anything else."""
+
+    cache_tools: list[str|Path] = list()
+    """Executables used by the build (names or paths, eg.: a code generator found on the system)"""
+
+    cache_inputs: list[str|Path] = list()
+    """Input files read by the build that are not dependencies (relative to the source path)"""
+
+    cache_relocatable: bool = False
+    """Outputs do not depend on the location of the source and build trees: inputs are identified
+    by their paths relative to them, so the cached outputs are shared between checkouts"""
+
     __cache_nop_codec = lambda x: x
 
     @staticmethod
@@ -343,6 +387,8 @@ class Target(Logging, MakefileRegister, internal=True):
                 result = get_fn(obj)
                 if result is not None:
                     obj.makefile.root.cache.data[name] = encode(result)
+                    # the stored (tracked) value
+                    return decode(obj.makefile.root.cache.data[name])
                 return result
 
         def set(obj, value):
@@ -369,6 +415,8 @@ class Target(Logging, MakefileRegister, internal=True):
                 result = get_fn(obj)
                 if result is not None:
                     obj.makefile.cache.data[name] = encode(result)
+                    # the stored (tracked) value
+                    return decode(obj.makefile.cache.data[name])
                 return result
         def set(obj, value):
             obj.makefile.cache.data[name] = encode(value)
@@ -573,17 +621,8 @@ class Target(Logging, MakefileRegister, internal=True):
     
     _install_missing_dependencies = True
 
-    def _recursive_dependencies(self, types = None, seen = None):
-        if seen is None:
-            seen = set()
-        for dep in self.dependencies.all:
-            if dep in seen:
-                continue
-            seen.add(dep)
-            if types is None or isinstance(dep, types):
-                yield dep
-                if isinstance(dep, Target):
-                    yield from dep._recursive_dependencies(types, seen)
+    def _recursive_dependencies(self, types = None):
+        return graph.closure(self, types)
 
     @property
     @contextlib.contextmanager
@@ -626,7 +665,8 @@ class Target(Logging, MakefileRegister, internal=True):
             for dep in self.target_dependencies:
                 group.create_task(dep.preload())
 
-        return await asyncio.may_await(self.__preload__())
+        with trace.slice('targets', f'preload {self.fullname}'):
+            return await asyncio.may_await(self.__preload__())
 
     @asyncio.cached
     async def load_dependencies(self):
@@ -645,21 +685,80 @@ class Target(Logging, MakefileRegister, internal=True):
             for dep in self.target_dependencies:
                 group.create_task(dep.initialize())
 
-        return await asyncio.may_await(self.__initialize__())
+        with trace.slice('targets', f'initialize {self.fullname}'):
+            return await asyncio.may_await(self.__initialize__())
 
     @property
     def modification_time(self):
         output = self.build_path / f'{self.name}.stamp' if self.output is None else self.output  
-        return output.stat().st_mtime if output.exists() else 0.0
+        return statcache.modification_time(output)
+
+    @staticmethod
+    def _digest_path(dependency) -> Path:
+        """Get the path holding the content of the given dependency (None if not digestible)"""
+        match dependency:
+            case FileDependency():
+                return dependency
+            case Target():
+                return dependency.build_path / f'{dependency.name}.stamp' if dependency.output is None else dependency.output
+
+    def _inputs_unchanged(self) -> bool:
+        """Check whether inputs newer than this target have the same content as when it was built"""
+        if not (digest.enabled or self.restat):
+            return False
+        recorded = self.cache.get('input_digests')
+        if not recorded:
+            return False
+        database = digest.get_database(self.makefile.root.build_path)
+        modification_time = self.modification_time
+        for dep in self.dependencies.all:
+            mt = dep.modification_time
+            if not mt or mt <= modification_time:
+                continue
+            path = self._digest_path(dep)
+            if path is None:
+                return False
+            dep_digest = database.digest(path)
+            if dep_digest is None or recorded.get(pathmap.normalize(path)) != dep_digest:
+                self.trace('%s content changed', path)
+                return False
+        return True
+
+    def _record_input_digests(self):
+        database = digest.get_database(self.makefile.root.build_path)
+        paths = [self._digest_path(dep) for dep in self.dependencies.all]
+        digests = database.digests([p for p in paths if p is not None])
+        self.cache['input_digests'] = {pathmap.normalize(path): value for path, value in digests.items()}
+
+    def _restat_state(self):
+        """Get the output's status and digest before a rebuild (None if there is nothing to compare)"""
+        if not self.restat or self.output is None:
+            return None
+        st = statcache.stat(self.output)
+        if st is None or not self.output.is_file():
+            return None
+        database = digest.get_database(self.makefile.root.build_path)
+        return st, database.digest(self.output)
+
+    def _restat(self, state) -> bool:
+        """Restore the output's modification time if its content is unchanged since state"""
+        st, previous = state
+        database = digest.get_database(self.makefile.root.build_path)
+        if database.digest(self.output) != previous:
+            return False
+        os.utime(self.output, ns=(st.st_atime_ns, st.st_mtime_ns))
+        statcache.invalidate(self.output)
+        database.remember(self.output, st, previous)
+        return True
 
     @cached_property
     def up_to_date(self):
         output = self.build_path / f'{self.name}.stamp' if self.output is None else self.output
-        if output and not output.exists():
+        if output and not statcache.exists(output):
             return False
         elif not self.dependencies.up_to_date:
             return False
-        elif self.dependencies.modification_time > self.modification_time:
+        elif self.dependencies.modification_time > self.modification_time and not self._inputs_unchanged():
             return False
         elif 'options_sha1' in self.cache and self.cache['options_sha1'] != self.options.sha1:
             return False
@@ -680,13 +779,16 @@ class Target(Logging, MakefileRegister, internal=True):
 
         result = await asyncio.may_await(self.__prebuild__())
 
-        if self.up_to_date:
+        with trace.slice('targets', f'check {self.fullname}'):
+            up_to_date = self.up_to_date
+
+        if up_to_date:
             self.status('up to date !', icon='✔', timeout=1)
             self.trace('up to date !')
             if self.is_requirement:
                 self.hide_output()
             return
-        elif self.output is not None and self.output.exists():
+        elif self.output is not None and statcache.exists(self.output):
             self.debug('outdated !')
 
         with utils.chdir(self.build_path):
@@ -695,12 +797,24 @@ class Target(Logging, MakefileRegister, internal=True):
             if diags.enabled:
                 self.diagnostics.clear()
             try:
-                result = await asyncio.may_await(self.__build__())
+                restat_state = self._restat_state()
+                with trace.slice('targets', f'build {self.fullname}'):
+                    result = await self.__cached_build()
                 if self.output is None:
-                    (self.build_path / f'{self.name}.stamp').touch()
+                    stamp = self.build_path / f'{self.name}.stamp'
+                    stamp.touch()
+                    statcache.invalidate(stamp)
                 self.cache['options_sha1'] = self.options.sha1
-                self.trace('built')
-                self.status('built', icon='✔')
+                if digest.enabled or self.restat:
+                    self._record_input_digests()
+                if restat_state is not None and self._restat(restat_state):
+                    # dependents don't have to be rebuilt
+                    self.up_to_date = True
+                    self.trace('output unchanged')
+                    self.status('unchanged', icon='✔')
+                else:
+                    self.trace('built')
+                    self.status('built', icon='✔')
                 self._stream.hide_children()
                 if self.is_requirement:
                     self.hide_output()
@@ -712,6 +826,91 @@ class Target(Logging, MakefileRegister, internal=True):
                 raise err
 
 
+    def cache_recipe(self) -> list:
+        """Identity of the build steps (the code of :meth:`__build__` by default)"""
+        return actioncache.code_fingerprint(type(self).__build__)
+
+    @property
+    def cache_outputs(self) -> list[Path]:
+        """Files stored in the actions cache"""
+        return [self.output, *sorted(self.other_generated_files)]
+
+    def _action_key(self, database: digest.DigestDatabase) -> str | None:
+        """Key of the outputs in the actions cache (None if some inputs are unknown)"""
+        inputs = [path for path in map(self._digest_path, self.dependencies.all) if path is not None]
+        inputs.extend(self.source_path / path for path in self.cache_inputs)
+        digests = database.digests(inputs)
+        if len(digests) != len({str(path) for path in inputs}):
+            return None
+        outputs = [str(path.relative_to(self.build_path) if path.is_relative_to(self.build_path) else path)
+                   for path in self.cache_outputs]
+        if self.cache_relocatable:
+            digests = {pathmap.normalize(path): value for path, value in digests.items()}
+        return actioncache.make_key('target', self.fullname, self.cache_recipe(), self.options.sha1,
+                                    [actioncache.tool_fingerprint(tool, database) for tool in self.cache_tools],
+                                    sorted(digests.items()), outputs)
+
+    async def __cached_build(self):
+        """Restore the outputs from the actions cache, or build and store them"""
+        store = actioncache.get_store() if self.cacheable and self.output is not None else None
+        if store is None:
+            return await self.__timed_build()
+        database = digest.get_database(self.makefile.root.build_path)
+        key = self._action_key(database)
+        outputs = self.cache_outputs
+        entry = await store.fetch(key) if key is not None else None
+        if entry is not None and len(entry.files) == len(outputs):
+            try:
+                for name, path in zip(entry.files, outputs):
+                    entry.restore(name, path)
+            except OSError as err:
+                # evicted meanwhile
+                store.restore_failed(entry)
+                self.debug('cannot restore from cache: %s', err)
+            else:
+                statcache.invalidate(*outputs)
+                self.debug('restored from cache')
+                return None
+        result = await self.__timed_build()
+        if key is not None and all(path.is_file() for path in outputs):
+            await store.async_put(key, {f'output{index}': path for index, path in enumerate(outputs)})
+        return result
+
+    def reset_build(self):
+        """Forget the last build result so that the target is checked (and built) again
+
+        Used to rebuild an already loaded graph (eg.: watch mode).
+        """
+        Target.build.forget(self)
+        self.__dict__.pop('up_to_date', None)
+
+    async def __timed_build(self):
+        job = runners.Job(self.fullname, self.priority, self.pool_weights)
+        token = runners.current_job.set(job)
+        start = time.perf_counter()
+        try:
+            return await asyncio.may_await(self.__build__())
+        finally:
+            runners.current_job.reset(token)
+            if self.output is not None:
+                statcache.invalidate(self.output)
+            statcache.invalidate(*self.other_generated_files)
+            if job.elapsed > 0 or self.subtargets:
+                # subtargets are timed on their own
+                self.duration = job.elapsed
+            else:
+                self.duration = time.perf_counter() - start
+
+    @property
+    def estimated_duration(self) -> float:
+        """Static duration estimate (in seconds) used when no history is available"""
+        return 0.1
+
+    @property
+    def subtargets(self) -> list['Target']:
+        """Targets built as part of this target (eg.: objects)"""
+        return []
+
     @property
     def target_dependencies(self):
         return [t for t in {*self.dependencies.all, *self.preload_dependencies.all} if isinstance(t, Target)]
@@ -735,6 +934,7 @@ class Target(Logging, MakefileRegister, internal=True):
                 if f.exists():
                     group.create_task(aiofiles.os.remove(f))
             group.create_task(asyncio.may_await(self.__clean__()))
+        statcache.invalidate(output, *self.other_generated_files)
 
     @asyncio.cached(unique = True)
     async def install(self, settings: InstallSettings, mode: InstallMode):
@@ -743,7 +943,8 @@ class Target(Logging, MakefileRegister, internal=True):
         self.debug('installing %s to %s', self.name, settings.destination)
 
         installer = Installer(settings, mode, self)
-        await self.__install__(installer)
+        with trace.slice('targets', f'install {self.fullname}'):
+            await self.__install__(installer)
         return installer.installed_files
 
 
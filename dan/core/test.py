@@ -81,7 +81,7 @@ class Test(Logging, MakefileRegister, internal=True):
         name = f'{self.name}.{caze.name}' if caze is not None else self.name
         args = [str(a) for a in caze.args]
         self.debug('testing %s', name)
-        out, err, rc = await self.executable.execute(*args, no_raise=True, cwd=self.workingDir)
+        out, err, rc = await self.executable.execute(*args, no_raise=True, cwd=self.workingDir, pool='test')
         out_log, out_err = self.outs(caze)
         async with aiofiles.open(out_log, 'w') as outlog, \
                 aiofiles.open(out_err, 'w') as errlog:
@@ -0,0 +1,113 @@
+import contextlib
+import json
+import os
+import time
+
+from pathlib import Path
+
+
+enabled = False
+
+
+class Tracer:
+    """Build timeline recorder producing Chrome trace-event JSON
+
+    Each track (eg.: targets, jobs) is exported as a process; concurrent slices
+    of a track are spread over lanes (exported as threads), a slice always taking
+    the lowest free lane, so that the number of busy lanes reflects the parallelism
+    at any time.
+    """
+
+    def __init__(self) -> None:
+        self.events: list[dict] = list()
+        self._origin = time.perf_counter_ns()
+        self._pids: dict[str, int] = dict()
+        self._lanes: dict[str, list[bool]] = dict()
+
+    def now(self) -> float:
+        """Current timestamp in microseconds"""
+        return (time.perf_counter_ns() - self._origin) / 1000
+
+    def _pid(self, track: str) -> int:
+        pid = self._pids.get(track)
+        if pid is None:
+            pid = len(self._pids) + 1
+            self._pids[track] = pid
+            self._lanes[track] = list()
+            self.events.append({'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0, 'args': {'name': track}})
+            self.events.append({'ph': 'M', 'name': 'process_sort_index', 'pid': pid, 'tid': 0, 'args': {'sort_index': pid}})
+        return pid
+
+    def _acquire_lane(self, track: str) -> tuple[int, int]:
+        pid = self._pid(track)
+        lanes = self._lanes[track]
+        for tid, busy in enumerate(lanes):
+            if not busy:
+                lanes[tid] = True
+                return pid, tid
+        lanes.append(True)
+        tid = len(lanes) - 1
+        self.events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': f'{track} #{tid}'}})
+        return pid, tid
+
+    def _release_lane(self, track: str, tid: int):
+        self._lanes[track][tid] = False
+
+    @contextlib.contextmanager
+    def slice(self, track: str, name: str, **args):
+        pid, tid = self._acquire_lane(track)
+        start = self.now()
+        try:
+            yield
+        finally:
+            event = {'ph': 'X', 'name': name, 'cat': track, 'pid': pid, 'tid': tid, 'ts': start, 'dur': self.now() - start}
+            if args:
+                event['args'] = args
+            self.events.append(event)
+            self._release_lane(track, tid)
+
+    def counter(self, track: str, name: str, **values):
+        self.events.append({'ph': 'C', 'name': name, 'pid': self._pid(track), 'tid': 0, 'ts': self.now(), 'args': values})
+
+    def save(self, path: Path):
+        data = {
+            'traceEvents': self.events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'pid': os.getpid()},
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+
+_tracer: Tracer = None
+_null_context = contextlib.nullcontext()
+
+
+def start():
+    """Start recording the build timeline"""
+    global enabled, _tracer
+    _tracer = Tracer()
+    enabled = True
+
+
+def stop(path: Path):
+    """Stop recording and write the timeline to path"""
+    global enabled, _tracer
+    if _tracer is not None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        _tracer.save(path)
+    enabled = False
+    _tracer = None
+
+
+def slice(track: str, name: str, **args):
+    """Record a slice named name in track for the duration of the returned context"""
+    if not enabled:
+        return _null_context
+    return _tracer.slice(track, name, **args)
+
+
+def counter(track: str, name: str, **values):
+    """Record counter values"""
+    if enabled:
+        _tracer.counter(track, name, **values)
@@ -4,6 +4,11 @@ import os
 
 
 class chdir:
+    # concurrent (interleaved) contexts: the outermost working directory
+    # is restored when the last one exits
+    __active = 0
+    __origin: Path = None
+
     def __init__(self, path: Path, create=True, strict=False):
         self.path = path
         self.strict = strict
@@ -13,12 +18,16 @@ class chdir:
 
     def __enter__(self):
         self.prev = Path.cwd()
+        if chdir.__active == 0:
+            chdir.__origin = self.prev
+        chdir.__active += 1
         os.chdir(self.path)
         return None
 
     def __exit__(self, *args):
+        chdir.__active -= 1
         try:
-            os.chdir(self.prev)
+            os.chdir(chdir.__origin if chdir.__active == 0 else self.prev)
         except OSError:
             if self.strict:
                 raise
@@ -0,0 +1,222 @@
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+
+from dan.core.pathlib import Path
+
+
+class PollingWatcher:
+    """File changes watcher comparing directories listings
+
+    Used where inotify is not available.
+    """
+
+    interval = 0.5
+
+    def __init__(self) -> None:
+        self._states: dict[Path, dict[str, tuple[int, int]]] = dict()
+
+    @staticmethod
+    def _state(directory: Path) -> dict[str, tuple[int, int]]:
+        state = dict()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    state[entry.name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return state
+
+    def watch(self, directories: set[Path]):
+        """Set the watched directories"""
+        directories = set(directories)
+        for directory in list(self._states):
+            if directory not in directories:
+                del self._states[directory]
+        for directory in directories:
+            if directory not in self._states:
+                self._states[directory] = self._state(directory)
+
+    def _poll(self) -> set[Path]:
+        changed = set()
+        for directory, previous in self._states.items():
+            current = self._state(directory)
+            for name in previous.keys() | current.keys():
+                if previous.get(name) != current.get(name):
+                    changed.add(directory / name)
+            self._states[directory] = current
+        return changed
+
+    async def changes(self, debounce: float = 0.2) -> set[Path] | None:
+        """Wait for changes, until no more change happens for debounce seconds"""
+        changed = set()
+        while not changed:
+            await asyncio.sleep(self.interval)
+            changed = self._poll()
+        while True:
+            await asyncio.sleep(max(debounce, self.interval))
+            more = self._poll()
+            if not more:
+                return changed
+            changed.update(more)
+
+    def close(self):
+        self._states.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InotifyWatcher:
+    """File changes watcher backed by Linux's inotify
+
+    Events are read from the event loop; bursts of events (eg.: an editor saving
+    several files) are gathered until no more event happens for *debounce* seconds.
+    :meth:`changes` returns None when the kernel queue overflowed (changes are unknown).
+    """
+
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ONLYDIR = 0x01000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = os.O_CLOEXEC
+
+    mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+    _event = struct.Struct('iIII')
+    _libc = None
+
+    @classmethod
+    def libc(cls):
+        if cls._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            cls._libc = libc
+        return cls._libc
+
+    @classmethod
+    def available(cls) -> bool:
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            return hasattr(cls.libc(), 'inotify_init1')
+        except OSError:
+            return False
+
+    def __init__(self) -> None:
+        self._fd = self.libc().inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches: dict[int, Path] = dict()
+        self._directories: dict[Path, int] = dict()
+        self._changed: set[Path] = set()
+        self._overflow = False
+        self._event_received: asyncio.Event = None
+        self._loop: asyncio.AbstractEventLoop = None
+
+    def watch(self, directories: set[Path]):
+        """Set the watched directories"""
+        directories = set(directories)
+        libc = self.libc()
+        for directory in list(self._directories):
+            if directory not in directories:
+                wd = self._directories.pop(directory)
+                self._watches.pop(wd, None)
+                libc.inotify_rm_watch(self._fd, wd)
+        for directory in directories:
+            if directory in self._directories:
+                continue
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), self.mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue
+                raise OSError(err, os.strerror(err), str(directory))
+            self._directories[directory] = wd
+            self._watches[wd] = directory
+
+    def _read(self):
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self._event.unpack_from(data, offset)
+                offset += self._event.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    self._overflow = True
+                    continue
+                directory = self._watches.get(wd)
+                if directory is not None and name:
+                    self._changed.add(directory / os.fsdecode(name))
+        if self._changed or self._overflow:
+            self._event_received.set()
+
+    def _start(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._event_received = asyncio.Event()
+            self._loop.add_reader(self._fd, self._read)
+
+    async def changes(self, debounce: float = 0.2) -> set[Path] | None:
+        """Wait for changes, until no more change happens for debounce seconds"""
+        self._start()
+        await self._event_received.wait()
+        while True:
+            self._event_received.clear()
+            try:
+                await asyncio.wait_for(self._event_received.wait(), debounce)
+            except asyncio.TimeoutError:
+                break
+        changed, overflow = self._changed, self._overflow
+        self._changed = set()
+        self._overflow = False
+        self._event_received.clear()
+        return None if overflow else changed
+
+    def close(self):
+        if self._fd < 0:
+            return
+        if self._loop is not None:
+            self._loop.remove_reader(self._fd)
+            self._loop = None
+        os.close(self._fd)
+        self._fd = -1
+        self._watches.clear()
+        self._directories.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def make_watcher() -> InotifyWatcher | PollingWatcher:
+    """Get the best available file changes watcher"""
+    if InotifyWatcher.available():
+        return InotifyWatcher()
+    return PollingWatcher()
@@ -0,0 +1,230 @@
+import asyncio
+import typing as t
+
+from dan.core import actioncache, diagnostics as diag, pathmap
+from dan.core.digest import DigestDatabase, get_database
+from dan.core.pathlib import Path
+from dan.core.terminal import write as term_write
+
+if t.TYPE_CHECKING:
+    from dan.cxx.toolchain import CommandArgsList, Toolchain
+
+
+def relocatable_link_arg(arg: str) -> bool:
+    """Whether the roots can be replaced by placeholders in the given link argument (run paths are written in the binaries)"""
+    return 'rpath' not in arg
+
+
+class ToolchainCache:
+    """Base of the toolchain actions caches
+
+    Actions are identified by the tools (path, version and binary digest), their commands
+    (the output path excepted), the toolchain environment and an optional fingerprint
+    (eg.: the target's options digest).
+    Source and build roots are replaced by placeholders in the keys when the outputs do
+    not depend on them (see :meth:`_relocatable_arg`), so the entries can be shared between
+    trees at different locations.
+    """
+
+    version = 2
+
+    relocatable_files: set[str] = set()
+    """Text files stored with placeholders for the source and build roots"""
+
+    def __init__(self, store: actioncache.LocalStore, toolchain: 'Toolchain', digests: DigestDatabase, fingerprint: str = None) -> None:
+        self.store = store
+        self.toolchain = toolchain
+        self.digests = digests
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def get(cls, toolchain: 'Toolchain', build_path: Path, **kwds) -> t.Optional['ToolchainCache']:
+        """Get the cache (None if the actions cache is disabled or the toolchain does not support it)"""
+        store = actioncache.get_store()
+        if store is None or not toolchain.compile_cache_support:
+            return None
+        return cls(store, toolchain, get_database(build_path), **kwds)
+
+    def _tool_id(self, tool) -> list:
+        return [*actioncache.tool_fingerprint(tool, self.digests), str(self.toolchain.version)]
+
+    def _relocatable_arg(self, arg: str) -> bool:
+        """Whether the roots can be replaced by placeholders in the given command argument"""
+        return True
+
+    def _normalize_arg(self, arg: str) -> str:
+        return pathmap.normalize(arg) if self._relocatable_arg(arg) else arg
+
+    def _action_key(self, kind: str, output: Path, commands: 'CommandArgsList', *parts) -> str:
+        out = str(output)
+        normalized = [[self._normalize_arg(str(arg).replace(out, '<output>')) for arg in command[1:]]
+                      for command in commands]
+        env = sorted((self.toolchain.env or dict()).items())
+        return actioncache.make_key(kind, self.version,
+                                    [self._tool_id(command[0]) for command in commands],
+                                    normalized, env, self.fingerprint, *parts)
+
+    def _restore(self, entry: actioncache.Entry, files: dict[str, Path], log: bool) -> list[diag.Diagnostic] | None:
+        """Restore the entry's files and output, returns its diagnostics (None if the entry cannot be restored)"""
+        output = files['output']
+        try:
+            for name in entry.files:
+                dest = files.get(name, output.with_name(name.replace('output', output.name, 1)))
+                if name in self.relocatable_files:
+                    dest.write_text(pathmap.expand(entry.read(name).decode()))
+                else:
+                    entry.restore(name, dest)
+        except OSError as err:
+            # evicted meanwhile
+            self.store.restore_failed(entry)
+            self.toolchain.debug('cannot restore %s from cache: %s', output.name, err)
+            return None
+        if log:
+            for stream in ('stdout', 'stderr'):
+                content = entry.metadata.get(stream)
+                if content:
+                    term_write(content, end='')
+        diags = list()
+        for data in entry.metadata.get('diags', list()):
+            diagnostic = diag.Diagnostic.from_dict(data)
+            diagnostic.filename = data.get('filename')
+            diags.append(diagnostic)
+        return diags
+
+    def _entry_files(self, files: dict[str, Path]) -> dict[str, Path | bytes]:
+        return {name: pathmap.normalize(path.read_text()).encode() if name in self.relocatable_files else path
+                for name, path in files.items() if path.exists()}
+
+    async def _store(self, key: str, files: dict[str, Path], outputs: list[tuple[str, str]], diags: list[diag.Diagnostic]):
+        files = await asyncio.to_thread(self._entry_files, files)
+        metadata = {
+            'stdout': ''.join(out for out, _ in outputs),
+            'stderr': ''.join(err for _, err in outputs),
+            'diags': [{**d.to_dict(encode_json=True), 'filename': d.filename} for d in diags],
+        }
+        await self.store.async_put(key, files, metadata)
+
+
+class CompileCache(ToolchainCache):
+    """Compiled objects cache (direct mode)
+
+    The compilation key (tools, commands, environment and the source digest) identifies
+    a manifest listing the headers read by the previous compilations (with their digests,
+    from the dependency files): a compilation whose headers are unchanged is restored
+    from the actions cache (object, dependency file, output and diagnostics) without
+    invoking the compiler.
+    """
+
+    max_candidates = 8
+    """Number of headers sets remembered per source and commands"""
+
+    relocatable_files = {'output.d'}
+
+    def _relocatable_arg(self, arg: str) -> bool:
+        # without prefix maps, objects embed the absolute paths (debug info, __FILE__)
+        return bool(self.toolchain.file_prefix_map)
+
+    def _generated_files(self, output: Path) -> dict[str, Path]:
+        """Files generated by a compilation (by their name in the cache entry)"""
+        files = {'output': output}
+        for path in self.toolchain.compile_generated_files(output):
+            files[path.name.replace(output.name, 'output', 1)] = path
+        return files
+
+    def _base_key(self, sourcefile: Path, output: Path, commands: 'CommandArgsList') -> str | None:
+        source_digest = self.digests.digest(sourcefile)
+        if source_digest is None:
+            return None
+        return self._action_key('compile', output, commands, source_digest)
+
+    def _result_key(self, base_key: str, headers: dict[str, str]) -> str:
+        return actioncache.make_key(base_key, sorted(headers.items()))
+
+    async def _result_keys(self, base_key: str) -> list[str]:
+        """Result keys of the previous compilations whose headers are unchanged"""
+        keys = list()
+        for candidate in await self.store.fetch_manifest(base_key) or list():
+            headers = candidate['headers']
+            if all(self.digests.digest(pathmap.expand(path)) == digest for path, digest in headers.items()):
+                keys.append(self._result_key(base_key, headers))
+        return keys
+
+    async def prefetch(self, compilations: list[tuple[Path, Path, set[str], t.Any]]):
+        """Download the cached results of the given compilations (sourcefile, output, options, build type) in a batch"""
+        base_keys = list()
+        for sourcefile, output, options, build_type in compilations:
+            commands = self.toolchain.make_compile_commands(sourcefile, output, options, build_type)
+            base_key = self._base_key(sourcefile, output, commands)
+            if base_key is not None:
+                base_keys.append(base_key)
+        candidates = await asyncio.gather(*[self._result_keys(key) for key in base_keys])
+        await self.store.prefetch([keys[0] for keys in candidates if keys])
+
+    async def restore(self, sourcefile: Path, output: Path, commands: 'CommandArgsList', log=True) -> list[diag.Diagnostic] | None:
+        """Restore a previous compilation, returns its diagnostics (None if not cached)"""
+        base_key = self._base_key(sourcefile, output, commands)
+        if base_key is None:
+            return None
+        keys = await self._result_keys(base_key)
+        if not keys:
+            self.store.counters.misses += 1
+            return None
+        entry = await self.store.fetch(keys[0])
+        if entry is None:
+            return None
+        return self._restore(entry, self._generated_files(output), log)
+
+    async def store_result(self, sourcefile: Path, output: Path, commands: 'CommandArgsList', deps: set[str],
+                           outputs: list[tuple[str, str]], diags: list[diag.Diagnostic]):
+        """Store a successful compilation (deps being the headers it read)"""
+        base_key = self._base_key(sourcefile, output, commands)
+        if base_key is None:
+            return
+        headers = self.digests.digests(deps)
+        if len(headers) != len(deps):
+            # unknown dependency (eg.: removed while compiling)
+            return
+        headers = {pathmap.normalize(path): digest for path, digest in headers.items()}
+        await self._store(self._result_key(base_key, headers), self._generated_files(output), outputs, diags)
+        manifest = await asyncio.to_thread(self.store.get_manifest, base_key)
+        candidates = [c for c in manifest or list() if c['headers'] != headers]
+        candidates.insert(0, {'headers': headers})
+        await self.store.async_put_manifest(base_key, candidates[:self.max_candidates])
+
+
+class LinkCache(ToolchainCache):
+    """Linked binaries and archives cache
+
+    Links are identified by their commands and the digests of their inputs (objects and
+    dependencies outputs).
+    """
+
+    def __init__(self, *args, inputs: list[Path], **kwds) -> None:
+        super().__init__(*args, **kwds)
+        self.inputs = inputs
+
+    def _relocatable_arg(self, arg: str) -> bool:
+        return relocatable_link_arg(arg)
+
+    def _key(self, output: Path, commands: 'CommandArgsList') -> str | None:
+        digests = self.digests.digests(self.inputs)
+        if len(digests) != len({str(path) for path in self.inputs}):
+            return None
+        digests = sorted((pathmap.normalize(path), digest) for path, digest in digests.items())
+        return self._action_key('link', output, commands, digests)
+
+    async def restore(self, output: Path, commands: 'CommandArgsList', log=True) -> list[diag.Diagnostic] | None:
+        """Restore a previous link, returns its diagnostics (None if not cached)"""
+        key = self._key(output, commands)
+        if key is None:
+            return None
+        entry = await self.store.fetch(key)
+        if entry is None:
+            return None
+        return self._restore(entry, {'output': output}, log)
+
+    async def store_result(self, output: Path, commands: 'CommandArgsList', outputs: list[tuple[str, str]], diags: list[diag.Diagnostic]):
+        """Store a successful link"""
+        key = self._key(output, commands)
+        if key is not None:
+            await self._store(key, {'output': output}, outputs, diags)
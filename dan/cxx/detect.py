@@ -3,11 +3,11 @@ from dan.core.pathlib import Path
 import subprocess
 import sys
 import tempfile
-import functools
 
 import json
 import pickle
 from dan.core.find import find_executable
+from dan.core.paths import get_dan_path, get_toolchain_path
 
 from dan import logging
 from dan.core.runners import sync_run
@@ -537,20 +537,6 @@ def create_toolchain(compiler: Compiler, logger=logging.getLogger('toolchain')):
     return name, data
 
 
-_home_var = 'USERPROFILE' if os.name == 'nt' else 'HOME'
-
-
-@functools.cache
-def get_dan_path():
-    path = Path(os.getenv('DAN_DATA', os.getenv(_home_var))) / '.dan'
-    path.mkdir(exist_ok=True, parents=False)
-    return path
-
-
-def get_toolchain_path():
-    return get_dan_path() / 'toolchains.dat'
-
-
 def load_env_toolchain(script: Path = None, name: str = None):
     logger = logging.getLogger('toolchain')
     env = get_environment_from_batch_command(script)
@@ -647,8 +633,7 @@ def create_toolchains(paths = None):
     data['tools'] = tools
     data['toolchains'] = toolchains
     if not 'default' in data:
-        from dan.core.osinfo import OSInfo
-        osi = OSInfo()
+        from dan.core.osinfo import info as osi
         default_toolchain = None
         for name, toolchain in toolchains.items():
             if toolchain['system'] == osi.name and toolchain['arch'] == osi.arch:
@@ -1,5 +1,6 @@
 from functools import cached_property
 import json
+import subprocess
 import typing as t
 
 import aiofiles
@@ -174,6 +175,12 @@ class MSVCToolchain(Toolchain):
     def make_link_commands(self, objects: set[Path], output: Path, options: list[str]) -> CommandArgsList:
         return [[self.lnk, *self.common_flags, *options, *objects, f'/OUT:{str(output)}']]
 
+    # cmd.exe limits command lines to 8191 characters
+    response_file_threshold = 4096
+
+    def make_response_file(self, args: list[str]) -> str:
+        return '\n'.join(subprocess.list2cmdline([arg]) for arg in args) + '\n'
+
     def make_static_lib_commands(self, objects: set[Path], output: Path, options: list[str]) -> CommandArgsList:
         return [[self.lib, *self.common_flags, *objects, f'/OUT:{output}']]
 
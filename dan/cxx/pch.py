@@ -0,0 +1,95 @@
+"""Precompiled headers candidates
+
+Ranks the headers by the number of objects including them (read from the dependency files
+of a previous build) to propose the targets' *precompiled_headers*.
+"""
+import collections
+import os
+import typing as t
+
+from dan.core.pathlib import Path
+
+if t.TYPE_CHECKING:
+    from dan.cxx.targets import CXXObjectsTarget
+
+
+implicit_headers = {'stdc-predef.h'}
+"""Headers implicitly included by the compilers (not reported)"""
+
+
+class HeaderUsage:
+    """Headers included by a target's objects"""
+
+    def __init__(self, target: 'CXXObjectsTarget') -> None:
+        self.target = target
+        self.objects = 0
+        """Number of objects having a dependency file"""
+        self.counts: collections.Counter[str] = collections.Counter()
+        """Number of objects including each header (by resolved path)"""
+        self.names: dict[str, str] = dict()
+        """Include names of the headers (eg.: '<vector>')"""
+
+    def ranking(self, min_ratio: float = 0.0) -> list[tuple[str, int]]:
+        """Headers names and counts, most included first"""
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], self.names[item[0]]))
+        return [(self.names[path], count) for path, count in ranked
+                if self.objects and count / self.objects >= min_ratio]
+
+    def is_external(self, path: str) -> bool:
+        """Whether the header is not part of the project (ie.: unlikely to change)"""
+        root = self.target.makefile.root
+        return not any(Path(path).is_relative_to(os.path.realpath(p)) for p in (root.source_path, root.build_path))
+
+    def candidates(self, min_ratio: float = 0.5) -> list[str]:
+        """Precompiled headers proposal: external headers included by at least min_ratio of the objects"""
+        return [self.names[path] for path, count in sorted(self.counts.items(), key=lambda item: -item[1])
+                if self.is_external(path) and count / self.objects >= min_ratio]
+
+
+def _include_dirs(flags: list[str]) -> list[str]:
+    dirs = list()
+    flags = iter(flags)
+    for flag in flags:
+        if flag in ('-I', '-isystem'):
+            flag = flag + next(flags, '')
+        for prefix in ('-isystem', '-I'):
+            if flag.startswith(prefix) and len(flag) > len(prefix):
+                dirs.append(os.path.realpath(flag.removeprefix(prefix)))
+                break
+    return dirs
+
+
+def _include_name(path: str, include_dirs: list[str]) -> str:
+    for include_dir in include_dirs:
+        if path.startswith(include_dir + os.sep):
+            return f'<{Path(os.path.relpath(path, include_dir)).as_posix()}>'
+    return path
+
+
+async def header_usage(target: 'CXXObjectsTarget') -> HeaderUsage:
+    """Count the headers included by the objects of the given target (from their dependency files)"""
+    await target.initialize()
+    usage = HeaderUsage(target)
+    toolchain = target.toolchain
+    include_dirs = None
+    for obj in target.objs:
+        sourcefile = obj.source_path / obj.source
+        deps = await toolchain.scan_dependencies(sourcefile, obj.output, obj.private_cxx_flags)
+        if not deps:
+            continue
+        if include_dirs is None:
+            include_dirs = [*_include_dirs(target.private_cxx_flags),
+                            *await toolchain.get_default_include_paths()]
+            # most specific first
+            include_dirs.sort(key=len, reverse=True)
+        usage.objects += 1
+        excluded = {os.path.realpath(sourcefile)}
+        if target.pch is not None:
+            excluded.update(os.path.realpath(p) for p in (target.pch.source, target.pch.output))
+        for dep in {os.path.realpath(dep) for dep in deps} - excluded:
+            if os.path.basename(dep) in implicit_headers:
+                continue
+            usage.counts[dep] += 1
+            if dep not in usage.names:
+                usage.names[dep] = _include_name(dep, include_dirs)
+    return usage
@@ -11,6 +11,7 @@ import functools
 
 
 class _UIObject(Target, internal=True):
+    cacheable = True
 
     def __init__(self, ui_file: Path, parent, *args, **kwargs) -> None:
         self.ui_file = Path(ui_file)
@@ -20,7 +21,10 @@ class _UIObject(Target, internal=True):
         if not self.ui_file.is_absolute():
             self.ui_file = self.source_path / self.ui_file
         self.dependencies.add(self.ui_file)
-        
+
+    @property
+    def cache_tools(self):
+        return [self.parent.uic]
 
     async def __build__(self):
         p = self.parent
@@ -46,6 +50,7 @@ class _RCCObject(CXXObject, internal=True):
         await super().__build__()
 
 class _MocSource(Target, internal=True):
+    cacheable = True
 
     def __init__(self, header_file: Path, parent, *args, **kwargs) -> None:
         self.header_file = Path(header_file)
@@ -57,6 +62,10 @@ class _MocSource(Target, internal=True):
         self.output = source_file
         self.dependencies.add(self.header_file)
 
+    @property
+    def cache_tools(self):
+        return [self.parent.moc]
+
     async def __build__(self):
         p = self.parent
         self.output.parent.mkdir(parents=True, exist_ok=True)
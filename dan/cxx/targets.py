@@ -7,11 +7,12 @@ from enum import Enum
 from functools import cached_property
 
 from dan.core.pathlib import Path
-from dan.core import cache
+from dan.core import cache, pathmap, statcache
 from dan.core.target import Target, Installer, InstallMode
 from dan.core.utils import chunks, unique
 from dan.core.runners import async_run
 from dan.core import asyncio
+from dan.cxx.compile_cache import CompileCache, LinkCache, relocatable_link_arg
 from dan.cxx.toolchain import CompilationFailure, LibraryList, LinkageFailure, Toolchain, CppStd, BuildType
 from dan.core.cache import cached_property as dan_cached
 
@@ -48,9 +49,20 @@ class CXXObject(Target, internal=True):
     def cxx_flags(self):
         return self.parent.cxx_flags
 
+    @property
+    def pch(self) -> t.Optional['PrecompiledHeader']:
+        """Precompiled header used by this object (None if the target has none or it is not compatible with the source)"""
+        pch = self.parent.pch
+        if pch is None or pch is self or not self.toolchain.pch_compatible(self.source):
+            return None
+        return pch
+
     @property
     def private_cxx_flags(self):
-        return self.parent.private_cxx_flags
+        pch = self.pch
+        if pch is None:
+            return self.parent.private_cxx_flags
+        return [*self.parent.private_cxx_flags, *pch.use_options]
     
     @property
     def includes(self):
@@ -66,24 +78,33 @@ class CXXObject(Target, internal=True):
     @dan_cached()
     def compile_args(self): ...
 
+    @property
+    def scanned_deps(self) -> list[str] | None:
+        """Headers scanned by the last build (deps are cached with the roots placeholders)"""
+        deps = self.deps
+        return None if deps is None else pathmap.expand_all(deps)
+
     async def __initialize__(self):
         await self.parent.preload()
 
-        deps = self.deps
+        deps = self.scanned_deps
         if deps is not None:
             self.dependencies.update(deps)
 
         self.dependencies.add(self.source)
 
+        # objects may be added after the target's initialization (eg.: qt's moc objects)
+        pch = self.pch
+        if pch is not None:
+            self.dependencies.add(pch)
+
         self.other_generated_files.update(
             self.toolchain.compile_generated_files(self.output))
 
         previous_args = self.compile_args
         if previous_args is not None:
-            args = self.toolchain.make_compile_commands(
-                self.source_path / self.source, self.output, self.private_cxx_flags, self.build_type)[0]
-            args = [str(arg) for arg in args]
-            if sorted(args) != sorted(previous_args):
+            args = pathmap.normalize_all(self._make_compile_commands()[0])
+            if sorted(args) != sorted(pathmap.normalize_all(previous_args)):
                 self.__dirty = True
         else:
             self.__dirty = True
@@ -94,26 +115,108 @@ class CXXObject(Target, internal=True):
             return False
         return super().up_to_date
 
+    def reset_build(self):
+        super().reset_build()
+        self.__dirty = False
+        # headers scanned by the last build
+        deps = self.scanned_deps
+        if deps is not None:
+            self.dependencies.update(deps)
+
+    @property
+    def estimated_duration(self) -> float:
+        # rough compile-time estimate: source size and known included headers
+        try:
+            size = (self.source_path / self.source).stat().st_size
+        except OSError:
+            size = 0
+        deps = self.deps or []
+        return 0.5 + size / 20_000 + len(deps) * 0.02
+
+    def _make_compile_commands(self):
+        return self.toolchain.make_compile_commands(
+            self.source_path / self.source, self.output, self.private_cxx_flags, self.build_type)
+
+    async def _compile(self):
+        cache = CompileCache.get(self.toolchain, self.makefile.root.build_path)
+        return await self.toolchain.compile(self.source_path / self.source, self.output, self.private_cxx_flags, self.build_type, cache=cache)
+
     async def __build__(self):
         self.info('generating %s...', self.output.name)
         try:
             self.output.parent.mkdir(parents=True, exist_ok=True)
-            commands, diags = await self.toolchain.compile(self.source_path / self.source, self.output, self.private_cxx_flags, self.build_type)
+            commands, diags, deps = await self._compile()
             self.parent.diagnostics.insert(diags, str(self.source))
         except CompilationFailure as err:
             self.parent.diagnostics.insert(err.diags, str(self.source))
             err.target = self
             raise
-        self.compile_args = [str(a) for a in commands[0]]
-        self.debug('scanning dependencies of %s', self.source.name)
-        deps = await self.toolchain.scan_dependencies(self.source_path / self.source, self.output, self.private_cxx_flags)
+        self.compile_args = pathmap.normalize_all(commands[0])
         deps = [d for d in deps
                 if self.makefile.root.source_path in Path(d).parents
                 or self.build_path in Path(d).parents]
-        self.deps = deps
+        self.deps = pathmap.normalize_all(deps)
+
+
+class PrecompiledHeader(CXXObject, internal=True):
+    """Precompiled header of a target's objects
+
+    Built from a generated header including the target's *precompiled_headers*, with the
+    objects compile flags; the objects depend on it (rebuilt when it changes) and include it
+    through the toolchain's options (eg.: ``-include``/``-include-pch``).
+    """
+
+    def __init__(self, parent: 'CXXObjectsTarget') -> None:
+        header = parent.build_path / f'{parent.name}.pch' / 'pch.hpp'
+        super().__init__(header, parent, root=header.parent)
+        self.output = self.toolchain.make_pch_name(header)
+
+    @property
+    def private_cxx_flags(self):
+        return self.parent.private_cxx_flags
+
+    @property
+    def use_options(self) -> list[str]:
+        return self.toolchain.make_pch_options(self.source, self.output)
+
+    def _include(self, header: str) -> str:
+        header = str(header)
+        if header.startswith('<'):
+            return header
+        path = self.parent.source_path / header
+        return f'"{path.as_posix()}"' if path.exists() else f'<{header}>'
+
+    @property
+    def content(self) -> str:
+        return ''.join(f'#include {self._include(header)}\n' for header in self.parent.precompiled_headers)
+
+    async def __initialize__(self):
+        # the generated header is the precompiled header's source: written when its content changes
+        content = self.content
+        if not self.source.exists() or self.source.read_text() != content:
+            self.source.parent.mkdir(parents=True, exist_ok=True)
+            self.source.write_text(content)
+        await super().__initialize__()
+
+    @property
+    def estimated_duration(self) -> float:
+        return 1.0 + len(self.deps or []) * 0.02
+
+    def _make_compile_commands(self):
+        return self.toolchain.make_pch_commands(self.source, self.output, self.private_cxx_flags, self.build_type)
+
+    async def _compile(self):
+        return await self.toolchain.precompile_header(self.source, self.output, self.private_cxx_flags, self.build_type)
+
+    async def __clean__(self):
+        await super().__clean__()
+        if self.source.exists():
+            self.source.unlink()
 
 
 class OptionSet:
+    _generation = 0
+
     def __init__(self, parent: 'CXXTarget',
                  name: str,
                  public: list | set = set(),
@@ -126,6 +229,7 @@ class OptionSet:
         self._transform_in = transform_in or self.__nop_transform
         self._public = list()
         self._private = list()
+        self._public_cache = None
         self.add(*public, public=True)
         self.add(*private, public=False)
 
@@ -139,11 +243,23 @@ class OptionSet:
 
     @property
     def public(self) -> list:
+        deps = self._parent._recursive_dependencies((CXXTarget))
+        # memoized until the closure is recomputed or any option set changes
+        if self._public_cache is not None:
+            cached_deps, generation, items = self._public_cache
+            if cached_deps is deps and generation == OptionSet._generation:
+                return list(items)
         items: list = self._transform_out([self._transform_in(p) for p in self._public])
-        for dep in self._parent._recursive_dependencies((CXXTarget)):
+        for dep in deps:
             opts = getattr(dep, self._name)
             items.extend(opts._transform_out([opts._transform_in(p) for p in opts._public]))
-        return unique(items)
+        items = unique(items)
+        self._public_cache = (deps, OptionSet._generation, items)
+        return list(items)
+
+    @staticmethod
+    def _changed():
+        OptionSet._generation += 1
 
     @property
     def all(self) -> list:
@@ -165,6 +281,7 @@ class OptionSet:
         return [*self.private_raw, *self.public_raw]
 
     def add(self, *values, public=False):
+        OptionSet._changed()
         if public:
             for value in values:
                 if not value in self._public:
@@ -175,11 +292,13 @@ class OptionSet:
                     self._private.append(value)
 
     def update(self, values: 'OptionSet', private=False):
+        OptionSet._changed()
         self._public = values._public
         if private:
             self._private = values._private
 
     def extend(self, values: t.Iterable, private=False):
+        OptionSet._changed()
         if private:
             self._private.extend(values)
         else:
@@ -207,6 +326,9 @@ class CXXTarget(Target, internal=True):
 
     build_type: BuildType = None
 
+    precompiled_headers: list[str] = list()
+    """Headers precompiled once for all the objects (eg.: ['<vector>', 'fmt/format.h']), see `dan ls pch-candidates`"""
+
     __cpp_std: int|str = None
 
     def __make_src_path(self, path):
@@ -269,11 +391,11 @@ class CXXTarget(Target, internal=True):
     @cached_property
     def shared_dependencies_path(self):
         paths = []
-        for lib in [d for d in self.dependencies.all if isinstance(d, Library) and d.shared]:
-            paths.append(lib.build_path.as_posix())
-        for target in self.cxx_dependencies:
-            paths.extend(target.shared_dependencies_path)
-        return paths
+        for target in (self, *self._recursive_dependencies(CXXTarget)):
+            for lib in target.library_dependencies:
+                if lib.shared:
+                    paths.append(lib.build_path.as_posix())
+        return unique(paths)
 
     @cached_property
     def lib_paths(self) -> list[str]:
@@ -349,6 +471,7 @@ class CXXObjectsTarget(CXXTarget, internal=True):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.objs: list[CXXObject] = list()
+        self.pch: PrecompiledHeader = None
 
     @cache.once_method
     def _init_sources(self):
@@ -374,8 +497,26 @@ class CXXObjectsTarget(CXXTarget, internal=True):
                 self.objs.append(
                     CXXObject(Path(source), self, root=root))
             self.sources = sources
+            self._init_pch()
+
+    def _init_pch(self):
+        if not self.precompiled_headers:
+            return
+        if not self.toolchain.pch_support:
+            self.warning('precompiled headers are not supported by %s, ignored', self.toolchain)
+            return
+        self.pch = PrecompiledHeader(self)
             
 
+    @property
+    def subtargets(self) -> list[Target]:
+        return self.objs
+
+    @property
+    def estimated_duration(self) -> float:
+        # link/archive step
+        return 0.2 + len(self.objs) * 0.01 if self.objs else 0.1
+
     @property
     def file_dependencies(self):
         return unique(super().file_dependencies, *[o.file_dependencies for o in self.objs])
@@ -397,17 +538,71 @@ class CXXObjectsTarget(CXXTarget, internal=True):
             for obj in self.objs:
                 group.create_task(obj.initialize())
                 # self.load_dependency(obj)
-
-    async def __build__(self):
-        # compile objects
+        # objects are not known when priorities are assigned in streaming mode
+        for obj in self.objs:
+            obj.priority = max(obj.priority, self.priority + obj.estimated_duration)
+        if self.pch is not None and self.objs:
+            self.pch.priority = max(self.pch.priority,
+                                    max(obj.priority for obj in self.objs) + self.pch.estimated_duration)
+
+    async def build_compile_prerequisites(self):
+        """Build what is needed to compile objects depending on this target (eg.: generated headers)"""
+        await self._build_objects_prerequisites()
+
+    @asyncio.cached
+    async def _build_objects_prerequisites(self):
+        # objects only need headers and generated files:
+        # dependencies' objects and link steps are not awaited
+        deps = self.target_dependencies
+        if not deps:
+            return
+        async with self.task_group('building compile prerequisites...') as group:
+            for dep in deps:
+                if isinstance(dep, CXXObjectsTarget):
+                    group.create_task(dep.build_compile_prerequisites())
+                else:
+                    group.create_task(dep.build())
+
+    def reset_build(self):
+        super().reset_build()
+        CXXObjectsTarget._build_objects_prerequisites.forget(self)
+
+    async def _prefetch_objects(self):
+        """Download the objects available from the remote cache (checked in a batch before compiling)"""
+        cache = CompileCache.get(self.toolchain, self.makefile.root.build_path)
+        if cache is None or cache.store.remote is None:
+            return
+        await cache.prefetch([(obj.source_path / obj.source, obj.output, obj.private_cxx_flags, obj.build_type)
+                              for obj in self.objs if not obj.up_to_date])
+
+    def _link_cache(self) -> LinkCache:
+        inputs = [obj.output for obj in self.objs]
+        inputs.extend(path for path in map(Target._digest_path, self.dependencies.all) if path is not None)
+        return LinkCache.get(self.toolchain, self.makefile.root.build_path, inputs=inputs, fingerprint=self.options.sha1)
+
+    async def _build_objects(self):
+        await self._prefetch_objects()
         async with self.task_group(f'building {self.name}\'s objects') as group:
-            for dep in self.objs:
+            for dep in sorted(self.objs, key=lambda obj: obj.priority, reverse=True):
                 group.create_task(dep.build())
 
+    async def _build_dependencies(self):
+        await self._build_objects_prerequisites()
+        # compile objects while dependencies are being linked
+        async with self.task_group('building dependencies...') as group:
+            group.create_task(self._build_objects())
+            group.create_task(super()._build_dependencies())
+
+    async def __build__(self):
+        # compile objects (already built along with dependencies, unless built directly)
+        await self._build_objects()
+
     async def __clean__(self):
         async with asyncio.TaskGroup(f'cleaning {self.name}\'s objects') as group:
             for dep in self.objs:
                 group.create_task(dep.clean())
+            if self.pch is not None:
+                group.create_task(self.pch.clean())
         return await super().__clean__()
 
 
@@ -456,6 +651,18 @@ class Library(CXXObjectsTarget, internal=True):
     def __make_link_options(self):
         return [*self.lib_paths, *self.libs, *self.link_options.public, *self.link_options.private]
 
+    @property
+    def __import_definition(self) -> str:
+        """Public definition importing the symbols of a (MSVC) shared library"""
+        return f'{self.name.upper()}_IMPORT=1'
+
+    @cached_property
+    def private_cxx_flags(self):
+        flags = super().private_cxx_flags
+        # the library's own objects export its symbols
+        excluded = self.toolchain.make_compile_definitions([self.__import_definition])
+        return [flag for flag in flags if flag not in excluded]
+
 
     async def __initialize__(self):
         self._init_sources()
@@ -473,11 +680,15 @@ class Library(CXXObjectsTarget, internal=True):
         from .msvc_toolchain import MSVCToolchain
         if self.shared and isinstance(self.toolchain, MSVCToolchain):
             self.compile_definitions.add(f'{self.name.upper()}_EXPORT=1')
+            # set before any object is compiled (dependents' objects are compiled while this library is built)
+            self.compile_definitions.add(self.__import_definition, public=True)
 
         if self.library_type != LibraryType.INTERFACE:
             self.output = self.toolchain.make_library_name(self.name, self.shared)
         else:
             self.output = f"lib{self.name}.stamp"
+            # the stamp only changes with its dependencies' outputs
+            self.restat = True
         await super().__initialize__()
 
         previous_args = self.cache.get('generate_args')
@@ -503,6 +714,19 @@ class Library(CXXObjectsTarget, internal=True):
             return False
         return super().up_to_date
 
+    def reset_build(self):
+        super().reset_build()
+        self.__dirty = False
+
+    def __interface_stamp(self) -> str:
+        lines = list()
+        for dep in self.target_dependencies:
+            path = Target._digest_path(dep)
+            st = statcache.stat(path) if path is not None else None
+            if st is not None:
+                lines.append(f'{path}:{st.st_size}:{st.st_mtime_ns}\n')
+        return ''.join(sorted(lines))
+
     async def __build__(self):
         await super().__build__()
 
@@ -510,16 +734,14 @@ class Library(CXXObjectsTarget, internal=True):
             'creating %s library %s...', self.library_type.name.lower(), self.output.name)
 
         if self.static:
-            await self.toolchain.static_lib([obj.routput for obj in self.objs], self.output, self.__make_link_options())
+            await self.toolchain.static_lib([obj.routput for obj in self.objs], self.output, self.__make_link_options(),
+                                            cache=self._link_cache())
         elif self.shared:
-            await self.toolchain.shared_lib([obj.routput for obj in self.objs], self.output, self.__make_link_options())
-            from .msvc_toolchain import MSVCToolchain
-            if isinstance(self.toolchain, MSVCToolchain):
-                self.compile_definitions.add(
-                    f'{self.name.upper()}_IMPORT=1', public=True)
+            await self.toolchain.shared_lib([obj.routput for obj in self.objs], self.output, self.__make_link_options(),
+                                            cache=self._link_cache())
         else:
             assert self.interface
-            self.output.touch()
+            self.output.write_text(self.__interface_stamp())
 
         self.debug('done')
     
@@ -571,6 +793,10 @@ class Module(CXXObjectsTarget, internal=True):
     def cxx_flags(self):
         return {*self.toolchain.cxxmodules_flags, *super().cxx_flags}
 
+    async def build_compile_prerequisites(self):
+        # dependents' objects need the compiled module interfaces
+        await self.build()
+
     async def __build__(self):
         return await super().__build__()
 
@@ -618,16 +844,23 @@ class Executable(CXXObjectsTarget, internal=True):
         if previous_args:
             args = self.toolchain.make_link_commands([obj.routput for obj in self.objs], self.output,
                                                      self._make_link_options())[0]
-            args = [str(a) for a in args]
-            if sorted(previous_args) != sorted(args):
+            if sorted(self._link_fingerprint(previous_args)) != sorted(self._link_fingerprint(args)):
                 self.__dirty = True
 
+    @staticmethod
+    def _link_fingerprint(args) -> list[str]:
+        return [pathmap.normalize(arg) if relocatable_link_arg(arg) else arg for arg in map(str, args)]
+
     @cached_property
     def up_to_date(self):
         if self.__dirty:
             return False
         return super().up_to_date
 
+    def reset_build(self):
+        super().reset_build()
+        self.__dirty = False
+
     async def __build__(self):
         await super().__build__()
 
@@ -635,13 +868,13 @@ class Executable(CXXObjectsTarget, internal=True):
         self.info('linking %s...', self.output.name)
         try:
             commands, diags = await self.toolchain.link([obj.routput for obj in self.objs], self.output,
-                                                        self._make_link_options())
+                                                        self._make_link_options(), cache=self._link_cache())
             self.diagnostics.insert(diags, str(self.output))
         except LinkageFailure as err:
             self.diagnostics.insert(err.diags, str(self.output))
             err.target = self
             raise
-        self.cache['link_args'] = [str(a) for a in commands[0]]
+        self.cache['link_args'] = self._link_fingerprint(commands[0])
         self.debug('done')
 
     async def __install__(self, installer: Installer):
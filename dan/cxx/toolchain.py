@@ -1,9 +1,12 @@
+import contextlib
 from enum import Enum
+import re
 import dan.core.diagnostics as diag
 from dan.core.pathlib import Path
 from dan.core.settings import BuildType, ToolchainSettings
 from dan.core.target import FileDependency
-from dan.core.runners import async_run, sync_run, CommandError
+from dan.core import aiofiles
+from dan.core.runners import Environ, async_run, environ, list2argv, sync_run, CommandError
 from dan.core.version import Version
 from dan.logging import Logging
 from dan.cxx.compile_commands import CompileCommands
@@ -12,6 +15,9 @@ import typing as t
 
 import tempfile
 
+if t.TYPE_CHECKING:
+    from dan.cxx.compile_cache import CompileCache, LinkCache
+
 CommandArgs = list[str|Path]
 CommandArgsList = list[CommandArgs]
 
@@ -101,11 +107,13 @@ class Toolchain(Logging):
         self.cache = dict() if cache is None else cache
         self.get_logger(f'{self.type}-{self.version}')
         self.env = None
+        self._run_env: Environ = None
         self.rpath = None
         self._build_type = BuildType.debug
         self.compile_options: list[str] = list()
         self.link_options: list[str] = list()
         self.rpath = None
+        self.file_prefix_map: dict[str, str] = None
         self.runtime = RuntimeType.dynamic
         self.build_type = BuildType.debug
 
@@ -139,12 +147,11 @@ class Toolchain(Logging):
         self.cache['arch'] = arch
         self.cache['arch_detect_flags'] = self.settings.cxx_flags
         
-        from dan.core.osinfo import OSInfo
-        osi = OSInfo()
-        osi.name = SystemName(osi.name)
+        from dan.core.osinfo import info as osi
+        host_system = SystemName(osi.name)
         is_host = False
         if self.arch == osi.arch:
-            if self.system == osi.name or self.system.is_windows and osi.name.is_windows:
+            if self.system == host_system or self.system.is_windows and host_system.is_windows:
                 is_host = True
 
         self.cache['is_host'] = is_host
@@ -211,8 +218,41 @@ class Toolchain(Logging):
         """Convert flags from target-compiler-style to unix-style"""
         return flags
 
-    async def compile(self, sourcefile: Path, output: Path, options: set[str], build_type=None, **kwds):
+    compile_cache_support = False
+    """Whether compilations and links can be cached (see :mod:`dan.cxx.compile_cache`)"""
+
+    async def compile(self, sourcefile: Path, output: Path, options: set[str], build_type=None, cache: 'CompileCache' = None, **kwds):
         commands = self.make_compile_commands(sourcefile, output, options, build_type)
+        return await self._compile(sourcefile, output, options, commands, cache, **kwds)
+
+    pch_support = False
+    """Whether precompiled headers are supported (see :attr:`CXXTarget.precompiled_headers`)"""
+
+    def make_pch_name(self, header: Path) -> Path:
+        raise NotImplementedError()
+
+    def make_pch_commands(self, header: Path, output: Path, options: set[str], build_type=None) -> CommandArgsList:
+        raise NotImplementedError()
+
+    def pch_compatible(self, sourcefile: Path) -> bool:
+        """Whether the given source can use the precompiled headers (built as C++ headers)"""
+        raise NotImplementedError()
+
+    def make_pch_options(self, header: Path, pch: Path) -> list[str]:
+        """Options making a compilation use the given precompiled header"""
+        raise NotImplementedError()
+
+    async def precompile_header(self, header: Path, output: Path, options: set[str], build_type=None, **kwds):
+        commands = self.make_pch_commands(header, output, options, build_type)
+        return await self._compile(header, output, options, commands, None, **kwds)
+
+    async def _compile(self, sourcefile: Path, output: Path, options: set[str], commands: CommandArgsList, cache: 'CompileCache' = None, **kwds):
+        """Run (or restore) a compilation, returns its commands, diagnostics and dependencies"""
+        if cache is not None:
+            diags = await cache.restore(sourcefile, output, commands, log=kwds.get('log', True))
+            if diags is not None:
+                self.debug('%s restored from cache', output.name)
+                return commands, diags, await self.scan_dependencies(sourcefile, output, options)
         diags = []
         if diag.enabled:
             async def capture(stream):
@@ -220,18 +260,28 @@ class Toolchain(Logging):
                     async for diag in self._handle_compile_output(lines):
                         diags.append(diag)
             kwds['all_capture'] = capture
+        outputs = list()
         for index, command in enumerate(commands):
             try:
-                await self.run(f'compile{index}', output, command, **kwds, cwd=output.parent)
+                out, err, _ = await self.run(f'compile{index}', output, command, **kwds, cwd=output.parent, pool='compile')
+                outputs.append((out, err))
             except CommandError as err:
                 raise CompilationFailure(err, sourcefile, options, command, self, diags) from None
-        return commands, diags
+        deps = await self.scan_dependencies(sourcefile, output, options)
+        if cache is not None:
+            await cache.store_result(sourcefile, output, commands, deps, outputs, diags)
+        return commands, diags, deps
 
     def make_link_commands(self, objects: set[Path], output: Path, options: set[str]) -> CommandArgsList:
         raise NotImplementedError()
 
-    async def link(self, objects: set[Path], output: Path, options: set[str], **kwds):
+    async def link(self, objects: set[Path], output: Path, options: set[str], cache: 'LinkCache' = None, **kwds):
         commands = self.make_link_commands(objects, output, options)
+        if cache is not None:
+            diags = await cache.restore(output, commands, log=kwds.get('log', True))
+            if diags is not None:
+                self.debug('%s restored from cache', output.name)
+                return commands, diags
         diags = []
         if diag.enabled:
             async def capture(stream):
@@ -239,36 +289,89 @@ class Toolchain(Logging):
                     async for diag in self._handle_link_output(lines):
                         diags.append(diag)
             kwds['all_capture'] = capture
+        outputs = list()
         for index, command in enumerate(commands):
             try:
-                await self.run(f'link{index}', output, command, **kwds, cwd=output.parent)
+                out, err, _ = await self.run(f'link{index}', output, command, **kwds, cwd=output.parent, pool='link')
+                outputs.append((out, err))
             except CommandError as err:
                 raise LinkageFailure(err, objects, options, command, self, diags) from None
+        if cache is not None:
+            await cache.store_result(output, commands, outputs, diags)
         return commands, diags
 
     def make_static_lib_commands(self, objects: set[Path], output: Path, options: set[str]) -> CommandArgsList:
         raise NotImplementedError()
 
-    async def static_lib(self, objects: set[Path], output: Path, options: set[str], **kwds):
+    async def static_lib(self, objects: set[Path], output: Path, options: set[str], cache: 'LinkCache' = None, **kwds):
         commands = self.make_static_lib_commands(objects, output, options)
+        if cache is not None and await cache.restore(output, commands, log=kwds.get('log', True)) is not None:
+            self.debug('%s restored from cache', output.name)
+            return commands
+        outputs = list()
         for index, command in enumerate(commands):
             try:
-                await self.run(f'static_lib{index}', output, command, **kwds, cwd=output.parent)
+                out, err, _ = await self.run(f'static_lib{index}', output, command, **kwds, cwd=output.parent, pool='archive')
+                outputs.append((out, err))
             except CommandError as err:
                 raise LinkageFailure(err, objects, options, command, self) from None
+        if cache is not None:
+            await cache.store_result(output, commands, outputs, [])
         return commands
 
     def make_shared_lib_commands(self, objects: set[Path], output: Path, options: set[str]) -> tuple[Path, CommandArgsList]:
         raise NotImplementedError()
 
-    async def shared_lib(self, objects: set[Path], output: Path, options: set[str], **kwds):
+    async def shared_lib(self, objects: set[Path], output: Path, options: set[str], cache: 'LinkCache' = None, **kwds):
         commands = self.make_shared_lib_commands(objects, output, options)
+        if cache is not None and await cache.restore(output, commands, log=kwds.get('log', True)) is not None:
+            self.debug('%s restored from cache', output.name)
+            return commands
+        outputs = list()
         for index, command in enumerate(commands):
-            await self.run(f'shared_lib{index}', output, command, **kwds, cwd=output.parent)
+            out, err, _ = await self.run(f'shared_lib{index}', output, command, **kwds, cwd=output.parent, pool='link')
+            outputs.append((out, err))
+        if cache is not None:
+            await cache.store_result(output, commands, outputs, [])
         return commands
 
+    @property
+    def run_env(self) -> Environ:
+        """Environment of the toolchain commands (computed once)"""
+        if self._run_env is None:
+            self._run_env = environ({**(self.env or dict()), 'LC_ALL': 'C'})
+        return self._run_env
+
+    response_file_threshold = 32 << 10
+    """Commands longer than this (in characters) get their arguments from a response file"""
+
+    def make_response_file(self, args: list[str]) -> str:
+        """Content of a response file holding the given arguments"""
+        return '\n'.join(re.sub(r'([\\\s\'"])', r'\\\1', arg) for arg in args) + '\n'
+
+    @contextlib.asynccontextmanager
+    async def response_file(self, name: str, output: Path, args: list):
+        """Get the command to run, its arguments being passed through a response file when it is too long
+
+        The response file (<output>.<name>.rsp) is removed once the command is done.
+        Targets' up-to-date checks keep comparing the complete arguments.
+        """
+        args = list2argv(args)
+        if output is None or sum(len(arg) + 1 for arg in args) <= self.response_file_threshold:
+            yield args
+            return
+        rsp = output.parent / f'{output.name}.{name}.rsp'
+        rsp.parent.mkdir(parents=True, exist_ok=True)
+        async with aiofiles.open(rsp, 'w') as f:
+            await f.write(self.make_response_file(args[1:]))
+        try:
+            yield [args[0], f'@{rsp}']
+        finally:
+            rsp.unlink(missing_ok=True)
+
     async def run(self, name: str, output: Path, args, quiet=False, **kwds) -> tuple[str, str, int]:
-        return await async_run(args, env={**(self.env or dict()), 'LC_ALL': 'C'}, logger=self if not quiet else None, **kwds)
+        async with self.response_file(name, output, args) as args:
+            return await async_run(args, env=self.run_env, logger=self if not quiet else None, **kwds)
 
     @property
     def cxxmodules_flags(self) -> list[str]:
@@ -1,4 +1,5 @@
 from functools import cached_property
+import re
 from dan.core import aiofiles, diagnostics as diag
 from dan.core.pm import re_match
 from dan.core.settings import BuildType
@@ -10,10 +11,14 @@ from dan.core.runners import sync_run
 import typing as t
 
 cxx_extensions = ['.cpp', '.cxx', '.C', '.cc']
+cxx_header_extensions = ['.hpp', '.hxx', '.hh']
 c_extensions = ['.c']
 
 
 class UnixToolchain(Toolchain):
+    compile_cache_support = True
+    pch_support = True
+
     def __init__(self, data, tools, *args, **kwargs):
         Toolchain.__init__(self, data, tools, *args, **kwargs)
         self.cc = Path(data['cc'])
@@ -124,7 +129,7 @@ class UnixToolchain(Toolchain):
 
     def get_base_compile_args(self, sourcefile: Path, build_type) -> list[str]:
         match sourcefile.suffix:
-            case _ if sourcefile.suffix in cxx_extensions:
+            case _ if sourcefile.suffix in cxx_extensions or sourcefile.suffix in cxx_header_extensions:
                 return [self.cxx, *self.default_cxxflags, *self.get_optimization_flags(build_type), *self.default_cflags]
             case _ if sourcefile.suffix in c_extensions:
                 return [self.cc, *self.get_optimization_flags(build_type), *self.default_cflags]
@@ -133,18 +138,17 @@ class UnixToolchain(Toolchain):
                     f'Unhandled source file extention: {sourcefile.suffix}')
 
     async def scan_dependencies(self, sourcefile: Path, output: Path, options: set[str]) -> set[FileDependency]:
-        deps_path = output.with_suffix(".o.d")
+        deps_path = output.with_suffix(output.suffix + '.d')
         deps = list()
         if deps_path.exists():
             async with aiofiles.open(deps_path, 'r') as f:
-                for dep in await f.readlines():
-                    dep = dep.strip()
-                    if dep.endswith('\\'):
-                        dep = dep[:-2]
-                    deps.append(dep.strip())
-                _obj = deps.pop(0)
-                if len(deps) > 0:
-                    _src = deps.pop(0)
+                content = await f.read()
+            # make rule ("<object>: <source> <headers>..."), possibly continued on several lines
+            # with several paths per line (spaces in paths being escaped)
+            content = content.replace('\\\n', ' ')
+            deps = [dep.replace('\\ ', ' ') for dep in re.split(r'(?<!\\)\s+', content.strip()) if dep]
+            # object and source
+            deps = deps[2:]
         return set(deps)
 
     def compile_generated_files(self, output: Path) -> set[Path]:
@@ -160,8 +164,37 @@ class UnixToolchain(Toolchain):
                     '-MF', f'{output}.d', '-o', str(output), '-c', str(sourcefile)])
         if auto_fpic:
             args.insert(1, '-fPIC')
+        if self.file_prefix_map:
+            args[1:1] = self.prefix_map_flags
         return [args]
 
+    def make_pch_name(self, header: Path) -> Path:
+        return header.with_name(header.name + ('.pch' if self.type == 'clang' else '.gch'))
+
+    def make_pch_commands(self, header: Path, output: Path, options: set[str], build_type=None) -> CommandArgsList:
+        commands = self.make_compile_commands(header, output, options, build_type)
+        commands[0][-1:-1] = ['-x', 'c++-header']
+        return commands
+
+    def pch_compatible(self, sourcefile: Path) -> bool:
+        return sourcefile.suffix in cxx_extensions or sourcefile.suffix in cxx_header_extensions
+
+    def make_pch_options(self, header: Path, pch: Path) -> list[str]:
+        if self.type == 'clang':
+            return ['-include-pch', str(pch)]
+        # gcc looks for <header>.gch (and warns if it cannot be used)
+        return ['-include', str(header), '-Winvalid-pch']
+
+    @property
+    def prefix_map_flags(self) -> list[str]:
+        """Prefix-map flags rewriting the paths embedded in the objects (debug info and macros)"""
+        if (self.type == 'gcc' and self.version.major >= 8) or (self.type == 'clang' and self.version.major >= 10):
+            option = '-ffile-prefix-map'
+        else:
+            option = '-fdebug-prefix-map'
+        # the last matching map applies: least specific first
+        return [f'{option}={old}={new}' for old, new in self.file_prefix_map.items()]
+
     def make_link_commands(self, objects: set[Path], output: Path, options: list[str]) -> CommandArgsList:
         args = [self.cxx, *objects, '-o', str(output), *unique(
             self.default_ldflags, self.default_cflags, self.default_cxxflags, self.link_options, options)]
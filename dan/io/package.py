@@ -1,8 +1,11 @@
 import os
 import re
+import tarfile
 
-from dan.core import aiofiles, asyncio
+from dan.core import actioncache, aiofiles, asyncio, digest
 from dan.core.pathlib import Path
+from dan.core.requirements import load_requirements
+from dan.core.runners import async_run
 from dan.core.settings import InstallMode, InstallSettings
 from dan.core.target import Target
 from dan.core.find import find_file, find_files
@@ -11,6 +14,33 @@ from dan.io.repositories import get_packages_path, get_repo_instance
 from dan.src.base import SourcesProvider
 
 
+def _archive_install_tree(root: Path, archive: Path, excluded: set[str]):
+    with tarfile.open(archive, 'w') as f:
+        for child in sorted(root.iterdir()):
+            if child.name not in excluded:
+                f.add(child, child.name)
+
+
+def _outside(path: str) -> bool:
+    path = os.path.normpath(path)
+    return os.path.isabs(path) or path == '..' or path.startswith('..' + os.sep)
+
+
+def _extract_install_tree(archive: Path, root: Path):
+    """Extract an install tree (from a possibly shared cache): nothing can be written outside of root"""
+    with tarfile.open(archive) as f:
+        if hasattr(tarfile, 'data_filter'):
+            f.extractall(root, filter='data')
+            return
+        for member in f.getmembers():
+            if _outside(member.name) \
+                    or (member.issym() and _outside(os.path.join(os.path.dirname(member.name), member.linkname))) \
+                    or (member.islnk() and _outside(member.linkname)) \
+                    or not (member.isfile() or member.isdir() or member.issym() or member.islnk()):
+                raise RuntimeError(f'invalid install tree member: {member.name}')
+        f.extractall(root)
+
+
 class PackageBuild(Target, internal=True):
 
     inherits_version = False
@@ -82,12 +112,7 @@ class PackageBuild(Target, internal=True):
         # update package build-path
         makefile.build_path = self.build_path / 'build'
         
-        for target in self.package_makefile.all_installed:
-            for provided in target.provides:
-                pkg_file = find_file(rf'(lib)?{provided}.pc', [self.install_settings.libraries_destination, self.install_settings.data_destination], re.IGNORECASE)
-                if pkg_file is None:
-                    self.__up_to_date = False
-                    break
+        self.__up_to_date = self.__installed()
 
         for target in self.package_makefile.all_installed:
             for source_target in target.preload_dependencies.all:
@@ -98,6 +123,14 @@ class PackageBuild(Target, internal=True):
 
         return await super().__initialize__()
     
+    def __installed(self):
+        for target in self.package_makefile.all_installed:
+            for provided in target.provides:
+                pkg_file = find_file(rf'(lib)?{provided}.pc', [self.install_settings.libraries_destination, self.install_settings.data_destination], re.IGNORECASE)
+                if pkg_file is None:
+                    return False
+        return True
+
     @property
     def up_to_date(self):
         return self.__up_to_date
@@ -107,14 +140,20 @@ class PackageBuild(Target, internal=True):
         return self._build_path
     
     async def __build__(self):
-        if self.lock.locked:
-            self.info('package %s %s is locked, waiting for it to be released...', self.name, self.version)
-            # wait for it
-            async with self.lock:
-                if self.up_to_date:
-                    return
+        if not self.lock.try_acquire():
+            self.info('package %s %s is locked by %s, waiting for it to be released...', self.name, self.version, self.lock.holder)
+            await self.lock.acquire()
+            # it may have been built meanwhile
+            if self.__installed():
+                self.__up_to_date = True
+                self.lock.release()
+                return
 
-        async with self.lock:
+        try:
+            store = actioncache.get_store()
+            key = await self._install_key() if store is not None else None
+            if key is not None and await self.__restore_install_tree(store, key):
+                return
 
             makefile = self.package_makefile
             build_path = makefile.build_path
@@ -152,6 +191,73 @@ class PackageBuild(Target, internal=True):
                 async with asyncio.TaskGroup(f'cleanup {self.name}') as group:
                     group.create_task(aiofiles.rmtree(build_path, force=True))
 
+            if key is not None:
+                await self.__store_install_tree(store, key)
+        finally:
+            self.lock.release()
+
+    @asyncio.cached
+    async def _install_key(self) -> str | None:
+        """Key of the install tree in the actions cache (None if the repository revision is unknown)
+
+        The install tree is stored as a whole: it is identified by the package, the revision of
+        its repository (recipes), the toolchain, the options and the packages it requires
+        (by their own keys). Installed files may embed the install path (eg.: pkg-config
+        prefixes), so it is part of the key.
+        """
+        out, _, rc = await async_run(['git', 'rev-parse', 'HEAD'], logger=self, cwd=self.repo.output, no_raise=True, log=False)
+        if rc != 0:
+            return None
+        requirements = await self._requirements_ids()
+        if requirements is None:
+            return None
+        database = digest.get_database(self.makefile.root.build_path)
+        toolchain = self.toolchain
+        return actioncache.make_key('package', self.name, str(self.version), str(self.build_path), out.strip(),
+                                    [actioncache.tool_fingerprint(tool, database) for tool in (toolchain.cc, toolchain.cxx)],
+                                    str(toolchain.version), toolchain.build_type.name,
+                                    toolchain.compile_options, toolchain.link_options,
+                                    self.package_makefile.options.sha1, requirements)
+
+    async def _requirements_ids(self) -> list | None:
+        """Identity of the packages required by this package (installing them)
+
+        Packages installed from a repository are identified by their install key (resolved
+        version, options and own requirements), other ones by their version.
+        """
+        ids = list()
+        for target in sorted(self.package_makefile.all_installed, key=lambda target: target.fullname):
+            requires = target.requires
+            if not requires:
+                continue
+            await load_requirements(requires, makefile=target.makefile, name=target.name, logger=target)
+            for req in requires:
+                pkg = IoPackage.get(req.name)
+                if pkg is not None and pkg.pkg_build is not self:
+                    key = await pkg.pkg_build._install_key()
+                    if key is None:
+                        return None
+                    ids.append((req.name, key))
+                else:
+                    ids.append((req.name, str(req.target.version)))
+        return ids
+
+    async def __restore_install_tree(self, store: actioncache.LocalStore, key: str) -> bool:
+        entry = await store.fetch(key)
+        if entry is None or entry.files != ['install.tar']:
+            return False
+        self.info('restoring %s %s from cache', self.name, self.version)
+        await asyncio.async_wait(_extract_install_tree, entry.path / 'install.tar', self.build_path)
+        return True
+
+    async def __store_install_tree(self, store: actioncache.LocalStore, key: str):
+        archive = self.build_path.parent / f'.{self.build_path.name}.tar'
+        try:
+            await asyncio.async_wait(_archive_install_tree, self.build_path, archive, {'build', 'build.lock'})
+            await store.async_put(key, {'install.tar': archive})
+        finally:
+            archive.unlink(missing_ok=True)
+
 class ReusePackage(BaseException):
     def __init__(self, pkg):
         self.pkg = pkg
@@ -159,6 +265,7 @@ class ReusePackage(BaseException):
 class IoPackage(Target, internal=True):
     
     inherits_version = False
+    restat = True
 
     __all: dict[str, 'IoPackage'] = dict()
 
@@ -187,6 +294,13 @@ class IoPackage(Target, internal=True):
             if t.name == name or name in t.provides:
                 return t
 
+    @classmethod
+    def get(cls, name) -> 'IoPackage':
+        """Get the (registered) package providing name"""
+        for pkg in cls.__all.values():
+            if pkg.name == name or pkg.find(name) is not None:
+                return pkg
+
     @classmethod
     async def instance(cls, name, version, *args, package=None, **kwargs):
 
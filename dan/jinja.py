@@ -1,17 +1,18 @@
 import aiofiles
 from dan.core.pathlib import Path
 from dan.core.target import Target, TargetDependencyLike
-from dan.core import asyncio
+from dan.core import actioncache, asyncio
 from typing import Callable
 import inspect
 
 
 class generator:
-    def __init__(self, output: str, template: str, dependencies: TargetDependencyLike = None, options: dict = None):
+    def __init__(self, output: str, template: str, dependencies: TargetDependencyLike = None, options: dict = None, cacheable=False):
         self.output = Path(output)
         self.dependencies = list() if dependencies is None else dependencies
         self.template = template
         self.options = dict() if options is None else options
+        self.cacheable = cacheable
 
     def __call__(self, fn: Callable):
         class JinjaGenerator(Target):
@@ -20,6 +21,11 @@ class generator:
             template = self.template
             dependencies = [*self.dependencies, self.template]
             options = self.options
+            restat = True
+            cacheable = self.cacheable
+
+            def cache_recipe(self):
+                return actioncache.code_fingerprint(fn)
 
             async def __build__(self):
                 import jinja2
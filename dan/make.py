@@ -1,4 +1,4 @@
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 import functools
 import itertools
 import os
@@ -8,23 +8,24 @@ from dataclasses_json import dataclass_json
 import sys
 from collections.abc import Iterable
 
+import dan
 from dan import logging
 
 import dan.core.typing as t
-from dan.core import diagnostics as diag
+from dan.core import cache, diagnostics as diag, digest
 from dan.core.cache import Cache
 from dan.core.makefile import MakeFile
 from dan.core.pathlib import Path
 from dan.core.include import MakeFileError, include_makefile, Context
-from dan.core import aiofiles, asyncio
+from dan.core import actioncache, aiofiles, asyncio, graph, jobcontrol, pathmap, statcache, trace
 from dan.core.requirements import RequiredPackage, load_requirements
+from dan.core.snapshot import GraphSnapshot, get_snapshot
+from dan.core.scheduling import DurationHistory, assign_priorities, build_dependencies, get_history
 from dan.core.settings import InstallMode, InstallSettings, Settings
 from dan.core.test import Test
 from dan.core.utils import unique
-from dan.cxx import init_toolchains
 from dan.core.target import Option, Target
-from dan.cxx.targets import Executable
-from dan.core.runners import max_jobs
+from dan.core.runners import configure_pools, max_jobs
 from dan.core.terminal import TerminalMode, TermStream, set_mode as set_terminal_mode
 
 
@@ -151,8 +152,11 @@ class Make(logging.Logging):
         terminal_mode: TerminalMode = None,
         diags=False,
     ):
-        jobs = jobs or os.cpu_count()
+        jobs = jobs or jobcontrol.default_jobs()
         max_jobs(jobs)
+        self.jobs = jobs
+        statcache.clear()
+        graph.invalidate()
 
         match verbose:
             case 1:
@@ -218,7 +222,7 @@ class Make(logging.Logging):
 
     @property
     def env(self) -> dict[str, str]:
-        from dan.cxx.detect import get_dan_path
+        from dan.core.paths import get_dan_path
 
         env = self.toolchain.env
         epath = env.get("PATH", os.environ["PATH"]).split(os.pathsep)
@@ -231,6 +235,55 @@ class Make(logging.Logging):
         env["PATH"] = os.pathsep.join(epath)
         return env
 
+    @functools.cached_property
+    def snapshot(self) -> GraphSnapshot:
+        return get_snapshot(self.build_path)
+
+    @property
+    def _snapshot_inputs(self) -> bytes:
+        """Build request, configuration and dan version fingerprinted by the graph snapshot"""
+        return f"{sorted(self.required_targets or [])}:{self.for_install}:{self.config.to_json()}:{dan.__version__}".encode()
+
+    def _loaded_modules(self) -> set[str]:
+        """Files of the python modules loaded from the source tree (makefiles helpers), and dan's own when not installed"""
+        files = set()
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, "__file__", None)
+            if path is None:
+                continue
+            path = Path(path)
+            if (path.is_relative_to(self.source_path) and not path.is_relative_to(self.build_path)) \
+                    or (dan.__version__ is None and name.split(".")[0] == "dan"):
+                files.add(str(path))
+        return files
+
+    @property
+    def _snapshot_files(self) -> list[str]:
+        """Files fingerprinted by the graph snapshot
+
+        The toolchains, the makefiles and the python modules they load, and the directories
+        holding them and the targets' inputs (new files may match the sources patterns).
+        """
+        from dan.core.paths import get_toolchain_path
+
+        toolchains_path = get_toolchain_path()
+        return [
+            str(toolchains_path),
+            str(toolchains_path.with_suffix(".json")),
+            *sorted({*(str(p) for p in self.context.imported_makefiles.keys()), *self._loaded_modules()}),
+            *sorted(str(d) for d in self._watched_directories()),
+        ]
+
+    @functools.cached_property
+    def durations(self) -> DurationHistory:
+        return get_history(self.build_path)
+
+    def _record_durations(self, targets: Iterable[Target]):
+        for t in targets:
+            if t.duration is not None:
+                self.durations.record(t.fullname, t.duration)
+            self._record_durations(t.subtargets)
+
     async def configure(self, source_path: str, toolchain: str = None):
         self.config.source_path = str(source_path)
         self.config.build_path = str(self.build_path)
@@ -242,6 +295,14 @@ class Make(logging.Logging):
             self.warning("no toolchain configured")
         await self._config.save()
 
+    def _configure_pools(self):
+        sizes = asdict(self.settings.pools)
+        for name, size in sizes.items():
+            if size == 0:
+                sizes[name] = jobcontrol.default_link_jobs(self.jobs) if name == 'link' else self.jobs
+        configure_pools(sizes)
+        self.debug("pools: %s", ", ".join(f"{name}={size}" for name, size in sizes.items()))
+
     @asyncio.cached
     async def initialize(self):
         assert self.config_path.exists(), "configure first"
@@ -254,16 +315,36 @@ class Make(logging.Logging):
 
         self.info(f"using '{toolchain}' toolchain in '{build_type.name}' mode")
 
+        digest.enabled = self.settings.content_digest
+        if digest.enabled:
+            self.debug("content-digest up-to-date checks enabled")
+
+        jobcontrol.enabled = self.settings.adaptive_jobs
+        cache.compression = self.settings.cache_compression
+        pathmap.configure(self.source_path, self.build_path)
+        actioncache.configure(self.settings.action_cache)
+        if actioncache.enabled:
+            store = actioncache.get_store()
+            self.debug("actions cache: %s", store.root)
+            if store.remote is not None:
+                self.debug("remote cache: %s%s", store.remote, " (read-only)" if store.remote.read_only else "")
+        self._configure_pools()
+
+        from dan.cxx import init_toolchains
+
         with self.context:
             init_toolchains(toolchain, self.settings)
             try:
-                include_makefile(self.source_path, self.build_path)
+                with trace.slice("make", "load makefiles"):
+                    include_makefile(self.source_path, self.build_path)
             except MakeFileError as err:
                 self._diagnostics.update(gen_python_diags(err))
                 raise
 
         target_toolchain = self.context.get("cxx_target_toolchain")
         target_toolchain.build_type = build_type
+        if actioncache.enabled and self.settings.action_cache.prefix_map:
+            target_toolchain.file_prefix_map = pathmap.current().prefix_map()
         if self.for_install:
             library_dest = (
                 Path(self.settings.install.destination)
@@ -273,22 +354,22 @@ class Make(logging.Logging):
 
         self.debug(f"targets: {[t.name for t in self.targets]}")
 
-    def __matches(self, target: Target | Test):
-        for required in self.required_targets:
+    @staticmethod
+    def __matches(target: Target | Test, names: list[str]):
+        for required in names:
             if fnmatch.fnmatch(target.fullname, f"*{required}*"):
                 return True
         return False
 
+    def select_targets(self, names: list[str] = None) -> list[Target]:
+        """Targets matching the given names (default targets when no name is given)"""
+        if names:
+            return [target for target in self.root.all_targets if self.__matches(target, names)]
+        return self.root.all_default
+
     @functools.cached_property
     def targets(self) -> list[Target]:
-        items = list()
-        if self.required_targets and len(self.required_targets) > 0:
-            for target in self.root.all_targets:
-                if self.__matches(target):
-                    items.append(target)
-        else:
-            items = self.root.all_default
-        return items
+        return self.select_targets(self.required_targets)
 
     @functools.cached_property
     def tests(self) -> list[Test]:
@@ -371,16 +452,21 @@ class Make(logging.Logging):
             if isinstance(target, CXXObjectsTarget)
         ]
 
+        tasks: list[asyncio.Task] = list()
+
         def _on_done(task: asyncio.Task):
             nonlocal result
             if not task.cancelled():
                 done = None not in result.values()
                 if done:
-                    g.cancel()
+                    for other in tasks:
+                        other.cancel()
 
         async with asyncio.TaskGroup() as g:
             for t in object_targets:
-                g.create_task(asyncio.async_wait(check, t)).add_done_callback(_on_done)
+                task = g.create_task(asyncio.async_wait(check, t))
+                task.add_done_callback(_on_done)
+                tasks.append(task)
 
         return result
 
@@ -396,6 +482,7 @@ class Make(logging.Logging):
                     return opt.cache, opt.value, opt.type
 
         _apply_inputs(options, get_option, logger=self, input_type_name="option")
+        self.snapshot.invalidate()
 
     async def apply_settings(self, *settings):
         from dan.core.settings import apply_settings
@@ -408,6 +495,13 @@ class Make(logging.Logging):
 
         return get_toolchains()
 
+    async def _initialize_target(self, t: Target):
+        try:
+            await t.initialize()
+        except Exception as err:
+            self._diagnostics.update(gen_python_diags(err))
+            raise
+
     async def _build_target(self, t: Target):
         try:
             await t.build()
@@ -431,25 +525,200 @@ class Make(logging.Logging):
                     deps.add(d)
                     await self.get_all_dependencies(d, deps)
 
+    def _snapshot_up_to_date(self) -> bool:
+        if not self.snapshot.matches(self._snapshot_inputs):
+            self.debug("graph snapshot outdated")
+            return False
+        return self.snapshot.up_to_date()
+
+    def _report_stats(self):
+        counters = statcache.counters()
+        self.debug(
+            "stat cache: %d lookups, %d stat calls, %d directory scans",
+            counters["lookups"],
+            counters["stat_calls"],
+            counters["scans"],
+        )
+        trace.counter("make", "stat cache", **counters)
+
     async def build(self, targets: list[Target] = None):
+        statcache.clear()
+        use_snapshot = targets is None
+        if use_snapshot and self.root is None and self._snapshot_up_to_date():
+            self.info("everything is up to date")
+            self.term.status("up to date !", icon="✔")
+            return
+
         await self.initialize()
+        await self._build(targets)
 
+    async def _build(self, targets: list[Target] = None):
+        use_snapshot = targets is None
         if targets is None:
             targets = self.targets
 
+        checkpoints = asyncio.create_task(self._checkpoints())
+        try:
+            if self.settings.streaming:
+                await self._streaming_build(targets)
+            else:
+                await self._staged_build(targets)
+        finally:
+            checkpoints.cancel()
+            await self._save_action_cache()
+
+        if use_snapshot:
+            self.snapshot.record(self._snapshot_inputs, self._snapshot_files, targets)
+
+        self.term.status("done", icon="✔")
+
+    async def _save_action_cache(self):
+        store = actioncache.get_store()
+        if store is None:
+            return
+        await store.flush()
+        counters = store.counters
+        self.debug("actions cache: %d hits, %d misses, %d stored", counters.hits, counters.misses, counters.stores)
+        if store.remote is not None:
+            self.debug("remote cache: %d hits, %d uploads", counters.remote_hits, counters.uploads)
+        await store.save()
+
+    checkpoint_interval = 5.0
+
+    async def _checkpoints(self):
+        """Periodically save the caches while building (an interrupted build keeps its progress)"""
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await Cache.save_all()
+
+    def _loaded_targets(self, targets: list[Target] = None) -> list[Target]:
+        """Requested targets and everything they depend on (subtargets included)"""
+        if targets is None:
+            targets = self.targets
+        return graph.topological_order(targets, lambda t: [*build_dependencies(t), *t.subtargets])
+
+    @staticmethod
+    def _target_inputs(target: Target) -> list[Path]:
+        from dan.cxx.targets import CXXObject
+
+        inputs = [Path(f) for f in target.file_dependencies]
+        if isinstance(target, CXXObject):
+            inputs.append(target.source_path / target.source)
+            inputs.extend(Path(d) for d in target.scanned_deps or [])
+        return inputs
+
+    def _watched_directories(self) -> set[Path]:
+        """Directories holding the makefiles and the loaded targets' inputs (build directory excluded)"""
+        directories = {p.parent for p in self.context.imported_makefiles.keys()}
+        if self.root is not None:
+            for target in self._loaded_targets():
+                directories.update(p.parent for p in self._target_inputs(target))
+        return {d for d in directories if not d.is_relative_to(self.build_path)}
+
+    def _affected_targets(self, changed: set[Path]) -> set[Target]:
+        """Targets having one of the changed paths as input, and their dependents"""
+        targets = self._loaded_targets()
+        dependents: dict[Target, list[Target]] = dict()
+        affected = list()
+        for target in targets:
+            for dep in (*build_dependencies(target), *target.subtargets):
+                dependents.setdefault(dep, list()).append(target)
+            if not changed.isdisjoint(self._target_inputs(target)):
+                affected.append(target)
+        return set(graph.topological_order(affected, lambda t: dependents.get(t, ())))
+
+    async def rebuild(self, changed: set[Path]):
+        """Rebuild the loaded graph after the given paths changed
+
+        Only the targets depending on the changed paths are checked again, the others keep
+        their last build result.
+        """
+        affected = self._affected_targets(changed)
+        if not affected:
+            return
+        statcache.invalidate(*changed)
+        for target in affected:
+            target.reset_build()
+        self.debug("%d targets affected", len(affected))
+        await self._build()
+
+    async def watch(self, debounce: float = 0.2) -> bool:
+        """Build then rebuild on each change of the targets' inputs
+
+        Returns when a makefile changed (the project has to be loaded again).
+        """
+        from dan.core.watch import make_watcher
+
+        async def build(coro):
+            try:
+                await coro
+            except Exception as err:
+                self.error("build failed: %s", err)
+                self.term.status("failed", icon="✘")
+
+        with make_watcher() as watcher:
+            try:
+                await self.initialize()
+            except Exception as err:
+                self.error("cannot load the project: %s", err)
+                watcher.watch({p.parent for p in self.context.imported_makefiles.keys()} or {self.source_path})
+                await watcher.changes(debounce)
+                return True
+            await build(self.build())
+            while True:
+                watcher.watch(self._watched_directories())
+                self.info("watching for changes...")
+                changed = await watcher.changes(debounce)
+                if changed is None or not changed.isdisjoint(self.context.imported_makefiles.keys()):
+                    self.info("makefiles changed, reloading...")
+                    return True
+                await build(self.rebuild(changed))
+
+    async def _staged_build(self, targets: list[Target]):
+        """Resolve and initialize the whole graph, then build it"""
         all_targets = set()
-        async with self.term.task_group("installing dependencies...") as g:
-            for t in targets:
-                g.create_task(self.get_all_dependencies(t, all_targets))
+        with trace.slice("make", "install dependencies"):
+            async with self.term.task_group("installing dependencies...") as g:
+                for t in targets:
+                    g.create_task(self.get_all_dependencies(t, all_targets))
 
         all_targets.update(targets)
 
-        self.term.status("building...")
-        async with self.term.task_group("building...") as g:
-            for t in all_targets:
-                g.create_task(self._build_target(t))
+        # objects are known once targets are initialized
+        with trace.slice("make", "initialize"):
+            async with self.term.task_group("initializing...") as g:
+                for t in all_targets:
+                    g.create_task(self._initialize_target(t))
+        assign_priorities(all_targets, self.durations)
 
-        self.term.status("done", icon="✔")
+        self.term.status("building...")
+        try:
+            with trace.slice("make", "build"):
+                async with self.term.task_group("building...") as g:
+                    for t in sorted(all_targets, key=lambda t: t.priority, reverse=True):
+                        g.create_task(self._build_target(t))
+        finally:
+            self._record_durations(all_targets)
+            self._report_stats()
+
+    async def _streaming_build(self, targets: list[Target]):
+        """Build targets as soon as their own inputs are known
+
+        Requirements are resolved (and installed) by each target while being preloaded,
+        so that targets not depending on a package build while packages are fetched.
+        Priorities are assigned on the statically known graph.
+        """
+        assign_priorities(targets, self.durations)
+        self.term.status("building...")
+        try:
+            with trace.slice("make", "build"):
+                async with self.term.task_group("building...") as g:
+                    for t in sorted(targets, key=lambda t: t.priority, reverse=True):
+                        g.create_task(self._build_target(t))
+        finally:
+            all_targets = graph.topological_order(targets, lambda t: list(build_dependencies(t)))
+            self._record_durations(all_targets)
+            self._report_stats()
 
     async def _install_target_deps(self, t: Target):
         deps_install_path = self.root.pkgs_path
@@ -558,7 +827,9 @@ class Make(logging.Logging):
                 raise RuntimeError(f"Unhandled package type: {pkg_type}")
 
     @property
-    def executable_targets(self) -> list[Executable]:
+    def executable_targets(self) -> list['Executable']:
+        from dan.cxx.targets import Executable
+
         return [exe for exe in self.targets if isinstance(exe, Executable)]
 
     async def scan_toolchains(self, script: Path = None):
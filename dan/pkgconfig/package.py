@@ -1,5 +1,4 @@
 from copy import deepcopy
-import jinja2
 from dan.core import aiofiles, asyncio
 from dan.core.pathlib import Path
 import re
@@ -403,10 +402,11 @@ def get_cached_bindirs():
 
     return __bindirs
 
-_jinja_env: jinja2.Environment = None
+_jinja_env: 'jinja2.Environment' = None
 def _get_jinja_env():
     global _jinja_env
     if _jinja_env is None:
+        import jinja2
         _jinja_env = jinja2.Environment(
             loader=jinja2.PackageLoader('dan.pkgconfig'))
     return _jinja_env
@@ -457,6 +457,5 @@ async def create_pkg_config(lib: Library, settings: InstallSettings) -> Path:
             'requires': requires
         })
     dest.parent.mkdir(parents=True, exist_ok=True)
-    async with aiofiles.open(dest, 'w') as f:
-        await f.write(data)
+    await aiofiles.write_if_changed(dest, data)
     return dest
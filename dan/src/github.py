@@ -1,5 +1,4 @@
 import json
-import aiohttp
 
 from dan.core.version import Version
 from dan.core import asyncio
@@ -55,8 +54,9 @@ class GitHubReleaseSources(TarSources, internal=True):
 
     @asyncio.cached
     async def available_versions(self) -> dict[Version, dict]:
-        self.info('fetching github releases')
+        import aiohttp
 
+        self.info('fetching github releases')
 
         api_token = None
 
@@ -70,6 +70,6 @@ class TarSources(SourcesProvider, internal=True):
             if self.patches is not None:
                 for patch in self.patches:
                     self.info('applying %s', patch)
-                    await async_run(['bash', '-c', 'cd', self.output , '&&', 'patch', '-p0', '<', self.source_path / patch], logger=self, cwd=self.output)
+                    await async_run(['patch', '-p0', '-i', self.source_path / patch], logger=self, cwd=self.output)
 
             await aiofiles.os.remove(archive_path)
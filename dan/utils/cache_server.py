@@ -0,0 +1,69 @@
+"""Reference remote cache server
+
+Minimal implementation of the bazel-remote HTTP protocol used by the remote actions cache
+(``GET``/``HEAD``/``PUT`` on ``/ac/<key>`` and ``/cas/<sha256>``), storing its content on disk.
+Meant for tests and small setups::
+
+    python -m dan.utils.cache_server --root /var/cache/dan --port 8080
+"""
+import argparse
+import hashlib
+import os
+import re
+import uuid
+
+from aiohttp import web
+
+from dan.core.pathlib import Path
+
+
+_key_expr = re.compile(r'^[0-9a-f]{64}$')
+
+
+def create_app(root: Path | str, read_only=False) -> web.Application:
+    root = Path(root)
+
+    def path_of(request: web.Request) -> Path:
+        kind = request.match_info['kind']
+        key = request.match_info['key']
+        if not _key_expr.match(key):
+            raise web.HTTPBadRequest(text=f'invalid key: {key}')
+        return root / kind / key[:2] / key
+
+    async def get(request: web.Request):
+        path = path_of(request)
+        if not path.exists():
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+    async def put(request: web.Request):
+        if read_only:
+            raise web.HTTPForbidden()
+        path = path_of(request)
+        content = await request.read()
+        if request.match_info['kind'] == 'cas' and hashlib.sha256(content).hexdigest() != path.name:
+            raise web.HTTPBadRequest(text='content does not match its digest')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex[:8]}')
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+        return web.Response(status=200)
+
+    app = web.Application(client_max_size=1 << 30)
+    app.router.add_get('/{kind:ac|cas}/{key}', get)
+    app.router.add_put('/{kind:ac|cas}/{key}', put)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dan remote cache server')
+    parser.add_argument('--root', required=True, help='Storage directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--read-only', action='store_true', help='Refuse uploads')
+    args = parser.parse_args()
+    web.run_app(create_app(args.root, args.read_only), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
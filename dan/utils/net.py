@@ -1,18 +1,18 @@
 from pathlib import Path
 from contextlib import nullcontext
 
-import aiohttp
-
-from dan.core import aiofiles
+from dan.core import aiofiles, runners
 
 
 async def fetch_file(url, dest: Path, name: str = None, chunk_size=1024, progress=None):
+    import aiohttp
+
     if name is None:
         name = dest.name
     timeout = aiohttp.ClientTimeout(
         total=30 * 60, connect=30, sock_connect=30, sock_read=None
     )
-    async with aiohttp.ClientSession(timeout=timeout) as session:
+    async with runners.use_pool('download'), aiohttp.ClientSession(timeout=timeout) as session:
         async with session.get(url) as resp:
             if resp.status != 200:
                 message = await resp.read()
@@ -0,0 +1,7 @@
+#pragma once
+
+#define HAS_THIS_FLAG_DOES_NOT_EXIST false
+#define HAS_TIME_H true
+#define HAS_KERNEL_TIMESPEC true
+#define IS_LINUX true
+
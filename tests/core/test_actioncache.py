@@ -0,0 +1,137 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from dan.core import actioncache
+from dan.core.actioncache import LocalStore, make_key
+from dan.core.pathlib import Path
+from dan.core.settings import ActionCacheSettings
+from dan.cxx.compile_cache import ToolchainCache
+
+
+class LocalStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.store = LocalStore(self.root / 'cache')
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def make_file(self, name: str, content: bytes) -> Path:
+        path = self.root / name
+        path.write_bytes(content)
+        return path
+
+    def test_keys(self):
+        self.assertEqual(make_key('a', ['b', 1]), make_key('a', ['b', '1']))
+        # parts are delimited
+        self.assertNotEqual(make_key('ab', 'c'), make_key('a', 'bc'))
+        self.assertNotEqual(make_key(['a'], 'b'), make_key(['a', 'b']))
+
+    def test_code_fingerprint(self):
+        def make():
+            def fn(self):
+                return self.output.write_text('a')
+            return fn
+
+        def other(self):
+            return self.output.write_text('b')
+
+        self.assertEqual(make_key(actioncache.code_fingerprint(make())), make_key(actioncache.code_fingerprint(make())))
+        self.assertNotEqual(make_key(actioncache.code_fingerprint(make())), make_key(actioncache.code_fingerprint(other)))
+
+    def test_put_get(self):
+        key = make_key('test')
+        self.assertIsNone(self.store.get(key))
+        obj = self.make_file('test.o', b'object')
+        self.assertTrue(self.store.put(key, {'output': obj}, {'stderr': 'warning'}))
+        self.assertFalse(self.store.put(key, {'output': obj}))
+
+        entry = self.store.get(key)
+        self.assertEqual(entry.files, ['output'])
+        self.assertEqual(entry.metadata['stderr'], 'warning')
+        dest = self.root / 'out' / 'restored.o'
+        entry.restore('output', dest)
+        self.assertEqual(dest.read_bytes(), b'object')
+
+        stats = self.store.stats
+        self.assertEqual((stats.hits, stats.misses, stats.stores), (1, 1, 1))
+        asyncio.run(self.store.save())
+        # counters are merged into the store statistics
+        stats = LocalStore(self.root / 'cache').stats
+        self.assertEqual((stats.hits, stats.misses, stats.stores), (1, 1, 1))
+
+    def test_async_put(self):
+        key = make_key('test')
+        obj = self.make_file('test.o', b'object')
+
+        async def put():
+            self.assertTrue(await self.store.async_put(key, {'output': obj}))
+            self.assertFalse(await self.store.async_put(key, {'output': obj}))
+            await self.store.async_put_manifest('key', [key])
+
+        asyncio.run(put())
+        self.assertEqual(self.store.get(key).read('output'), b'object')
+        self.assertEqual(self.store.counters.stores, 1)
+        self.assertEqual(self.store.get_manifest('key'), [key])
+
+    def test_manifests(self):
+        self.assertIsNone(self.store.get_manifest('key'))
+        self.store.put_manifest('key', [{'headers': {'a.h': '0'}}])
+        self.assertEqual(self.store.get_manifest('key'), [{'headers': {'a.h': '0'}}])
+
+    def test_lru_eviction(self):
+        self.store.max_size = 3000
+        keys = [make_key(i) for i in range(4)]
+        for i, key in enumerate(keys):
+            self.store.put(key, {'output': self.make_file(f'{i}.o', b'x' * 1000)})
+            # distinct access times
+            os.utime(self.store._entry_path(key) / LocalStore.metadata_name, (i, i))
+        # first entry used recently
+        self.assertIsNotNone(self.store.get(keys[0]))
+        asyncio.run(self.store.save())
+
+        stats = self.store.stats
+        self.assertLessEqual(stats.size, self.store.max_size)
+        self.assertEqual(stats.evictions, 2)
+        self.assertIsNotNone(self.store.get(keys[0]))
+        self.assertIsNone(self.store.get(keys[1]))
+        self.assertIsNone(self.store.get(keys[2]))
+        self.assertIsNotNone(self.store.get(keys[3]))
+
+    def test_clear(self):
+        key = make_key('test')
+        self.store.put(key, {'output': self.make_file('test.o', b'object')})
+        asyncio.run(self.store.clear())
+        self.assertIsNone(self.store.get(key))
+        self.assertEqual(self.store.stats.size, 0)
+
+    def test_evicted_restore(self):
+        key = make_key('test')
+        self.store.put(key, {'output': self.make_file('test.o', b'object')})
+        entry = self.store.get(key)
+        shutil.rmtree(entry.path)
+        cache = ToolchainCache(self.store, mock.Mock(), None)
+        self.assertIsNone(cache._restore(entry, {'output': self.root / 'out' / 'test.o'}, False))
+        stats = self.store.stats
+        self.assertEqual((stats.hits, stats.misses), (0, 1))
+
+    def test_disabled(self):
+        settings = ActionCacheSettings(enabled=False, path=str(self.root))
+        actioncache.configure(settings)
+        self.assertIsNone(actioncache.get_store())
+        settings.enabled = True
+        actioncache.configure(settings)
+        try:
+            self.assertEqual(actioncache.get_store().root, self.root)
+        finally:
+            actioncache.configure(ActionCacheSettings())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from dan.core import aiofiles
+from dan.core.pathlib import Path
+
+
+class WriteIfChangedTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    async def test_write_if_changed(self):
+        path = self.root / 'out.txt'
+        self.assertTrue(await aiofiles.write_if_changed(path, 'hello'))
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - 1_000_000_000))
+        mtime = path.stat().st_mtime_ns
+
+        self.assertFalse(await aiofiles.write_if_changed(path, 'hello'))
+        self.assertEqual(path.stat().st_mtime_ns, mtime)
+
+        self.assertTrue(await aiofiles.write_if_changed(path, 'world'))
+        self.assertEqual(path.read_text(), 'world')
+        self.assertNotEqual(path.stat().st_mtime_ns, mtime)
+
+
+class FileLockTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'sub' / 'build.lock'
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    async def test_exclusion(self):
+        first = aiofiles.FileLock(self.path)
+        second = aiofiles.FileLock(self.path)
+        self.assertFalse(second.locked)
+        self.assertIsNone(second.holder)
+        self.assertTrue(first.try_acquire())
+        self.assertTrue(second.locked)
+        self.assertIn(f'pid {os.getpid()}', second.holder)
+        self.assertFalse(second.try_acquire())
+        self.assertFalse(await second.acquire(timeout=0.1))
+        first.release()
+        async with second:
+            self.assertTrue(first.locked)
+        self.assertTrue(first.try_acquire())
+        first.release()
+
+    async def test_timeout(self):
+        first = aiofiles.FileLock(self.path)
+        second = aiofiles.FileLock(self.path, timeout=0.1)
+        self.assertTrue(first.try_acquire())
+        self.assertFalse(await second.acquire())
+        with self.assertRaises(TimeoutError):
+            async with second:
+                pass
+        first.release()
+        # the waiters that gave up do not hold the lock
+        await asyncio.sleep(0.2)
+        self.assertFalse(first.locked)
+        self.assertTrue(first.try_acquire())
+        first.release()
+
+    async def test_waiter_is_woken(self):
+        first = aiofiles.FileLock(self.path)
+        second = aiofiles.FileLock(self.path)
+        self.assertTrue(first.try_acquire())
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.2, first.release)
+        t0 = time.monotonic()
+        self.assertTrue(await second.acquire(timeout=5))
+        self.assertLess(time.monotonic() - t0, 1)
+        second.release()
+
+    async def test_released_when_holder_dies(self):
+        code = f"""
+import os, sys
+from dan.core import aiofiles
+lock = aiofiles.FileLock({str(self.path)!r})
+assert lock.try_acquire()
+sys.stdout.write('locked\\n')
+sys.stdout.flush()
+sys.stdin.read()
+os._exit(0)
+"""
+        root = Path(__file__).parent.parent.parent
+        proc = subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                env={**os.environ, 'PYTHONPATH': str(root)})
+        try:
+            self.assertEqual(proc.stdout.readline(), b'locked\n')
+            lock = aiofiles.FileLock(self.path)
+            self.assertIn(f'pid {proc.pid}', lock.holder)
+            proc.kill()
+            proc.wait()
+            # the lock file remains but is not held anymore
+            self.assertTrue(self.path.exists())
+            self.assertTrue(await lock.acquire(timeout=5))
+            lock.release()
+        finally:
+            proc.kill()
+            proc.wait()
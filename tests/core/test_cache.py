@@ -0,0 +1,196 @@
+import asyncio
+import pickle
+import tempfile
+import unittest
+
+from dan.core import cache
+from dan.core.aiofiles import FileLock
+from dan.core.cache import Cache, _Journal
+from dan.core.pathlib import Path
+
+
+class JournaledCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'test.cache'
+
+    def tearDown(self) -> None:
+        Cache.clear_all()
+        cache.compression = False
+        self.tmp.cleanup()
+
+    def reload(self) -> Cache:
+        Cache.clear_all()
+        return Cache.instance(self.path, binary=True)
+
+    def test_only_modified_keys_are_appended(self):
+        c = Cache.instance(self.path, binary=True)
+        self.assertFalse(c.dirty)
+        c.data['a'] = 1
+        c.data['b'] = {'x': 1}
+        self.assertTrue(c.dirty)
+        c.flush()
+        self.assertFalse(c.dirty)
+        size = self.path.stat().st_size
+
+        c.data['a'] = 2
+        c.flush()
+        # one small record appended
+        self.assertLess(self.path.stat().st_size - size, 64)
+
+        c = self.reload()
+        self.assertEqual(c.data, {'a': 2, 'b': {'x': 1}})
+
+    def test_nested_dicts_are_tracked(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data['target'] = dict()
+        c.flush()
+        c.data['target']['options'] = dict()
+        c.data['target']['options']['value'] = 42
+        self.assertTrue(c.dirty)
+        c.flush()
+        del c.data['target']['options']
+        c.data.pop('missing', None)
+        c.flush()
+
+        c = self.reload()
+        self.assertEqual(c.data, {'target': {}})
+        c.data['target'].setdefault('value', 1)
+        self.assertTrue(c.dirty)
+
+    def test_in_place_modifications(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data['target'] = {'deps': ['a.hpp']}
+        c.flush()
+
+        c = self.reload()
+        c.data['target']['deps'].append('b.hpp')
+        self.assertTrue(c.dirty)
+        c.flush()
+        self.assertFalse(c.dirty)
+
+        # assigned containers are tracked copies
+        c.data['options'] = dict()
+        c.data['sources'] = {'a.cpp'}
+        c.flush()
+        options = c.data['options']
+        options['value'] = 42
+        self.assertTrue(c.dirty)
+        c.flush()
+        c.data['sources'].add('b.cpp')
+        self.assertTrue(c.dirty)
+        c.flush()
+
+        # reading immutable values (or containers) does not make the cache dirty
+        self.assertEqual(c.data['target']['deps'][0], 'a.hpp')
+        self.assertEqual(list(c.data['target']['deps']), ['a.hpp', 'b.hpp'])
+        self.assertFalse(c.dirty)
+
+        c = self.reload()
+        self.assertEqual(c.data, {'target': {'deps': ['a.hpp', 'b.hpp']}, 'options': {'value': 42},
+                                  'sources': {'a.cpp', 'b.cpp'}})
+
+    def test_deleted_keys(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data.update(a=1, b=2)
+        c.flush()
+        del c.data['a']
+        c.flush()
+        c.data.clear()
+        c.data['c'] = 3
+        c.flush()
+
+        c = self.reload()
+        self.assertEqual(c.data, {'c': 3})
+        # plain dicts when pickled
+        self.assertIs(type(pickle.loads(pickle.dumps(c.data))), dict)
+
+    def test_torn_record_is_dropped(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data['a'] = 1
+        c.flush()
+        c.data['b'] = 2
+        c.flush()
+        # simulate a crash while appending the last record
+        content = self.path.read_bytes()
+        self.path.write_bytes(content[:-3])
+
+        c = self.reload()
+        self.assertEqual(c.data, {'a': 1})
+        c.data['c'] = 3
+        c.flush()
+
+        c = self.reload()
+        self.assertEqual(c.data, {'a': 1, 'c': 3})
+
+    def test_concurrent_writers(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data['a'] = 1
+        c.flush()
+        # another process updates the journal
+        other = self.reload()
+        other.data['b'] = 2
+        other.flush()
+        Cache.clear_all()
+        c.data['c'] = 3
+        c.flush()
+        # rewritten: last writer wins, the journal is consistent
+        self.assertEqual(self.reload().data, {'a': 1, 'c': 3})
+
+    def test_previous_format_is_converted(self):
+        self.path.write_bytes(pickle.dumps({'a': 1}))
+        c = self.reload()
+        self.assertEqual(c.data, {'a': 1})
+        self.assertTrue(c.dirty)
+        c.flush()
+        self.assertTrue(_Journal.is_journal(self.path))
+        self.assertEqual(self.reload().data, {'a': 1})
+
+    def test_compaction(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data['a'] = 0
+        c.flush()
+        for i in range(20000):
+            c.data['a'] = i
+            c.flush()
+        # the journal has been rewritten at least once
+        self.assertLess(self.path.stat().st_size, 20000 * 16)
+        self.assertEqual(self.reload().data, {'a': 19999})
+
+    def test_compression(self):
+        cache.compression = True
+        c = Cache.instance(self.path, binary=True)
+        c.data['a'] = 'x' * 10000
+        c.flush()
+        self.assertLess(self.path.stat().st_size, 1000)
+        cache.compression = False
+        self.assertEqual(self.reload().data, {'a': 'x' * 10000})
+
+    def test_flush_all(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data['a'] = 1
+        Cache.flush_all()
+        self.assertEqual(self.reload().data, {'a': 1})
+
+    def test_save_does_not_block(self):
+        c = Cache.instance(self.path, binary=True)
+        c.data['a'] = 1
+        holder = FileLock(self.path.parent / '.cache.lock')
+        holder.acquire_sync()
+
+        async def save():
+            task = asyncio.create_task(c.save())
+            # the event loop keeps running while waiting for the lock
+            await asyncio.sleep(0.05)
+            self.assertFalse(task.done())
+            holder.release()
+            await task
+
+        asyncio.run(save())
+        self.assertFalse(c.dirty)
+        self.assertEqual(self.reload().data, {'a': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from dan.core import digest
+from dan.core.cache import Cache
+from dan.core.pathlib import Path
+
+
+class DigestDatabaseTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self) -> None:
+        Cache.clear_all()
+        self.tmp.cleanup()
+
+    def test_digest_is_memoized(self):
+        db = digest.get_database(self.root)
+        src = self.root / 'src.cpp'
+        src.write_text('int main() {}')
+        first = db.digest(src)
+        self.assertEqual(first, digest.file_digest(src))
+
+        with mock.patch.object(digest, 'file_digest') as file_digest:
+            # same size and mtime: not re-hashed
+            self.assertEqual(db.digest(src), first)
+            file_digest.assert_not_called()
+
+    def test_touch_keeps_digest(self):
+        db = digest.get_database(self.root)
+        src = self.root / 'src.cpp'
+        src.write_text('int main() {}')
+        first = db.digest(src)
+        st = src.stat()
+        os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(db.digest(src), first)
+
+        src.write_text('int main() { return 1; }')
+        self.assertNotEqual(db.digest(src), first)
+
+    def test_missing(self):
+        db = digest.get_database(self.root)
+        self.assertIsNone(db.digest(self.root / 'missing.h'))
+        self.assertIsNone(db.digest(self.root))
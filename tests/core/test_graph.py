@@ -0,0 +1,56 @@
+import unittest
+
+from dan.core import graph
+from dan.core.graph import topological_order
+
+
+class TopologicalOrderTest(unittest.TestCase):
+
+    def test_dependencies_first(self):
+        edges = {
+            'exe': ['lib', 'config'],
+            'lib': ['config', 'base'],
+            'config': [],
+            'base': [],
+        }
+        order = topological_order(['exe'], lambda n: edges[n])
+        self.assertEqual(sorted(order), sorted(edges))
+        for node, deps in edges.items():
+            for dep in deps:
+                self.assertLess(order.index(dep), order.index(node))
+
+    def test_deep_chain(self):
+        # no recursion limit
+        count = 10_000
+        order = topological_order([0], lambda n: [n + 1] if n < count else [])
+        self.assertEqual(order, list(reversed(range(count + 1))))
+
+
+class Node:
+    def __init__(self, *deps) -> None:
+        self.deps = deps
+        self.failures = 0
+
+    @property
+    def dependencies(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('failed to resolve the dependencies')
+        return self
+
+    @property
+    def all(self):
+        return self.deps
+
+
+class ClosureTest(unittest.TestCase):
+
+    def tearDown(self) -> None:
+        graph.invalidate()
+
+    def test_failure_is_not_memoized(self):
+        node = Node('a', 'b')
+        node.failures = 1
+        with self.assertRaises(RuntimeError):
+            graph.closure(node)
+        self.assertEqual(graph.closure(node), ('a', 'b'))
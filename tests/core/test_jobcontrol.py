@@ -0,0 +1,148 @@
+import itertools
+import tempfile
+import unittest
+from unittest import mock
+
+from dan.core import jobcontrol, runners
+from dan.core.pathlib import Path
+
+
+class CGroupTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.proc = self.root / 'proc-cgroup'
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def write(self, path: str, content: str):
+        path = self.root / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def test_v2(self):
+        self.proc.write_text('0::/build.slice/pod\n')
+        self.write('fs/build.slice/pod/cpu.max', '250000 100000\n')
+        self.write('fs/build.slice/pod/memory.max', '4294967296\n')
+        self.write('fs/build.slice/pod/memory.current', '1073741824\n')
+        self.write('fs/build.slice/pod/memory.events', 'low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n')
+        group = jobcontrol.CGroup(self.root / 'fs', self.proc)
+        self.assertEqual(group.cpu_quota, 2.5)
+        self.assertEqual(group.memory_limit, 4 << 30)
+        self.assertEqual(group.memory_usage, 1 << 30)
+        self.assertEqual(group.oom_kills, 1)
+        with mock.patch.object(jobcontrol, '_meminfo', return_value=None):
+            self.assertEqual(jobcontrol.available_memory(group), 3 << 30)
+        with mock.patch('os.sched_getaffinity', return_value=set(range(8)), create=True):
+            self.assertEqual(jobcontrol.cpu_count(group), 3)
+
+    def test_v2_unlimited(self):
+        self.proc.write_text('0::/\n')
+        self.write('fs/cpu.max', 'max 100000\n')
+        self.write('fs/memory.max', 'max\n')
+        group = jobcontrol.CGroup(self.root / 'fs', self.proc)
+        self.assertIsNone(group.cpu_quota)
+        self.assertIsNone(group.memory_limit)
+        self.assertIsNone(group.oom_kills)
+
+    def test_v1(self):
+        # container: own group mounted as the hierarchy root
+        self.proc.write_text('4:memory:/kubepods/pod1\n3:cpu,cpuacct:/kubepods/pod1\n')
+        self.write('fs/cpu,cpuacct/cpu.cfs_quota_us', '100000\n')
+        self.write('fs/cpu,cpuacct/cpu.cfs_period_us', '100000\n')
+        self.write('fs/memory/memory.limit_in_bytes', '9223372036854771712\n')
+        self.write('fs/memory/memory.oom_control', 'oom_kill_disable 0\nunder_oom 0\noom_kill 2\n')
+        group = jobcontrol.CGroup(self.root / 'fs', self.proc)
+        self.assertEqual(group.cpu_quota, 1.0)
+        self.assertIsNone(group.memory_limit)
+        self.assertEqual(group.oom_kills, 2)
+
+    def test_oom_killed(self):
+        self.proc.write_text('0::/\n')
+        self.write('fs/memory.max', 'max\n')
+        self.write('fs/memory.events', 'oom_kill 1\n')
+        group = jobcontrol.CGroup(self.root / 'fs', self.proc)
+        self.assertFalse(jobcontrol.oom_killed(1, 1, group))
+        self.assertFalse(jobcontrol.oom_killed(137, 1, group), 'killed by someone else')
+        self.assertTrue(jobcontrol.oom_killed(137, 0, group))
+        self.assertFalse(jobcontrol.oom_killed(-9, None, group), 'counter not reported')
+
+
+class JobControllerTest(unittest.TestCase):
+
+    def make_controller(self, maximum):
+        group = jobcontrol.CGroup('/nonexistent', '/nonexistent')
+        with mock.patch.object(jobcontrol, '_meminfo', return_value=10 << 30):
+            controller = jobcontrol.JobController(maximum, group)
+        controller.interval = 0.0
+        return controller
+
+    def test_limit(self):
+        controller = self.make_controller(8)
+        controller.cpus = 4
+        with mock.patch.object(jobcontrol, 'available_memory', return_value=8 << 30), \
+                mock.patch.object(jobcontrol, '_load_average', return_value=4.0):
+            self.assertEqual(controller.limit(4, 4), 5)
+            self.assertEqual(controller.limit(8, 8), 8)
+        with mock.patch.object(jobcontrol, 'available_memory', return_value=100 << 20):
+            self.assertEqual(controller.limit(8, 6), 5)
+            self.assertEqual(controller.limit(1, 1), 1)
+        with mock.patch.object(jobcontrol, 'available_memory', return_value=8 << 30), \
+                mock.patch.object(jobcontrol, '_load_average', return_value=10.0):
+            # external load
+            self.assertEqual(controller.limit(4, 2), 3)
+        self.assertEqual(controller.on_oom(8), 4)
+        self.assertEqual(controller.on_oom(1), 1)
+
+
+class OOMRetryTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.enabled = mock.patch.object(jobcontrol, 'enabled', True)
+        self.enabled.start()
+        runners.max_jobs(4)
+        self.cgroup = mock.patch.object(jobcontrol, '_cgroup', jobcontrol.CGroup(self.tmp.name, '/nonexistent'))
+        self.cgroup.start()
+        # the OOM kill counter increases on each read: SIGKILLs are attributed to the OOM killer
+        self.oom_kills = mock.patch.object(jobcontrol.CGroup, 'oom_kills', new_callable=mock.PropertyMock,
+                                           side_effect=itertools.count())
+        self.oom_kills.start()
+
+    def tearDown(self) -> None:
+        self.oom_kills.stop()
+        self.cgroup.stop()
+        runners.max_jobs(0)
+        self.enabled.stop()
+        self.tmp.cleanup()
+
+    async def test_retry(self):
+        marker = Path(self.tmp.name) / 'marker'
+        out, _, rc = await runners.async_run(f'test -f {marker} || (touch {marker} && kill -9 $$); echo done', log=False)
+        self.assertEqual(rc, 0)
+        self.assertEqual(out.strip(), 'done')
+        self.assertEqual(runners._jobs.count, 2)
+        self.assertEqual(runners._jobs.running, 0)
+
+    async def test_give_up(self):
+        with self.assertRaises(runners.CommandError) as ctx:
+            await runners.async_run('kill -9 $$', log=False)
+        self.assertIn(ctx.exception.rc, (-9, 137))
+        self.assertEqual(runners._jobs.count, 1)
+
+    async def test_unknown_oom_kills(self):
+        with mock.patch.object(jobcontrol.CGroup, 'oom_kills', new_callable=mock.PropertyMock, return_value=None):
+            with self.assertRaises(runners.CommandError):
+                await runners.async_run('kill -9 $$', log=False)
+        self.assertEqual(runners._jobs.count, 4)
+
+    async def test_disabled(self):
+        with mock.patch.object(jobcontrol, 'enabled', False), \
+                mock.patch.object(jobcontrol.CGroup, 'oom_kills', new_callable=mock.PropertyMock) as oom_kills:
+            await runners.async_run('true', log=False)
+            with self.assertRaises(runners.CommandError):
+                await runners.async_run('kill -9 $$', log=False)
+        oom_kills.assert_not_called()
+        self.assertEqual(runners._jobs.count, 4)
@@ -0,0 +1,50 @@
+import os
+import unittest
+
+from dan.core.pathlib import Path
+from dan.core.pathmap import PathMap
+
+
+class PathMapTest(unittest.TestCase):
+
+    def test_normalize(self):
+        paths = PathMap('/work/project', '/work/project/build')
+        self.assertEqual(paths.normalize('/work/project/src/a.cpp'), '<src>/src/a.cpp')
+        # the build root is more specific
+        self.assertEqual(paths.normalize('/work/project/build/a.o'), '<build>/a.o')
+        self.assertEqual(paths.normalize('-I/work/project/include'), '-I<src>/include')
+        self.assertEqual(paths.normalize('-Wl,-rpath,/work/project/build/lib'), '-Wl,-rpath,<build>/lib')
+        self.assertEqual(paths.normalize('-MF /work/project/build/a.o.d /work/project/a.h'),
+                         '-MF <build>/a.o.d <src>/a.h')
+        # path boundaries
+        self.assertEqual(paths.normalize('/work/project2/a.cpp'), '/work/project2/a.cpp')
+        self.assertEqual(paths.normalize('/other/work/project/a.cpp'), '/other/work/project/a.cpp')
+
+    def test_relocation(self):
+        first = PathMap('/a/project', '/a/project/build')
+        second = PathMap('/b/checkout', '/b/checkout/build')
+        args = ['-I/a/project/include', '-o', '/a/project/build/a.o', '/a/project/a.cpp']
+        normalized = [first.normalize(arg) for arg in args]
+        self.assertEqual([second.expand(arg) for arg in normalized],
+                         ['-I/b/checkout/include', '-o', '/b/checkout/build/a.o', '/b/checkout/a.cpp'])
+
+    def test_relative_build_root(self):
+        paths = PathMap('/a/project', 'build')
+        absolute = Path(os.getcwd()) / 'build'
+        self.assertEqual(paths.normalize('build/a.o'), '<build>/a.o')
+        self.assertEqual(paths.normalize(f'{absolute}/a.o'), '<build>/a.o')
+        self.assertEqual(paths.normalize('/a/build/a.o'), '/a/build/a.o')
+        self.assertEqual(paths.expand('<build>/a.o'), f'{absolute}/a.o')
+
+    def test_prefix_map(self):
+        paths = PathMap('/a/project', '/a/project/build')
+        self.assertEqual(list(paths.prefix_map().items()), [('/a/project', '.'), ('/a/project/build', 'build')])
+        paths = PathMap('/a/project', '/a/build')
+        self.assertEqual(paths.prefix_map()['/a/build'], '../build')
+        # the source root is inside the build root
+        paths = PathMap('/a/build/project', '/a/build')
+        self.assertEqual(list(paths.prefix_map().items()), [('/a/build', '..'), ('/a/build/project', '.')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import tempfile
+import unittest
+
+from dan.core.include import Context
+from dan.core.makefile import MakeFile
+from dan.core.pathlib import Path
+from dan.core.register import TargetRegistry
+
+
+class FakeTarget:
+    def __init__(self, fullname, *provides, makefile=None) -> None:
+        self.fullname = fullname
+        self.provides = {fullname.split('.')[-1], *provides}
+        self.makefile = makefile
+
+
+class OtherTarget(FakeTarget):
+    pass
+
+
+class TargetRegistryTest(unittest.TestCase):
+
+    def test_lookup(self):
+        registry = TargetRegistry()
+        fmt = FakeTarget('root.fmt', 'fmt::fmt')
+        spdlog = OtherTarget('root.sub.spdlog')
+        fmt2 = FakeTarget('root.sub.fmt')
+        for t in (fmt, spdlog, fmt2):
+            registry.add(t)
+
+        self.assertIs(registry.get('root.sub.spdlog'), spdlog)
+        self.assertIsNone(registry.get('spdlog'))
+        self.assertEqual(registry.lookup('fmt'), [fmt, fmt2])
+        self.assertEqual(registry.lookup('fmt::fmt'), [fmt])
+        self.assertEqual(registry.lookup(OtherTarget), [spdlog])
+        # exact class only
+        self.assertEqual(registry.lookup(FakeTarget), [fmt, fmt2])
+        self.assertEqual(len(registry), 3)
+
+    def test_remove(self):
+        registry = TargetRegistry()
+        fmt = FakeTarget('root.fmt')
+        registry.add(fmt)
+        registry.remove(fmt)
+        self.assertIsNone(registry.get('root.fmt'))
+        self.assertEqual(registry.lookup('fmt'), [])
+        self.assertEqual(registry.lookup(FakeTarget), [])
+
+
+class MakeFileFindTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def makefile(self, name, parent=None) -> MakeFile:
+        makefile = MakeFile(name)
+        makefile._setup(name, None, Path(self.tmp.name), parent=parent)
+        return makefile
+
+    def add(self, context: Context, makefile: MakeFile, name: str) -> FakeTarget:
+        t = FakeTarget(f'{makefile.fullname}.{name}', makefile=makefile)
+        context.targets.add(t)
+        return t
+
+    def test_precedence(self):
+        with Context() as context:
+            root = self.makefile('root')
+            first = self.makefile('first', root)
+            nested = self.makefile('nested', first)
+            second = self.makefile('second', root)
+            # children declare their targets before their parent (included first)
+            in_nested = self.add(context, nested, 'lib')
+            in_second = self.add(context, second, 'lib')
+            in_first = self.add(context, first, 'lib')
+            in_root = self.add(context, root, 'lib')
+
+            self.assertIs(root.find('lib'), in_root)
+            self.assertIs(first.find('lib'), in_first)
+            self.assertIs(nested.find('lib'), in_nested)
+            self.assertIs(second.find('lib'), in_second)
+
+            context.targets.remove(in_root)
+            # own children depth-first
+            self.assertIs(root.find('lib'), in_first)
+            context.targets.remove(in_first)
+            self.assertIs(root.find('lib'), in_nested)
+            self.assertIs(first.find('lib'), in_nested)
+            context.targets.remove(in_nested)
+            # then the parents' subtrees
+            self.assertIs(first.find('lib'), in_second)
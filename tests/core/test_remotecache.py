@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from dan.core.actioncache import LocalStore, make_key
+from dan.core.pathlib import Path
+from dan.core.remotecache import RemoteStore
+from dan.utils.cache_server import create_app
+
+
+class RemoteStoreTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.runner = web.AppRunner(create_app(self.root / 'server'))
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f'http://127.0.0.1:{port}'
+
+    async def asyncTearDown(self) -> None:
+        await self.runner.cleanup()
+        self.tmp.cleanup()
+
+    def make_store(self, name: str, read_only=False) -> LocalStore:
+        store = LocalStore(self.root / name)
+        store.remote = RemoteStore(self.url, read_only=read_only, jobs=2)
+        return store
+
+    def make_file(self, name: str, content: bytes) -> Path:
+        path = self.root / name
+        path.write_bytes(content)
+        return path
+
+    async def test_shared_entries(self):
+        key = make_key('test')
+        exe = self.make_file('test', b'binary')
+        exe.chmod(0o755)
+        writer = self.make_store('writer')
+        writer.put(key, {'output': exe}, {'stderr': 'warning'})
+        writer.put_manifest(make_key('manifest'), [{'headers': {}}])
+        await writer.flush()
+        self.assertEqual(writer.counters.uploads, 1)
+
+        reader = self.make_store('reader')
+        entry = await reader.fetch(key)
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry.metadata['stderr'], 'warning')
+        dest = self.root / 'restored'
+        entry.restore('output', dest)
+        self.assertEqual(dest.read_bytes(), b'binary')
+        self.assertEqual(dest.stat().st_mode & 0o777, 0o755)
+        self.assertEqual((reader.counters.hits, reader.counters.remote_hits), (1, 1))
+        self.assertEqual(await reader.fetch_manifest(make_key('manifest')), [{'headers': {}}])
+        self.assertIsNone(await reader.fetch(make_key('missing')))
+        await reader.flush()
+
+    async def test_prefetch(self):
+        writer = self.make_store('writer')
+        keys = [make_key(i) for i in range(5)]
+        for i, key in enumerate(keys):
+            writer.put(key, {'output': self.make_file(f'{i}.o', b'%d' % i)})
+        await writer.flush()
+
+        reader = self.make_store('reader')
+        await reader.prefetch([*keys, make_key('missing')])
+        await reader.remote.close()
+        # available locally
+        reader.remote = None
+        for key in keys:
+            self.assertIsNotNone(await reader.fetch(key))
+
+    async def test_read_only(self):
+        store = self.make_store('local', read_only=True)
+        key = make_key('test')
+        store.put(key, {'output': self.make_file('test.o', b'object')})
+        await store.flush()
+        self.assertEqual(store.counters.uploads, 0)
+        self.assertEqual(await store.remote.contains('ac', [key]), set())
+        await store.remote.close()
+
+    async def test_unavailable(self):
+        store = LocalStore(self.root / 'local')
+        store.remote = RemoteStore('http://127.0.0.1:1')
+        self.assertIsNone(await store.fetch(make_key('test')))
+        self.assertFalse(store.remote.available)
+        # still usable locally
+        key = make_key('test')
+        store.put(key, {'output': self.make_file('test.o', b'object')})
+        await store.flush()
+        self.assertIsNotNone(await store.fetch(key))
+
+    async def test_upload_errors(self):
+        store = self.make_store('local')
+        key = make_key('test')
+        store.put(key, {'output': self.make_file('test.o', b'object')})
+        # evicted (eg.: by another process) before being uploaded
+        shutil.rmtree(store._entry_path(key))
+        with self.assertLogs(store.remote.get_logger(), 'WARNING'):
+            await store.flush()
+        self.assertEqual(store.counters.uploads, 0)
+
+    async def test_server_checks_contents(self):
+        remote = RemoteStore(self.url)
+        self.assertFalse(await remote.put('cas', make_key('other'), b'content'))
+        await remote.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
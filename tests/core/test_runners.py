@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+from dan.core import runners
+from dan.core.pathlib import Path
+
+
+class RunTest(unittest.IsolatedAsyncioTestCase):
+
+    argv_script = 'import sys; print(sys.argv[1:])'
+
+    async def test_list_is_not_interpreted_by_a_shell(self):
+        args = ['a b', '$HOME', '&&', '"quoted"', Path('dir/file')]
+        out, _, rc = await runners.async_run([sys.executable, '-c', self.argv_script, *args], log=False)
+        self.assertEqual(rc, 0)
+        self.assertEqual(out.strip(), str(['a b', '$HOME', '&&', '"quoted"', 'dir/file']))
+
+        out, _, rc = runners.sync_run([sys.executable, '-c', self.argv_script, *args])
+        self.assertEqual(out.strip(), str(['a b', '$HOME', '&&', '"quoted"', 'dir/file']))
+
+    @unittest.skipIf(os.name == 'nt', 'posix shell')
+    async def test_string_uses_shell(self):
+        out, _, rc = await runners.async_run('echo $((1 + 1))', log=False)
+        self.assertEqual(rc, 0)
+        self.assertEqual(out.strip(), '2')
+
+    async def test_environ(self):
+        env = runners.environ({'DAN_TEST_VAR': 'value'})
+        self.assertIn('PATH', env)
+        script = 'import os; print(os.environ["DAN_TEST_VAR"])'
+        out, _, _ = await runners.async_run([sys.executable, '-c', script], log=False, env=env)
+        self.assertEqual(out.strip(), 'value')
+        # partial environments are completed with the current one
+        out, _, _ = await runners.async_run([sys.executable, '-c', script], log=False, env={'DAN_TEST_VAR': 'other'})
+        self.assertEqual(out.strip(), 'other')
+
+    async def test_missing_executable(self):
+        _, err, rc = await runners.async_run(['dan-no-such-command'], log=False, no_raise=True)
+        self.assertEqual(rc, 127)
+        self.assertIn('dan-no-such-command', err)
+        with self.assertRaises(runners.CommandError):
+            await runners.async_run(['dan-no-such-command'], log=False)
+        _, _, rc = runners.sync_run(['dan-no-such-command'], no_raise=True)
+        self.assertEqual(rc, 127)
+
+
+class OutputStreamTest(unittest.IsolatedAsyncioTestCase):
+
+    script = 'import sys; sys.stdout.write("".join(f"line {i}\\n" for i in range(1000)) + "last")'
+
+    async def test_lines(self):
+        lines = list()
+
+        async def capture(stream):
+            with stream as it:
+                async for line in it:
+                    lines.append(line)
+
+        with mock.patch.object(runners.OutputStream, 'chunk_size', 7):
+            out, _, rc = await runners.async_run([sys.executable, '-c', self.script], log=False, out_capture=capture)
+        self.assertEqual(rc, 0)
+        expected = [f'line {i}\n' for i in range(1000)] + ['last']
+        self.assertEqual(lines, expected)
+        self.assertEqual(out, ''.join(expected))
+
+    async def test_retained_output_is_spilled(self):
+        with mock.patch.object(runners, 'output_memory_limit', 100):
+            out, _, _ = await runners.async_run([sys.executable, '-c', self.script], log=False)
+        self.assertEqual(out.splitlines()[-2:], ['line 999', 'last'])
+
+    async def test_returned_output_is_truncated(self):
+        with mock.patch.object(runners, 'output_value_limit', 100):
+            out, _, rc = await runners.async_run([sys.executable, '-c', self.script + '; sys.exit(1)'],
+                                                 log=False, no_raise=True)
+        self.assertEqual(rc, 1)
+        self.assertTrue(out.startswith('line 0\n'))
+        self.assertTrue(out.endswith('line 999\nlast'))
+        self.assertIn('bytes truncated ...]', out)
+        self.assertLess(len(out), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import tempfile
+import unittest
+
+from dan.core.cache import Cache
+from dan.core.pathlib import Path
+from dan.core import runners
+from dan.core.runners import JobQueue
+from dan.core.scheduling import get_history
+
+
+class JobQueueTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_priority_order(self):
+        queue = JobQueue(1)
+        order = list()
+
+        async def job(name, priority):
+            await queue.acquire(priority)
+            try:
+                order.append(name)
+                await asyncio.sleep(0)
+            finally:
+                queue.release()
+
+        await queue.acquire()
+        tasks = [asyncio.create_task(job(name, priority))
+                 for name, priority in [('low', 1.0), ('high', 10.0), ('mid', 5.0), ('mid2', 5.0)]]
+        await asyncio.sleep(0)
+        queue.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ['high', 'mid', 'mid2', 'low'])
+        self.assertEqual(queue.running, 0)
+
+    async def test_cancelled_waiter(self):
+        queue = JobQueue(1)
+        await queue.acquire()
+        waiter = asyncio.create_task(queue.acquire(1.0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        queue.release()
+        self.assertEqual(queue.running, 0)
+        await queue.acquire()
+        self.assertEqual(queue.running, 1)
+
+
+    async def test_weights(self):
+        queue = JobQueue(4)
+        await queue.acquire(weight=3)
+        heavy = asyncio.create_task(queue.acquire(weight=2))
+        light = asyncio.create_task(queue.acquire(0.0, 1))
+        await asyncio.sleep(0)
+        # the heavy job waits, so does the (later) light one
+        self.assertFalse(heavy.done())
+        self.assertFalse(light.done())
+        queue.release(3)
+        await asyncio.gather(heavy, light)
+        self.assertEqual(queue.running, 3)
+        queue.release(2)
+        queue.release(1)
+        # heavier than the pool: runs alone
+        await queue.acquire(weight=8)
+        self.assertEqual(queue.running, 8)
+
+
+class PoolTest(unittest.IsolatedAsyncioTestCase):
+
+    def tearDown(self) -> None:
+        runners.configure_pools(dict())
+
+    async def test_pool_limit(self):
+        runners.configure_pools({'link': 1, 'compile': 0})
+        self.assertIsNone(runners.get_pool('compile'))
+        pool = runners.get_pool('link')
+        running = list()
+
+        async def capture(stream):
+            running.append(pool.running)
+            with stream as lines:
+                async for _ in lines:
+                    pass
+
+        await asyncio.gather(*[runners.async_run('echo link', log=False, pool='link', out_capture=capture) for _ in range(3)])
+        self.assertEqual(running, [1, 1, 1])
+        self.assertEqual(pool.running, 0)
+
+    async def test_job_weights(self):
+        runners.configure_pools({'link': 4})
+        pool = runners.get_pool('link')
+        running = list()
+
+        async def capture(stream):
+            running.append(pool.running)
+            with stream as lines:
+                async for _ in lines:
+                    pass
+
+        token = runners.current_job.set(runners.Job('heavy', weights={'link': 3}))
+        try:
+            await runners.async_run('echo link', log=False, pool='link', out_capture=capture)
+        finally:
+            runners.current_job.reset(token)
+        self.assertEqual(running, [3])
+
+
+class DurationHistoryTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        Cache.clear_all()
+        self.tmp.cleanup()
+
+    def test_smoothing(self):
+        history = get_history(Path(self.tmp.name))
+        self.assertIsNone(history.get('a'))
+        history.record('a', 2.0)
+        self.assertEqual(history.get('a'), 2.0)
+        history.record('a', 4.0)
+        self.assertEqual(history.get('a'), 3.0)
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from dan.core.cache import Cache
+from dan.core.pathlib import Path
+from dan.core.snapshot import GraphSnapshot, _mtime
+
+
+class GraphSnapshotTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.input = root / 'a.cpp'
+        self.output = root / 'a.o'
+        self.input.write_text('int a;')
+        self.output.write_text('')
+        self.snapshot = GraphSnapshot.instance(root / 'dan.graph', cache_name='graph', binary=True)
+
+    def tearDown(self) -> None:
+        Cache.clear_all()
+        self.tmp.cleanup()
+
+    def record(self):
+        paths = [str(self.output), str(self.input)]
+        self.snapshot.data['paths'] = paths
+        self.snapshot.data['mtimes'] = [_mtime(path) for path in paths]
+        self.snapshot.data['nodes'] = [(0, [1])]
+
+    def test_output_kept_older(self):
+        # output not rewritten by the last build (eg.: content digest unchanged)
+        os.utime(self.output, ns=(1_000_000_000, 1_000_000_000))
+        self.record()
+        self.assertTrue(self.snapshot.up_to_date())
+
+        # input modified since
+        self.input.utime()
+        self.assertFalse(self.snapshot.up_to_date())
+
+    def test_unrecorded_mtimes(self):
+        self.record()
+        del self.snapshot.data['mtimes']
+        self.assertTrue(self.snapshot.up_to_date())
+        os.utime(self.output, ns=(1_000_000_000, 1_000_000_000))
+        self.assertFalse(self.snapshot.up_to_date())
+
+    def test_fingerprinted_directory(self):
+        root = Path(self.tmp.name)
+        self.snapshot.record(b'inputs', [str(root)], [])
+        self.assertTrue(self.snapshot.matches(b'inputs'))
+        self.assertFalse(self.snapshot.matches(b'other inputs'))
+        # new file that may match a sources pattern
+        (root / 'b.cpp').write_text('int b;')
+        self.assertFalse(self.snapshot.matches(b'inputs'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from dan.core.pathlib import Path
+from dan.core.statcache import StatCache
+
+
+class StatCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.cache = StatCache()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_memoized(self):
+        header = self.root / 'header.h'
+        header.write_text('')
+        for _ in range(3):
+            self.assertIsNotNone(self.cache.stat(header))
+        self.assertEqual(self.cache.counters, {'lookups': 3, 'stat_calls': 1, 'scans': 1})
+
+    def test_missing_without_stat(self):
+        (self.root / 'a.h').write_text('')
+        self.assertIsNone(self.cache.stat(self.root / 'b.h'))
+        self.assertIsNone(self.cache.stat(self.root / 'c.h'))
+        self.assertIsNone(self.cache.stat(self.root / 'missing' / 'd.h'))
+        self.assertEqual(self.cache.stat_calls, 0)
+
+    def test_invalidate(self):
+        output = self.root / 'out.o'
+        self.assertIsNone(self.cache.stat(output))
+        output.write_text('')
+        # not seen until invalidated
+        self.assertIsNone(self.cache.stat(output))
+        self.cache.invalidate(output)
+        self.assertIsNotNone(self.cache.stat(output))
+
+        st = os.stat(output)
+        os.utime(output, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        self.cache.invalidate(output)
+        self.assertEqual(self.cache.stat(output).st_mtime_ns, st.st_mtime_ns + 1_000_000_000)
+
+    def test_invalidate_new_directory(self):
+        output = self.root / 'sub' / 'out.o'
+        self.assertIsNone(self.cache.stat(output))
+        output.parent.mkdir()
+        output.write_text('')
+        self.cache.invalidate(output)
+        self.assertIsNotNone(self.cache.stat(output))
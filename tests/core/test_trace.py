@@ -0,0 +1,46 @@
+import json
+import tempfile
+import unittest
+
+from dan.core import trace
+from dan.core.pathlib import Path
+
+
+class TraceTest(unittest.TestCase):
+
+    def tearDown(self) -> None:
+        trace.enabled = False
+        trace._tracer = None
+
+    def test_disabled(self):
+        with trace.slice('targets', 'nothing'):
+            pass
+        self.assertIsNone(trace._tracer)
+
+    def test_lanes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'trace.json'
+            trace.start()
+            with trace.slice('targets', 'a'):
+                with trace.slice('targets', 'b', phase='build'):
+                    pass
+            with trace.slice('targets', 'c'):
+                pass
+            trace.counter('jobs', 'job queue', running=1)
+            trace.stop(path)
+            self.assertFalse(trace.enabled)
+
+            events = json.loads(path.read_text())['traceEvents']
+            slices = {e['name']: e for e in events if e['ph'] == 'X'}
+            self.assertEqual(slices['a']['tid'], 0)
+            # concurrent slices use distinct lanes
+            self.assertEqual(slices['b']['tid'], 1)
+            self.assertEqual(slices['b']['args'], {'phase': 'build'})
+            # lanes are reused once released
+            self.assertEqual(slices['c']['tid'], 0)
+            self.assertLessEqual(slices['a']['ts'], slices['b']['ts'])
+            self.assertGreaterEqual(slices['a']['dur'], slices['b']['dur'])
+            counters = [e for e in events if e['ph'] == 'C']
+            self.assertEqual(counters[0]['args'], {'running': 1})
+            names = {e['args']['name'] for e in events if e['ph'] == 'M' and e['name'] == 'process_name'}
+            self.assertEqual(names, {'targets', 'jobs'})
@@ -0,0 +1,45 @@
+import asyncio
+import tempfile
+import unittest
+
+from dan.core.pathlib import Path
+from dan.core.watch import InotifyWatcher, PollingWatcher
+
+
+class WatcherTestMixin:
+    watcher_type = None
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    async def test_changes(self):
+        source = self.root / 'source.cpp'
+        source.write_text('int main() {}')
+        (self.root / 'sub').mkdir()
+        with self.watcher_type() as watcher:
+            watcher.watch({self.root})
+            changes = asyncio.create_task(watcher.changes(0.2))
+            await asyncio.sleep(0.1)
+            source.write_text('int main() { return 0; }')
+            # not watched
+            (self.root / 'sub' / 'header.h').write_text('#pragma once')
+            await asyncio.sleep(0.05)
+            # same burst
+            (self.root / 'header.h').write_text('#pragma once')
+            changed = await changes
+            self.assertIn(source, changed)
+            self.assertIn(self.root / 'header.h', changed)
+            self.assertNotIn(self.root / 'sub' / 'header.h', changed)
+
+
+class PollingWatcherTest(WatcherTestMixin, unittest.IsolatedAsyncioTestCase):
+    watcher_type = PollingWatcher
+
+
+@unittest.skipUnless(InotifyWatcher.available(), 'inotify not available')
+class InotifyWatcherTest(WatcherTestMixin, unittest.IsolatedAsyncioTestCase):
+    watcher_type = InotifyWatcher
@@ -1,8 +1,20 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from dan.core import actioncache, asyncio, pathmap
 from dan.core.pathlib import Path
 from dan.core.settings import InstallMode
+from dan.cxx.targets import CXXTarget
 from tests import PyMakeBaseTest
 
 
+def make_digests(make):
+    from dan.core.digest import get_database
+    return get_database(make.build_path)
+
+
 class CXXSimpleLibTest(PyMakeBaseTest):
     def __init__(self, methodName: str = None) -> None:
         super().__init__('cxx/libraries', methodName)
@@ -19,6 +31,155 @@ class CXXSimpleLibTest(PyMakeBaseTest):
             self.assertTrue(target.output.exists())
             self.modified_at = target.output.modification_time
 
+    async def test_objects_before_dependencies_link(self):
+        async with self.section("compile prerequisites", clean=True) as make:
+            exe = make.root.find('use-simple-lib')
+            lib = make.root.find('simplelib')
+            await exe.initialize()
+            await exe.build_compile_prerequisites()
+            # generated header is available, library is not linked
+            for dep in lib.target_dependencies:
+                self.assertTrue(dep.output.exists())
+            self.assertFalse(lib.output.exists())
+            await exe._build_objects()
+            for obj in exe.objs:
+                self.assertTrue(obj.output.exists())
+            self.assertFalse(lib.output.exists())
+            await exe.build()
+            self.assertTrue(lib.output.exists())
+            self.assertTrue(exe.output.exists())
+
+    async def test_streaming_build(self):
+        async with self.section("streaming build", targets=['use-simple-lib'], settings=['streaming=true'], clean=True) as make:
+            self.assertTrue(make.settings.streaming)
+            await make.build()
+            exe = make.root.find('use-simple-lib')
+            lib = make.root.find('simplelib')
+            self.assertTrue(lib.output.exists())
+            self.assertTrue(exe.output.exists())
+            # objects prioritized after their parent in streaming mode
+            for obj in exe.objs:
+                self.assertGreater(obj.priority, exe.priority)
+            self.assertGreater(lib.priority, exe.priority)
+
+    async def test_cacheable_target(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            settings = ['action_cache.enabled=true', f'action_cache.path={tmp}']
+
+            ########################################
+            async with self.section("base build", clean=True, settings=settings) as make:
+                lib = make.root.find('simplelib')
+                await lib.initialize()
+                config = lib.target_dependencies[0]
+                with mock.patch.object(type(config), 'cacheable', True):
+                    await lib.build()
+                content = config.output.read_text()
+                self.assertIsNotNone(config._action_key(make_digests(make)))
+
+            ########################################
+            async with self.section("clean build => generator output restored", clean=True, settings=settings) as make:
+                lib = make.root.find('simplelib')
+                await lib.initialize()
+                config = lib.target_dependencies[0]
+                hits = actioncache.get_store().stats.hits
+                with mock.patch.object(type(config), 'cacheable', True), \
+                        mock.patch.object(type(config), '__build__', side_effect=AssertionError('should be restored')):
+                    await lib.build()
+                self.assertEqual(config.output.read_text(), content)
+                self.assertGreater(actioncache.get_store().stats.hits, hits)
+
+                # inputs are identified by their absolute paths unless relocatable
+                database = make_digests(make)
+                current = pathmap.current()
+                inputs = mock.patch.object(type(config), 'cache_inputs', ['lib.hpp'])
+                inputs.start()
+                try:
+                    key = config._action_key(database)
+                    pathmap.configure(Path(tmp) / 'src', Path(tmp) / 'build')
+                    self.assertEqual(key, config._action_key(database))
+                    with mock.patch.object(type(config), 'cache_relocatable', True):
+                        relocated = config._action_key(database)
+                    pathmap.configure(current.source_root, current.build_root)
+                    with mock.patch.object(type(config), 'cache_relocatable', True):
+                        self.assertNotEqual(relocated, config._action_key(database))
+                finally:
+                    inputs.stop()
+                    pathmap.configure(current.source_root, current.build_root)
+
+                # options are part of the key
+                key = config._action_key(make_digests(make))
+                config.options.add('dummy', 1)
+                self.assertNotEqual(key, config._action_key(make_digests(make)))
+
+    async def test_restat(self):
+        async with self.section("base build", clean=True) as make:
+            lib = make.root.find('simplelib')
+            await lib.build()
+            config_modified_at = lib.target_dependencies[0].output.modification_time
+            lib_modified_at = lib.output.modification_time
+
+        async with self.section("identical regeneration => no-rebuild") as make:
+            lib = make.root.find('simplelib')
+            await lib.initialize()
+            config = lib.target_dependencies[0]
+            self.assertTrue(config.restat)
+            # force the generator to run again
+            config.cache['options_sha1'] = None
+            self.assertFalse(config.up_to_date)
+            await lib.build()
+            self.assertTrue(config.up_to_date)
+            self.assertEqual(config_modified_at, config.output.modification_time,
+                             "an identical output should keep its modification time")
+            self.assertEqual(lib_modified_at, lib.output.modification_time,
+                             "an identical generated header should NOT trigger a re-build")
+
+    async def test_rebuild_affected(self):
+        async with self.section("watch rebuild", clean=True) as make:
+            await make.build()
+            exe = make.root.find('use-simple-lib')
+            lib = make.root.find('simplelib')
+            config = lib.target_dependencies[0]
+            lib_obj, = lib.objs
+            main_obj, = exe.objs
+            self.assertIn(lib.source_path, make._watched_directories())
+
+            source = lib_obj.source_path / lib_obj.source
+            affected = make._affected_targets({source})
+            self.assertEqual(affected, {lib_obj, lib, exe})
+
+            header = lib.source_path / 'lib.hpp'
+            self.assertIn(main_obj, make._affected_targets({header}))
+            self.assertNotIn(config, make._affected_targets({header}))
+
+            lib_modified_at = lib.output.modification_time
+            exe_modified_at = exe.output.modification_time
+            main_modified_at = main_obj.output.modification_time
+            source.utime()
+            await make.rebuild({source})
+            self.assertTrue(lib.output.younger_than(lib_modified_at))
+            self.assertTrue(exe.output.younger_than(exe_modified_at))
+            self.assertEqual(main_modified_at, main_obj.output.modification_time)
+
+    async def test_dependency_closure(self):
+        async with self.section("closure", clean=True) as make:
+            exe = make.root.find('use-simple-lib')
+            lib = make.root.find('simplelib')
+            await exe.initialize()
+            closure = exe._recursive_dependencies()
+            self.assertIs(closure[0], lib)
+            # pre-order: lib's dependencies (generated config header) follow lib
+            self.assertIn(closure[1], lib.target_dependencies)
+            # memoized
+            self.assertIs(exe._recursive_dependencies(), closure)
+            self.assertEqual(exe._recursive_dependencies(CXXTarget), (lib,))
+            flags = exe.includes.public
+            self.assertIn(lib.source_path, [Path(f.removeprefix('-I')) for f in flags])
+
+            # mutating a dependency invalidates the dependent closures
+            lib.dependencies.add(exe.source_path / 'main.cpp')
+            self.assertIsNot(exe._recursive_dependencies(), closure)
+            self.assertIn(exe.source_path / 'main.cpp', exe._recursive_dependencies())
+
         # ########################################
         # async with self.section("no-modification => no-rebuild") as make:
         #     target = make.root.find(target_name)
@@ -69,3 +230,49 @@ class CXXSimpleLibTest(PyMakeBaseTest):
     #         self.assertTrue(
     #             (self.build_path / f'dist/bin/{target_name}').exists())
 
+
+    async def test_server(self):
+        from dan.cli.main import CommandsContext
+        from dan.cli.server import Server, METHOD_NOT_FOUND
+
+        async with self.section("server", clean=True, init=False):
+            pass
+
+        server = Server(CommandsContext(), self.build_path / 'dan.sock', build_path=self.build_path, diags=True)
+        ready = asyncio.Event()
+        serving = asyncio.create_task(server.serve(ready.set))
+        await ready.wait()
+        reader, writer = await asyncio.open_unix_connection(server.socket_path)
+
+        async def request(method, ident=1, **params):
+            writer.write(json.dumps({'jsonrpc': '2.0', 'id': ident, 'method': method, 'params': params}).encode() + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            self.assertEqual(response['id'], ident)
+            return response
+
+        targets = (await request('get-targets'))['result']
+        self.assertIn('simplelib', [t['name'] for t in targets])
+        make = server.ctx._make
+
+        source = self.source_path / 'lib.cpp'
+        config, = (await request('get-source-configuration', sources=[str(source)]))['result']
+        self.assertEqual(config['uri'], str(source))
+        self.assertIn(os.path.normcase(self.source_path), config['configuration']['includePath'])
+
+        self.assertIn('result', await request('build'))
+        exe = make.root.find('use-simple-lib')
+        modified_at = exe.output.modification_time
+        self.assertIn('result', await request('build', targets=['use-simple-lib']))
+        self.assertEqual(modified_at, exe.output.modification_time)
+        self.assertIs(server.ctx._make, make, 'the project should be kept loaded')
+
+        (self.source_path / 'dan-build.py').utime()
+        await request('get-tests')
+        self.assertIsNot(server.ctx._make, make, 'the project should be reloaded')
+
+        self.assertEqual((await request('unknown'))['error']['code'], METHOD_NOT_FOUND)
+        await request('shutdown')
+        writer.close()
+        await serving
+        self.assertFalse(server.socket_path.exists())
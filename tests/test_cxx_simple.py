@@ -1,5 +1,13 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from dan.core import actioncache
 from dan.core.pathlib import Path
+from dan.core.runners import async_run
 from dan.core.settings import InstallMode
+from dan.cxx.targets import CXXObject
+from dan.cxx.toolchain import Toolchain
 from tests import PyMakeBaseTest
 
 
@@ -39,6 +47,230 @@ class CXXSimpleTest(PyMakeBaseTest):
                             "a source modification should trigger a re-build")
 
 
+    async def test_content_digest(self):
+
+        ########################################
+        async with self.section("base build", clean=True, settings=['content_digest=true']) as make:
+            target = make.root.find('simple')
+            await target.build()
+            self.assertTrue(target.output.exists())
+            modified_at = target.output.modification_time
+
+            # touch source (content unchanged)
+            src: Path = target.source_path / list(target.sources)[0]
+            src.utime()
+
+        ########################################
+        async with self.section("touch => no-rebuild") as make:
+            target = make.root.find('simple')
+            await target.build()
+            self.assertEqual(modified_at, target.output.modification_time,
+                            "an unchanged content should NOT trigger a re-build")
+
+    async def test_response_files(self):
+
+        ########################################
+        async with self.section("build with response files", clean=True) as make:
+            target = make.root.find('simple')
+            with mock.patch.object(Toolchain, 'response_file_threshold', 0):
+                await target.build()
+            self.assertTrue(target.output.exists())
+            self.assertEqual(list(target.build_path.rglob('*.rsp')), [], "response files should be removed")
+            modified_at = target.output.modification_time
+            out, _, rc = await async_run([target.output], log=False)
+            self.assertEqual(rc, 0)
+
+        ########################################
+        async with self.section("without response files => no-rebuild") as make:
+            target = make.root.find('simple')
+            await target.build()
+            self.assertEqual(modified_at, target.output.modification_time,
+                            "response files should not change the up-to-date checks")
+
+    async def test_action_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            settings = ['action_cache.enabled=true', f'action_cache.path={tmp}']
+
+            ########################################
+            async with self.section("base build", clean=True, settings=settings) as make:
+                await make.build()
+                target = make.root.find('simple')
+                self.assertTrue(target.output.exists())
+                stats = actioncache.get_store().stats
+                # objects and executable
+                self.assertEqual(stats.stores, len(target.objs) + 1)
+                self.assertEqual(stats.hits, 0)
+
+            ########################################
+            async with self.section("clean build => restored", clean=True, settings=settings) as make:
+                with mock.patch.object(Toolchain, 'run', autospec=True, side_effect=Toolchain.run) as run:
+                    await make.build()
+                self.assertEqual(run.call_args_list, [], "nothing should be compiled nor linked")
+                target = make.root.find('simple')
+                self.assertTrue(all(o.output.exists() for o in target.objs))
+                self.assertTrue(all(o.output.with_suffix('.o.d').exists() for o in target.objs))
+                stats = actioncache.get_store().stats
+                self.assertEqual(stats.hits, len(target.objs) + 1)
+                out, _, rc = await async_run([target.output], log=False)
+                self.assertEqual(rc, 0)
+
+    async def test_remote_cache(self):
+        from aiohttp import web
+        from dan.utils.cache_server import create_app
+
+        with tempfile.TemporaryDirectory() as tmp:
+            runner = web.AppRunner(create_app(f'{tmp}/server'))
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            url = f'http://127.0.0.1:{runner.addresses[0][1]}'
+            try:
+                ########################################
+                async with self.section("build => uploaded", clean=True,
+                                        settings=['action_cache.enabled=true', f'action_cache.path={tmp}/ci1',
+                                                  f'action_cache.remote={url}']) as make:
+                    await make.build()
+                    target = make.root.find('simple')
+                    # objects and executable
+                    self.assertEqual(actioncache.get_store().stats.uploads, len(target.objs) + 1)
+
+                ########################################
+                async with self.section("other machine => downloaded", clean=True,
+                                        settings=['action_cache.enabled=true', f'action_cache.path={tmp}/ci2',
+                                                  f'action_cache.remote={url}', 'action_cache.remote_read_only=true']) as make:
+                    with mock.patch.object(Toolchain, 'run', autospec=True, side_effect=Toolchain.run) as run:
+                        await make.build()
+                    self.assertEqual(run.call_args_list, [], "nothing should be compiled nor linked")
+                    target = make.root.find('simple')
+                    stats = actioncache.get_store().stats
+                    self.assertEqual(stats.remote_hits, len(target.objs) + 1)
+                    self.assertEqual(stats.uploads, 0)
+                    out, _, rc = await async_run([target.output], log=False)
+                    self.assertEqual(rc, 0)
+            finally:
+                await runner.cleanup()
+
+    async def test_relocation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+
+            ########################################
+            self.build_path = tmp / 'build'
+            async with self.section("base build", clean=True) as make:
+                await make.build()
+
+            ########################################
+            self.build_path = tmp / 'moved'
+            (tmp / 'build').rename(self.build_path)
+            async with self.section("moved build directory => no rebuild") as make:
+                with mock.patch.object(Toolchain, 'run', autospec=True, side_effect=Toolchain.run) as run:
+                    await make.build()
+                self.assertEqual(run.call_args_list, [], "nothing should be compiled nor linked")
+
+    async def test_relocated_action_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            settings = ['action_cache.enabled=true', f'action_cache.path={tmp}/cache']
+            original_source = self.source_path
+
+            ########################################
+            self.source_path = tmp / 'a' / 'src'
+            self.build_path = tmp / 'a' / 'build'
+            shutil.copytree(original_source, self.source_path)
+            async with self.section("first checkout", clean=True, settings=settings) as make:
+                await make.build()
+                target = make.root.find('simple')
+                self.assertIn(f'-ffile-prefix-map={self.source_path}=.',
+                              target.toolchain.make_compile_commands(Path('a.cpp'), Path('a.o'), set())[0])
+
+            ########################################
+            self.source_path = tmp / 'b' / 'checkout'
+            self.build_path = tmp / 'b' / 'build'
+            shutil.copytree(original_source, self.source_path)
+            async with self.section("other checkout => restored", clean=True, settings=settings) as make:
+                with mock.patch.object(Toolchain, 'run', autospec=True, side_effect=Toolchain.run) as run:
+                    await make.build()
+                self.assertEqual(run.call_args_list, [], "nothing should be compiled nor linked")
+                target = make.root.find('simple')
+                for obj in target.objs:
+                    deps = obj.output.with_suffix('.o.d').read_text()
+                    self.assertIn(str(self.source_path), deps)
+                    self.assertNotIn(str(tmp / 'a'), deps)
+                out, _, rc = await async_run([target.output], log=False)
+                self.assertEqual(rc, 0)
+
+    async def test_precompiled_headers(self):
+        from dan.cxx.pch import header_usage
+
+        ########################################
+        async with self.section("base build", clean=True) as make:
+            target = make.root.find('simple')
+            with mock.patch.object(type(target), 'precompiled_headers', ['<iostream>']):
+                await make.build()
+            self.assertIsNotNone(target.pch)
+            self.assertTrue(target.pch.output.exists())
+            for obj in target.objs:
+                self.assertIn(target.pch, obj.dependencies.all)
+                self.assertTrue(set(target.pch.use_options).issubset(obj.private_cxx_flags))
+            # C sources cannot use the (C++) precompiled header
+            c_obj = CXXObject(Path('extra.c'), target)
+            self.assertIsNone(c_obj.pch)
+            self.assertFalse(set(target.pch.use_options).intersection(c_obj.private_cxx_flags))
+            # objects added after the target's initialization depend on it as well
+            late_obj = CXXObject(Path('late.cpp'), target)
+            await late_obj.initialize()
+            self.assertIn(target.pch, late_obj.dependencies.all)
+            pch_modified_at = target.pch.output.modification_time
+            obj_modified_at = [obj.output.modification_time for obj in target.objs]
+            out, _, rc = await async_run([target.output], log=False)
+            self.assertEqual(rc, 0)
+
+        ########################################
+        async with self.section("no-modification => no-rebuild") as make:
+            target = make.root.find('simple')
+            with mock.patch.object(type(target), 'precompiled_headers', ['<iostream>']), \
+                    mock.patch.object(Toolchain, 'run', autospec=True, side_effect=Toolchain.run) as run:
+                await make.build()
+            self.assertEqual(run.call_args_list, [], "nothing should be compiled nor linked")
+
+        ########################################
+        async with self.section("precompiled headers changed => rebuilt") as make:
+            target = make.root.find('simple')
+            with mock.patch.object(type(target), 'precompiled_headers', ['<iostream>', '<vector>']):
+                await make.build()
+            self.assertTrue(target.pch.output.younger_than(pch_modified_at))
+            for obj, modified_at in zip(target.objs, obj_modified_at):
+                self.assertTrue(obj.output.younger_than(modified_at))
+
+            usage = await header_usage(target)
+            self.assertEqual(usage.objects, len(target.objs))
+            ranking = dict(usage.ranking())
+            self.assertEqual(ranking['<iostream>'], len(target.objs))
+            self.assertIn('<iostream>', usage.candidates())
+            self.assertNotIn('<test.hpp>', usage.candidates())
+
+    async def test_graph_snapshot(self):
+
+        ########################################
+        async with self.section("base build", clean=True) as make:
+            await make.build()
+            target = make.root.find('simple')
+            src: Path = target.source_path / list(target.sources)[0]
+
+        ########################################
+        async with self.section("no-op build => makefiles not loaded", init=False) as make:
+            self.assertTrue(make._snapshot_up_to_date())
+            await make.build()
+            self.assertIsNone(make.root)
+
+            # update source
+            src.utime()
+
+        ########################################
+        async with self.section("source modification => snapshot outdated", init=False) as make:
+            self.assertFalse(make._snapshot_up_to_date())
+            await make.build()
+            self.assertIsNotNone(make.root)
+
     async def test_option_change(self):
 
         ########################################
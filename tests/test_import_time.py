@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+from tests import PyMakeBaseTest
+
+
+class ImportTimeTest(PyMakeBaseTest):
+    """Keep the cli startup cost under control
+
+    Heavy dependencies must be imported on first use only, the budgets (in milliseconds,
+    as reported by python -X importtime) are kept large enough for slow machines.
+    """
+
+    help_budget = 500
+    noop_build_budget = 800
+
+    # not needed to show the help
+    help_forbidden = ('dan.make', 'dan.cxx', 'dan.pkgconfig', 'dan.io', 'dataclasses_json', 'jinja2', 'aiohttp', 'elftools')
+    # not needed by an up-to-date build (makefiles are not loaded)
+    noop_build_forbidden = ('dan.cxx', 'dan.pkgconfig', 'dan.io', 'jinja2', 'aiohttp', 'elftools')
+
+    def __init__(self, methodName: str = None) -> None:
+        super().__init__('simple', methodName)
+
+    def importtime(self, *args: str) -> tuple[float, set[str], str]:
+        """Run dan with the given arguments, returns the import time (ms), imported modules and output"""
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([str(self.root_path), env.get('PYTHONPATH', '')])
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'dan', *args],
+                              cwd=self.build_path, env=env, capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        total = 0
+        modules = set()
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            modules.add(name.strip())
+            # top-level imports only (nested ones are part of their cumulative time)
+            if not name.startswith('  '):
+                total += int(cumulative)
+        return total / 1000, modules, proc.stdout
+
+    def assertNotImported(self, modules: set[str], forbidden: tuple[str]):
+        for name in forbidden:
+            imported = [m for m in modules if m == name or m.startswith(f'{name}.')]
+            self.assertEqual(imported, [], f'{name} should not be imported')
+
+    async def test_help(self):
+        self.build_path.mkdir(exist_ok=True, parents=True)
+        total, modules, out = self.importtime('--help')
+        self.assertIn('Usage:', out)
+        self.assertNotImported(modules, self.help_forbidden)
+        self.assertLess(total, self.help_budget)
+
+    async def test_noop_build(self):
+        async with self.section("build", clean=True) as make:
+            await make.build()
+
+        total, modules, _ = self.importtime('build', '-B', str(self.build_path), '--no-status')
+        self.assertNotImported(modules, self.noop_build_forbidden)
+        self.assertLess(total, self.noop_build_budget)